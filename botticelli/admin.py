@@ -1,8 +1,13 @@
 from django.contrib import admin
 
-from botticelli.models import Game, Question, Stump, State
+from botticelli.models import Game, Question, Stump, State, ArchivedGame, PlayerStats, Installation, \
+    GameEvent
 
 # Register your models here.
 admin.site.register(Game)
 admin.site.register(Question)
 admin.site.register(Stump)
+admin.site.register(ArchivedGame)
+admin.site.register(PlayerStats)
+admin.site.register(Installation)
+admin.site.register(GameEvent)
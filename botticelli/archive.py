@@ -0,0 +1,174 @@
+"""
+Moves finished games out of the hot tables.
+
+Done and Cancelled games older than a cutoff are copied, with their stumps
+and questions, into ArchivedGame rows holding compressed JSON, and then
+deleted. Each batch is its own short transaction and skips games another
+archiver has locked. finished_games() reads live and archived games alike,
+for stats.
+"""
+
+import json
+import time
+import zlib
+import logging
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from botticelli.models import ArchivedGame, Game, Question, Stump, State
+
+logger = logging.getLogger('botticelli')
+
+FINISHED = (State.Done, State.Cancelled)
+
+def turn_dict(turn):
+    return {
+        'id': turn.id,
+        'creator': turn.creator,
+        'text': turn.text,
+        'answer': turn.answer,
+        'thread_ts': turn.thread_ts,
+        'date_created': turn.date_created,
+    }
+
+def pack(game, stumps, questions):
+    data = {
+        'transcript': game.transcript,
+        'stumps': [turn_dict(s) for s in stumps],
+        'questions': [turn_dict(q) for q in questions],
+    }
+    return zlib.compress(json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8'))
+
+def unpack(data):
+    data = json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+    for turn in data['stumps'] + data['questions']:
+        turn['date_created'] = parse_datetime(turn['date_created'])
+    return data
+
+def children(model, game_ids):
+    by_game = {}
+    for turn in model.objects.filter(game_id__in=game_ids).order_by('id'):
+        by_game.setdefault(turn.game_id, []).append(turn)
+    return by_game
+
+def raw_delete(model, column, ids):
+    # The model signals would cost a query per row, and there is no active
+    # game to invalidate
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE %s IN %%s' % (model._meta.db_table, column),
+                       [tuple(ids)])
+
+def archive_batch(cutoff, batch_size=100):
+    """Archive up to batch_size games finished before cutoff, returns how many"""
+    with transaction.atomic():
+        games = list(Game.objects
+                     .filter(state__in=FINISHED, date_updated__lt=cutoff)
+                     .order_by('id')
+                     .select_for_update(skip_locked=True)[:batch_size])
+        if not games:
+            return 0
+
+        ids = [game.id for game in games]
+        stumps = children(Stump, ids)
+        questions = children(Question, ids)
+
+        ArchivedGame.objects.bulk_create([
+            ArchivedGame(id=game.id,
+                         creator=game.creator,
+                         letter=game.letter,
+                         person=game.person,
+                         channel=game.channel,
+                         state=game.state,
+                         date_updated=game.date_updated,
+                         date_created=game.date_created,
+                         data=pack(game, stumps.get(game.id, []), questions.get(game.id, [])))
+            for game in games])
+
+        raw_delete(Question, 'game_id', ids)
+        raw_delete(Stump, 'game_id', ids)
+        raw_delete(Game, 'id', ids)
+    return len(games)
+
+def archive(days, batch_size=100, pause=0):
+    """
+    Archive every game finished more than `days` ago, batch by batch,
+    sleeping `pause` seconds between batches to leave room for requests
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        time.sleep(pause)
+    if total:
+        logger.info('Archived %d games finished before %s', total, cutoff)
+    return total
+
+class FinishedGame(object):
+    """A finished game, live or archived. Turns are dicts, see turn_dict()"""
+    def __init__(self, game, stumps, questions, transcript, archived):
+        self.id = game.id
+        self.creator = game.creator
+        self.letter = game.letter
+        self.person = game.person
+        self.channel = game.channel
+        self.state = game.state
+        self.date_updated = game.date_updated
+        self.date_created = game.date_created
+        self.stumps = stumps
+        self.questions = questions
+        self.transcript = transcript
+        self.archived = archived
+
+    @staticmethod
+    def from_archive(archived):
+        data = unpack(archived.data)
+        return FinishedGame(archived, data['stumps'], data['questions'],
+                            data['transcript'], True)
+
+def finished_games(batch_size=500, **filters):
+    """
+    Every finished game matching filters (channel=..., creator=...), the
+    live ones first, then the archived ones. Reads in batches of
+    batch_size so memory stays flat.
+    """
+    live = Game.objects.filter(state__in=FINISHED, **filters).order_by('id')
+    last = 0
+    while True:
+        games = list(live.filter(id__gt=last)[:batch_size])
+        if not games:
+            break
+        ids = [game.id for game in games]
+        stumps = children(Stump, ids)
+        questions = children(Question, ids)
+        for game in games:
+            yield FinishedGame(game,
+                               [turn_dict(s) for s in stumps.get(game.id, [])],
+                               [turn_dict(q) for q in questions.get(game.id, [])],
+                               game.transcript, False)
+        last = ids[-1]
+
+    for game in archived_games(batch_size, **filters):
+        yield game
+
+def archived_games(batch_size=500, **filters):
+    """Every archived game matching filters, unpacked"""
+    archived = ArchivedGame.objects.filter(**filters).order_by('id')
+    last = 0
+    while True:
+        rows = list(archived.filter(id__gt=last)[:batch_size])
+        if not rows:
+            break
+        for row in rows:
+            yield FinishedGame.from_archive(row)
+        last = rows[-1].id
+
+def get_finished_game(game_id):
+    """A finished game by id, wherever it lives, or None"""
+    return next(finished_games(id=game_id), None)
@@ -0,0 +1,5 @@
+"""
+Load test and latency benchmark for the Slack endpoints.
+
+Run it with `manage.py bench`. See botticelli.bench.runner.
+"""
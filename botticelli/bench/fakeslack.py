@@ -0,0 +1,68 @@
+"""A local stand-in for the Slack Web API and response_url endpoints"""
+
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+class FakeSlackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+
+        if self.path.startswith('/api/'):
+            body = self.server.api_call(self.path[len('/api/'):])
+        else:
+            body = self.server.respond()
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeSlack(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        HTTPServer.__init__(self, (host, port), FakeSlackHandler)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.ts = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.server_address
+
+    def api_call(self, method):
+        with self.lock:
+            self.calls[method] += 1
+            self.ts += 1
+            return {'ok': True, 'ts': '%d.000100' % self.ts}
+
+    def respond(self):
+        with self.lock:
+            self.calls['response_url'] += 1
+        return {'ok': True}
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-slack')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
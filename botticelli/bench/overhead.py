@@ -0,0 +1,72 @@
+"""
+Per-request cost of dispatching to a Slack view.
+
+Posts a slash command with no response_url, which the view answers with a
+400 before touching the database or Slack, so what is left is building
+the request, the middleware, the signature check and parsing the form:
+once through Django's full handler and once through botticelli.fastpath.
+"""
+
+import io
+import time
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+from botticelli import signing
+from botticelli.fastpath import FastPath
+
+def environ(body, secret):
+    timestamp = str(int(time.time()))
+    env = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/slack/slash',
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': 'http',
+    }
+    if secret:
+        env['HTTP_X_SLACK_REQUEST_TIMESTAMP'] = timestamp
+        env['HTTP_X_SLACK_SIGNATURE'] = signing.signature(secret, timestamp, body)
+    return env
+
+def time_requests(application, requests, secret):
+    body = urlencode({'team_id': 'TBENCH', 'channel_id': 'COVERHEAD', 'user_name': 'bench',
+                      'command': '/botticelli', 'text': 'status'}).encode('utf-8')
+    statuses = []
+    start_response = lambda status, headers, exc_info=None: statuses.append(status)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = application(environ(body, secret), start_response)
+        response.close()
+    seconds = time.perf_counter() - start
+
+    if not statuses[-1].startswith('400'):
+        raise ValueError('Expected a 400 from the view, got %s' % statuses[-1])
+    return seconds / requests
+
+def measure(requests=2000):
+    """Microseconds per request through Django's handler and the fast path"""
+    secret = settings.SLACK_SIGNING_SECRET
+    django_handler = WSGIHandler()
+    fast_path = FastPath(django_handler)
+
+    # Every request would log its payload, the same for both
+    calls = logging.getLogger('botticelli.calls')
+    calls.disabled = True
+    try:
+        # Warm both, the first request loads the URLconf
+        time_requests(django_handler, 10, secret)
+        time_requests(fast_path, 10, secret)
+        return {'django_us': time_requests(django_handler, requests, secret) * 1e6,
+                'fast_path_us': time_requests(fast_path, requests, secret) * 1e6}
+    finally:
+        calls.disabled = False
@@ -0,0 +1,90 @@
+"""Replayable streams of Slack slash commands and button clicks"""
+
+import json
+import random
+
+PEOPLE = ['Mike Tyson', 'Ada Lovelace', 'Alan Turing', 'Grace Hopper',
+          'Sandro Botticelli', 'Marie Curie', 'Frida Kahlo', 'Nikola Tesla']
+
+TEAM = 'TBENCH'
+
+WORDS = ['are', 'you', 'a', 'famous', 'dead', 'american', 'scientist', 'painter',
+         'boxer', 'woman', 'from', 'europe', 'alive', 'author', 'inventor']
+
+def sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) + '?'
+
+def game_script(rng, channel, users, turns):
+    """
+    One game in one channel as a list of steps. Button clicks don't know
+    their stump or question id yet, the runner fills it in when replaying.
+    """
+    creator = users[0]
+    players = users[1:]
+    steps = [('slash', channel, creator, 'start ' + rng.choice(PEOPLE))]
+
+    stumped = False
+    for _ in range(turns):
+        player = rng.choice(players)
+        if rng.random() < 0.15:
+            steps.append(('slash', channel, rng.choice(users), 'status'))
+
+        if not stumped:
+            steps.append(('slash', channel, player, 'stump ' + sentence(rng)))
+            stumped = rng.random() < 0.6
+            steps.append(('action', channel, creator, 'stump', 'yes' if stumped else 'no'))
+        else:
+            steps.append(('slash', channel, player, 'ask ' + sentence(rng)))
+            stumped = rng.random() < 0.7
+            steps.append(('action', channel, creator, 'question', 'yes' if stumped else 'no'))
+
+    steps.append(('slash', channel, creator, 'cancel game'))
+    return steps
+
+def generate(seed=0, channels=20, turns=10, users_per_channel=4):
+    """A stream per channel, keyed by channel id"""
+    rng = random.Random(seed)
+    streams = {}
+    for i in range(channels):
+        channel = 'CB%05d' % i
+        users = ['user%d_%d' % (i, u) for u in range(users_per_channel)]
+        streams[channel] = game_script(rng, channel, users, turns)
+    return streams
+
+def save(streams, path):
+    with open(path, 'w') as f:
+        for channel in sorted(streams):
+            for step in streams[channel]:
+                f.write(json.dumps(step) + '\n')
+
+def load(path):
+    streams = {}
+    with open(path) as f:
+        for line in f:
+            step = tuple(json.loads(line))
+            streams.setdefault(step[1], []).append(step)
+    return streams
+
+def slash_form(channel, user, text, response_url):
+    return {
+        'token': 'bench',
+        'team_id': TEAM,
+        'channel_id': channel,
+        'user_name': user,
+        'command': '/botticelli',
+        'text': text,
+        'response_url': response_url,
+    }
+
+def action_form(channel, user, type, id, value, response_url):
+    payload = {
+        'type': 'interactive_message',
+        'callback_id': json.dumps({'type': type, 'id': id}),
+        'actions': [{'name': value, 'type': 'button', 'value': value}],
+        'team': {'id': TEAM},
+        'channel': {'id': channel},
+        'user': {'name': user},
+        'original_message': {'text': 'bench message'},
+        'response_url': response_url,
+    }
+    return {'payload': json.dumps(payload)}
@@ -0,0 +1,201 @@
+"""
+Replays payload streams against the Slack views and measures them.
+
+Each channel's steps run in order, like real users taking turns, while
+`concurrency` channels are replayed at once. Requests go through the
+Django test client, so they see the full URL and middleware stack.
+Outbound calls go to a FakeSlack server, which counts them.
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from botticelli import signing
+from botticelli.bench import payloads
+from botticelli.models import Game, State
+from botticelli.slack import parse_slash_command
+
+logger = logging.getLogger('botticelli')
+
+class Sample(object):
+    def __init__(self, endpoint, action, seconds, queries, status):
+        self.endpoint = endpoint
+        self.action = action
+        self.seconds = seconds
+        self.queries = queries
+        self.status = status
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+class Runner(object):
+    def __init__(self, streams, fake_slack, concurrency=8, path_prefix='/slack/'):
+        self.streams = streams
+        self.fake_slack = fake_slack
+        self.concurrency = concurrency
+        self.path_prefix = path_prefix
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def run(self):
+        channels = sorted(self.streams)
+        started = time.time()
+
+        threads = []
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self.worker, args=(channels[i::self.concurrency],))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        return Report(self.samples, time.time() - started, self.fake_slack.total_calls())
+
+    def worker(self, channels):
+        client = Client()
+        try:
+            for channel in channels:
+                for step in self.streams[channel]:
+                    sample = self.replay(client, step)
+                    if sample:
+                        with self.lock:
+                            self.samples.append(sample)
+        finally:
+            connections.close_all()
+
+    def replay(self, client, step):
+        response_url = self.fake_slack.url + 'response'
+        if step[0] == 'slash':
+            _, channel, user, text = step
+            endpoint, action = 'slash', parse_slash_command(text)[0]
+            form = payloads.slash_form(channel, user, text, response_url)
+        else:
+            _, channel, user, action, value = step
+            endpoint = 'action'
+            turn_id = self.pending_turn(channel, action)
+            if turn_id is None:
+                return None
+            form = payloads.action_form(channel, user, action, turn_id, value, response_url)
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            try:
+                status = self.post(client, self.path_prefix + endpoint, form).status_code
+            except Exception:
+                logger.exception('%s %s failed', endpoint, action)
+                status = 500
+            seconds = time.perf_counter() - start
+
+        if settings.BOTTICELLI_DEFERRED:
+            from botticelli.executor import get_executor
+            get_executor().wait(channel)
+
+        return Sample(endpoint, action, seconds, len(queries), status)
+
+    def post(self, client, path, form):
+        # Signed like Slack signs it, over the urlencoded body
+        body = urlencode(form)
+        headers = {}
+        secret = settings.SLACK_SIGNING_SECRET
+        if secret:
+            timestamp = str(int(time.time()))
+            headers['HTTP_X_SLACK_REQUEST_TIMESTAMP'] = timestamp
+            headers['HTTP_X_SLACK_SIGNATURE'] = signing.signature(secret, timestamp,
+                                                                  body.encode('utf-8'))
+        return client.post(path, body, content_type='application/x-www-form-urlencoded',
+                           **headers)
+
+    def pending_turn(self, channel, type):
+        game = Game.objects.filter(channel=channel) \
+            .exclude(state__in=(State.Done, State.Cancelled)).first()
+        if game is None:
+            return None
+        return game.pending_stump_id if type == 'stump' else game.pending_question_id
+
+class Report(object):
+    def __init__(self, samples, seconds, outbound_calls):
+        self.samples = samples
+        self.seconds = seconds
+        self.outbound_calls = outbound_calls
+
+    def summary(self):
+        groups = defaultdict(list)
+        for sample in self.samples:
+            groups['%s %s' % (sample.endpoint, sample.action)].append(sample)
+            groups['all'].append(sample)
+
+        summary = {}
+        for name, samples in groups.items():
+            latencies = [s.seconds * 1000 for s in samples]
+            summary[name] = {
+                'requests': len(samples),
+                'errors': len([s for s in samples if s.status >= 400]),
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'queries_per_request': round(sum(s.queries for s in samples) / float(len(samples)), 3),
+            }
+
+        total = len(self.samples) or 1
+        summary['all']['throughput_rps'] = round(len(self.samples) / self.seconds, 1)
+        summary['all']['outbound_per_request'] = round(self.outbound_calls / float(total), 3)
+        return summary
+
+    def format(self):
+        summary = self.summary()
+        lines = ['%-20s %8s %6s %9s %9s %9s %8s' % (
+            'endpoint', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'queries')]
+        for name in sorted(summary):
+            row = summary[name]
+            lines.append('%-20s %8d %6d %9.2f %9.2f %9.2f %8.2f' % (
+                name, row['requests'], row['errors'], row['p50_ms'],
+                row['p95_ms'], row['p99_ms'], row['queries_per_request']))
+        lines.append('throughput %.1f req/s, %.2f outbound calls per request' % (
+            summary['all']['throughput_rps'], summary['all']['outbound_per_request']))
+        return '\n'.join(lines)
+
+def load_baselines(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except IOError:
+        return {}
+
+def save_baselines(path, baselines):
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def regressions(summary, baseline, tolerance):
+    """Ways the run is worse than the stored baseline"""
+    problems = []
+    for name, base in baseline.items():
+        row = summary.get(name)
+        if row is None:
+            continue
+        if row['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            problems.append('%s: p95 %.2fms over baseline %.2fms'
+                            % (name, row['p95_ms'], base['p95_ms']))
+        if row['queries_per_request'] > base['queries_per_request'] + 0.01:
+            problems.append('%s: %.2f queries per request, baseline %.2f'
+                            % (name, row['queries_per_request'], base['queries_per_request']))
+        if 'outbound_per_request' in base and \
+                row['outbound_per_request'] > base['outbound_per_request'] + 0.01:
+            problems.append('%s: %.2f outbound calls per request, baseline %.2f'
+                            % (name, row['outbound_per_request'], base['outbound_per_request']))
+        if row['errors'] > base.get('errors', 0):
+            problems.append('%s: %d errors' % (name, row['errors']))
+    return problems
@@ -0,0 +1,117 @@
+"""
+Measures how long a fresh web process takes to answer its first request.
+
+Each run starts a new interpreter (`python -m botticelli.bench.startup`)
+that loads the app one of two ways and then handles one slash command,
+whose reply goes to a FakeSlack server:
+
+- lazy: get_wsgi_application() only, like `manage.py runserver`; the
+  URLconf, handlers and HTTP client load during the first request
+- preload: botticelli.wsgi, which loads them up front, like a gunicorn
+  master with preload_app before it forks
+
+Only the standard library is imported before the clock starts, so the
+numbers include importing Django itself.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import subprocess
+from urllib.parse import urlencode
+
+CONFIGS = (
+    ('full', 'lazy'),
+    ('full', 'preload'),
+    ('webhook', 'lazy'),
+    ('webhook', 'preload'),
+)
+
+def first_request(application, response_url):
+    body = urlencode({'team_id': 'TBENCH', 'channel_id': 'CSTARTUP', 'user_name': 'bench',
+                      'command': '/botticelli', 'text': 'help',
+                      'response_url': response_url}).encode('utf-8')
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/slack/slash',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    from wsgiref.util import setup_testing_defaults
+    setup_testing_defaults(environ)
+    secret = os.environ.get('SLACK_SIGNING_SECRET')
+    if secret:
+        from botticelli import signing
+        timestamp = str(int(time.time()))
+        environ['HTTP_X_SLACK_REQUEST_TIMESTAMP'] = timestamp
+        environ['HTTP_X_SLACK_SIGNATURE'] = signing.signature(secret, timestamp, body)
+
+    statuses = []
+    result = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(result)
+    return statuses[0]
+
+def child(mode, response_url):
+    spawned = float(os.environ['BOTTICELLI_STARTUP_SPAWNED'])
+    started = time.time()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'botticelli.settings')
+    if mode == 'preload':
+        from botticelli.wsgi import application
+    else:
+        from django.core.wsgi import get_wsgi_application
+        application = get_wsgi_application()
+    ready = time.time()
+    status = first_request(application, response_url)
+    done = time.time()
+
+    print(json.dumps({'interpreter_ms': (started - spawned) * 1000,
+                      'load_ms': (ready - started) * 1000,
+                      'first_request_ms': (done - ready) * 1000,
+                      'status': status}))
+
+def database_url(db):
+    from urllib.parse import quote
+
+    return 'postgres://%s:%s@%s:%s/%s' % (quote(db['USER'] or ''), quote(db['PASSWORD'] or ''),
+                                          db['HOST'] or '', db['PORT'] or '', db['NAME'])
+
+def run(profile, mode, response_url, env):
+    env = dict(os.environ, BOTTICELLI_PROFILE=profile, BOTTICELLI_LOG_LEVEL='ERROR',
+               BOTTICELLI_STARTUP_SPAWNED=repr(time.time()), **env)
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'botticelli.bench.startup', mode, response_url], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+def measure(runs, response_url, env, configs=CONFIGS):
+    """
+    Median timings for each (profile, mode) over `runs` fresh processes,
+    started with `env` added to this process's environment
+    """
+    from botticelli.bench.runner import percentile
+
+    results = {}
+    for profile, mode in configs:
+        samples = [run(profile, mode, response_url, env) for _ in range(runs)]
+        row = {key: round(percentile([s[key] for s in samples], 50), 1)
+               for key in ('interpreter_ms', 'load_ms', 'first_request_ms')}
+        row['cold_ms'] = round(percentile([s['interpreter_ms'] + s['load_ms'] +
+                                           s['first_request_ms'] for s in samples], 50), 1)
+        row['status'] = samples[-1]['status']
+        results['%s %s' % (profile, mode)] = row
+    return results
+
+def format_results(results):
+    lines = ['%-18s %14s %9s %12s %9s' % ('profile', 'interpreter ms', 'load ms',
+                                          'first req ms', 'cold ms')]
+    for name in sorted(results):
+        row = results[name]
+        lines.append('%-18s %14.1f %9.1f %12.1f %9.1f' % (
+            name, row['interpreter_ms'], row['load_ms'], row['first_request_ms'],
+            row['cold_ms']))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    child(sys.argv[1], sys.argv[2])
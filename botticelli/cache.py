@@ -0,0 +1,162 @@
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from django.db import transaction
+
+logger = logging.getLogger('botticelli')
+
+class ChannelCache(object):
+    """
+    Per-process LRU cache of objects keyed by channel id.
+
+    Entries expire after `ttl` seconds and are dropped by invalidate(),
+    which the model signal handlers call on every write. Each channel has
+    a generation number that invalidate() bumps; a value loaded from the
+    database is only stored if the generation didn't change while it was
+    being loaded, so a racing write can't leave a stale entry behind.
+
+    If `shared` is a Django cache, the generation lives there too, so a
+    write in one worker process invalidates every other worker's copy at
+    the cost of one cache lookup per hit.
+    """
+    def __init__(self, size=256, ttl=30, shared=None):
+        self.size = size
+        self.ttl = ttl
+        self.shared = shared
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def _shared_key(self, channel):
+        return 'botticelli:channel:%s' % channel
+
+    def _generation(self, channel):
+        local = self.generations.get(channel, 0)
+        if self.shared is None:
+            return local
+        return (local, self.shared.get(self._shared_key(channel), 0))
+
+    def get_or_load(self, channel, load, store=True):
+        """
+        Return a private copy of the cached value, loading it on a miss and
+        keeping what was loaded unless store is False
+        """
+        if self.size <= 0:
+            return load(channel)
+
+        generation = self._generation(channel)
+        with self.lock:
+            entry = self.entries.get(channel)
+            if entry is not None:
+                expires, entry_generation, value = entry
+                if expires > time.time() and entry_generation == generation:
+                    self.entries.move_to_end(channel)
+                    return copy.deepcopy(value)
+                del self.entries[channel]
+
+        value = load(channel)
+
+        if not store or self._generation(channel) != generation:
+            return value
+
+        with self.lock:
+            if channel not in self.entries:
+                self.entries[channel] = (time.time() + self.ttl, generation, value)
+                self.entries.move_to_end(channel)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+
+        return copy.deepcopy(value)
+
+    def invalidate(self, channel):
+        with self.lock:
+            self.entries.pop(channel, None)
+            self.generations[channel] = self.generations.get(channel, 0) + 1
+
+        if self.shared is not None:
+            key = self._shared_key(channel)
+            try:
+                self.shared.incr(key)
+            except ValueError:
+                self.shared.add(key, 1, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+
+class OwnedChannels(object):
+    """
+    Values held in memory by the one worker thread that owns their
+    channels, see botticelli.engine. Only that thread touches it, so values
+    are handed out without copies or locks. An entry is used only while
+    the channel's generation in `cache` is the one it was stored with, so
+    a write anywhere else still forces a reload.
+    """
+    def __init__(self, cache, size=256, ttl=30):
+        self.cache = cache
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get_or_load(self, channel, load, store=True):
+        generation = self.cache._generation(channel)
+        entry = self.entries.get(channel)
+        if entry is not None:
+            expires, entry_generation, value = entry
+            if expires > time.time() and entry_generation == generation:
+                self.entries.move_to_end(channel)
+                return value
+
+        value = self.cache.get_or_load(channel, load, store)
+        if store:
+            self._store(channel, generation, value)
+        return value
+
+    def adopt(self, channel, value):
+        """
+        Keep `value`, changed by our own write, as the channel's state once
+        the write commits, rather than reloading it
+        """
+        transaction.on_commit(
+            lambda: self._store(channel, self.cache._generation(channel), value))
+
+    def _store(self, channel, generation, value):
+        self.entries[channel] = (time.time() + self.ttl, generation, value)
+        self.entries.move_to_end(channel)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def evict(self, channel):
+        self.entries.pop(channel, None)
+
+    def clear(self):
+        self.entries.clear()
+
+_owned = threading.local()
+
+def owned_channels():
+    """The OwnedChannels of the engine worker running on this thread, if any"""
+    return getattr(_owned, 'table', None)
+
+def set_owned_channels(table):
+    _owned.table = table
+
+_active_games = None
+_active_games_lock = threading.Lock()
+
+def get_active_games():
+    global _active_games
+    from django.conf import settings
+    from django.core.cache import caches
+
+    with _active_games_lock:
+        if _active_games is None:
+            backend = settings.BOTTICELLI_GAME_CACHE_BACKEND
+            _active_games = ChannelCache(size=settings.BOTTICELLI_GAME_CACHE_SIZE,
+                                         ttl=settings.BOTTICELLI_GAME_CACHE_TTL,
+                                         shared=caches[backend] if backend else None)
+        return _active_games
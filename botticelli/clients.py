@@ -0,0 +1,90 @@
+"""
+Slack clients for the workspaces Botticelli is installed in.
+
+Requests are routed by the team_id in the Slack payload. Each workspace
+gets its own Slack client, with its token, its own HTTP connection pool
+and its own rate limiter, built the first time the team is seen and kept
+in a bounded LRU pool. A team with no Installation row falls back to
+SLACK_OATH_TOKEN, so a single-workspace deployment needs no setup.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from botticelli.models import Installation
+from botticelli.slack import Slack
+from botticelli.transport import new_transport
+
+def token_for(team_id):
+    installation = Installation.objects.filter(team_id=team_id).first()
+    if installation is not None:
+        return installation.bot_token
+    return settings.SLACK_OATH_TOKEN
+
+class ClientPool(object):
+    def __init__(self, size=32, ttl=300, use_outbox=None, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.use_outbox = use_outbox
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, team_id):
+        """The team's client, or None if Botticelli isn't installed there"""
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(team_id)
+            if entry is not None:
+                self.entries.move_to_end(team_id)
+                if entry[0] > now:
+                    return entry[1]
+
+        # Load outside the lock so one slow query doesn't stall every team
+        token = token_for(team_id)
+        if not token:
+            self.invalidate(team_id)
+            return None
+
+        with self.lock:
+            entry = self.entries.get(team_id)
+            if entry is not None and entry[1].token == token:
+                # Same token, keep the client and its connections and limits
+                client = entry[1]
+            else:
+                client = Slack(token, new_transport(), self.use_outbox, team_id)
+            self.entries[team_id] = (now + self.ttl, client)
+            self.entries.move_to_end(team_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            return client
+
+    def invalidate(self, team_id):
+        with self.lock:
+            self.entries.pop(team_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_clients = None
+_clients_lock = threading.Lock()
+
+def get_clients():
+    global _clients
+
+    with _clients_lock:
+        if _clients is None:
+            _clients = ClientPool(size=settings.SLACK_CLIENT_POOL_SIZE,
+                                  ttl=settings.SLACK_CLIENT_TTL)
+        return _clients
+
+@receiver(post_save, sender=Installation)
+@receiver(post_delete, sender=Installation)
+def installation_changed(sender, instance, **kwargs):
+    get_clients().invalidate(instance.team_id)
@@ -0,0 +1,14 @@
+"""
+PostgreSQL backend with connection reuse, ENGINE 'botticelli.db'.
+
+settings.DATABASES[alias]['POOL']['MODE'] picks how connections are kept:
+
+- 'persistent': each thread keeps its connection between requests for
+  CONN_MAX_AGE seconds, and pings it first if it sat idle for more than
+  CHECK_AFTER seconds
+- 'pool': a thread borrows a connection from a ConnectionPool shared by
+  the process for as long as Django would keep it open, a request or a
+  deferred batch, and closing it gives it back to the pool
+
+See BOTTICELLI_DB_POOL in settings.
+"""
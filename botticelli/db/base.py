@@ -0,0 +1,89 @@
+import time
+
+from django.db.backends.postgresql import base, creation
+
+from botticelli.db.pool import ConnectionPool, close_pools, get_pool
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the database from being dropped
+        close_pools(test_database_name)
+        super(DatabaseCreation, self)._destroy_test_db(test_database_name, verbosity)
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.last_used = None
+
+    @property
+    def pool_settings(self):
+        return self.settings_dict.get('POOL') or {}
+
+    def _pool(self, conn_params):
+        options = self.pool_settings
+
+        def create():
+            return ConnectionPool(
+                connect=lambda: base.Database.connect(**conn_params),
+                check=ping,
+                min_size=options.get('MIN_SIZE', 1),
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 5),
+                max_lifetime=options.get('MAX_LIFETIME', 600),
+                check_after=options.get('CHECK_AFTER', 30))
+        return get_pool(self.alias, self.settings_dict['NAME'], create)
+
+    def get_new_connection(self, conn_params):
+        if self.pool_settings.get('MODE') != 'pool':
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        connection = self._pool(conn_params).get()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool_settings.get('MODE') != 'pool':
+            return super(DatabaseWrapper, self)._close()
+
+        connection = self.connection
+        usable = not connection.closed
+        if usable and connection.get_transaction_status() != \
+                base.Database.extensions.TRANSACTION_STATUS_IDLE:
+            # Closed inside a transaction, don't hand it on half done
+            try:
+                connection.rollback()
+            except base.Database.Error:
+                usable = False
+        if usable and self.errors_occurred:
+            usable = ping(connection)
+        self._pool(self.get_connection_params()).put(connection, usable)
+
+    def close_if_unusable_or_obsolete(self):
+        super(DatabaseWrapper, self).close_if_unusable_or_obsolete()
+        if self.connection is None or self.pool_settings.get('MODE') != 'persistent':
+            return
+
+        # Called as each request starts and ends, so this is idle time
+        now = time.time()
+        check_after = self.pool_settings.get('CHECK_AFTER', 30)
+        if self.last_used is not None and now - self.last_used >= check_after \
+                and not self.is_usable():
+            self.close()
+        self.last_used = now
+
+def ping(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            # Django sets autocommit on the next borrower, which psycopg2
+            # refuses inside a transaction
+            connection.rollback()
+        return True
+    except base.Database.Error:
+        return False
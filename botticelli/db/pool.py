@@ -0,0 +1,179 @@
+"""
+A bounded pool of database connections shared by a process's threads.
+
+get() hands out an idle connection, most recently used first, or opens a
+new one while fewer than `max_size` are open, or waits up to `timeout`
+seconds for one to come back and then raises PoolTimeout. Connections
+older than `max_lifetime` are closed instead of reused, and one that sat
+idle for more than `check_after` seconds is pinged before it is handed
+out, so a connection the server or a proxy dropped is replaced rather
+than failing the request.
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger('botticelli')
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool(object):
+    def __init__(self, connect, check, min_size=1, max_size=10, timeout=5,
+                 max_lifetime=600, check_after=30, clock=time.time):
+        self.connect = connect
+        self.check = check
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.clock = clock
+        self.cond = threading.Condition()
+        # (connection, opened, last used), the most recently used last
+        self.idle = []
+        self.opened_at = {}
+        self.size = 0
+        self.stats = {'opened': 0, 'closed': 0, 'waits': 0, 'timeouts': 0,
+                      'failed_checks': 0, 'wait_seconds': 0.0}
+
+    def warm(self):
+        """Open connections until min_size are idle"""
+        while True:
+            with self.cond:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            self.put(self._open())
+
+    def get(self):
+        deadline = self.clock() + self.timeout
+        waited = False
+        while True:
+            with self.cond:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout('No database connection free after %ss' % self.timeout)
+                    if not waited:
+                        waited = True
+                        self.stats['waits'] += 1
+                        wait_start = self.clock()
+                    self.cond.wait(remaining)
+                if waited:
+                    self.stats['wait_seconds'] += self.clock() - wait_start
+                    waited = False
+                if self.idle:
+                    conn, opened, used = self.idle.pop()
+                else:
+                    conn = None
+                    self.size += 1
+
+            if conn is None:
+                return self._open()
+            now = self.clock()
+            if now - opened >= self.max_lifetime:
+                self._discard(conn)
+                continue
+            if now - used >= self.check_after and not self.check(conn):
+                self.stats['failed_checks'] += 1
+                self._discard(conn)
+                continue
+            return conn
+
+    def put(self, conn, usable=True):
+        """Give a connection back, closing it if it is broken or too old"""
+        opened = self.opened_at.get(conn)
+        now = self.clock()
+        if not usable or opened is None or conn.closed or now - opened >= self.max_lifetime:
+            self._discard(conn)
+            return
+        with self.cond:
+            self.idle.append((conn, opened, now))
+            self.cond.notify()
+
+    def _open(self):
+        try:
+            conn = self.connect()
+        except Exception:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+        with self.cond:
+            self.opened_at[conn] = self.clock()
+            self.stats['opened'] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            logger.exception('Closing a pooled database connection failed')
+        with self.cond:
+            self.opened_at.pop(conn, None)
+            self.size -= 1
+            self.stats['closed'] += 1
+            self.cond.notify()
+
+    def close(self):
+        """Close every idle connection, the ones in use close when put back"""
+        with self.cond:
+            idle, self.idle = self.idle, []
+            self.max_lifetime = 0
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def snapshot(self):
+        with self.cond:
+            return dict(self.stats, size=self.size, idle=len(self.idle))
+
+# Pools by (process, alias, database name); a forked child must not use
+# its parent's connections
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(alias, name, create):
+    key = (os.getpid(), alias, name)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = create()
+            created = True
+        else:
+            created = False
+    if created:
+        pool.warm()
+    return pool
+
+def close_pools(name=None):
+    """Close the pools for database `name`, or all of them"""
+    with _pools_lock:
+        keys = [key for key in _pools if name is None or key[2] == name]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+def collect():
+    """Pool numbers for botticelli.metrics, by alias"""
+    from botticelli.metrics import labels
+
+    values = {}
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key[1], pool) for key, pool in _pools.items() if key[0] == pid]
+    for alias, pool in pools:
+        stats = pool.snapshot()
+        in_use = stats['size'] - stats['idle']
+        for state, count in (('idle', stats['idle']), ('in_use', in_use)):
+            key = ('botticelli_db_pool_connections', labels(alias=alias, state=state))
+            values[key] = values.get(key, 0) + count
+        for name in ('opened', 'closed', 'waits', 'timeouts', 'failed_checks'):
+            key = ('botticelli_db_pool_%s_total' % name, labels(alias=alias))
+            values[key] = values.get(key, 0) + stats[name]
+        key = ('botticelli_db_pool_wait_seconds_total', labels(alias=alias))
+        values[key] = values.get(key, 0) + stats['wait_seconds']
+    return values
@@ -0,0 +1,55 @@
+"""
+Optional channel-affine engine for deferred Slack handling.
+
+With BOTTICELLI_ENGINE on, every channel belongs to one executor worker,
+picked by consistent hashing (see botticelli.ring). That worker is the
+channel's only writer in the process, so it keeps the channel's live game
+in memory between requests (cache.OwnedChannels) and takes it over after
+its own transitions instead of reloading it. Writes are batched: a worker
+runs the tasks queued for it in one transaction, each in a savepoint, and
+commits once. Replies to Slack go out only after that commit, and Web API
+calls go through the outbox in the same transaction, so nothing is
+acknowledged before it is durable. After a crash the games are simply
+loaded again from the database.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from botticelli.cache import OwnedChannels, get_active_games, set_owned_channels
+
+logger = logging.getLogger('botticelli')
+
+_local = threading.local()
+
+def owned_channels():
+    """This worker's in-memory games, created on first use"""
+    table = getattr(_local, 'table', None)
+    if table is None:
+        table = _local.table = OwnedChannels(get_active_games(),
+                                             size=settings.BOTTICELLI_GAME_CACHE_SIZE,
+                                             ttl=settings.BOTTICELLI_GAME_CACHE_TTL)
+    return table
+
+def run_batch(tasks):
+    """Run a worker's queued tasks with one commit, see the module docstring"""
+    table = owned_channels()
+    set_owned_channels(table)
+    try:
+        with transaction.atomic():
+            for task in tasks:
+                try:
+                    with transaction.atomic():
+                        task.run()
+                except Exception:
+                    logger.exception('Deferred task %s failed', task.func)
+                    table.evict(task.key)
+    except Exception:
+        # The in-memory games may hold changes that were never committed
+        table.clear()
+        raise
+    finally:
+        set_owned_channels(None)
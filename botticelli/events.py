@@ -0,0 +1,205 @@
+"""
+Append-only log of what happened in each game.
+
+Handlers write one GameEvent row per transition, in the transaction that
+makes it. Game, Stump and Question remain the tables requests read, but
+they are projections of the log: Projection replays events into a game's
+state, GameSnapshot rows let replay start from a recent state instead of
+the first event, and rebuild() writes projections back into the tables
+(manage.py replay_events).
+"""
+
+import json
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from botticelli import transcript
+from botticelli.models import ArchivedGame, Game, GameEvent, GameSnapshot, Question, State, \
+    Stump, invalidate_channel
+
+GAME_STARTED = 'game_started'
+STUMP_ASKED = 'stump_asked'
+STUMP_ANSWERED = 'stump_answered'
+QUESTION_ASKED = 'question_asked'
+QUESTION_ANSWERED = 'question_answered'
+CANCELLED = 'cancelled'
+
+def record(game, kind, actor='', **data):
+    return GameEvent.objects.create(game_id=game.id,
+                                    channel=game.channel,
+                                    kind=kind,
+                                    actor=actor,
+                                    data=json.dumps(data))
+
+class Projection(object):
+    """A game's state built by applying its events in order"""
+    def __init__(self, game_id, state=None):
+        self.game_id = game_id
+        self.last_event_id = 0
+        self.game = {}
+        # Turn dicts by id, as strings so the state survives JSON
+        self.stumps = {}
+        self.questions = {}
+        if state is not None:
+            self.__dict__.update(state)
+        # Events applied since the projection was created or loaded
+        self.replayed = 0
+
+    def to_json(self):
+        return json.dumps({'last_event_id': self.last_event_id, 'game': self.game,
+                           'stumps': self.stumps, 'questions': self.questions})
+
+    @staticmethod
+    def from_json(game_id, text):
+        return Projection(game_id, json.loads(text))
+
+    def apply(self, event):
+        data = json.loads(event.data)
+        date = event.date_created.isoformat()
+        game = self.game
+
+        if event.kind == GAME_STARTED:
+            game.update(channel=event.channel, creator=event.actor, person=data['person'],
+                        letter=data['letter'], state=State.Stump, transcript='',
+                        pending_stump=None, pending_question=None, latest_stump=None,
+                        date_created=date)
+        elif event.kind == STUMP_ASKED:
+            self.stumps[str(data['id'])] = {'creator': event.actor, 'text': data['text'],
+                                            'answer': None, 'date_created': date}
+            game.update(state=State.PendingStump, pending_stump=data['id'],
+                        latest_stump=data['id'])
+        elif event.kind == STUMP_ANSWERED:
+            self.stumps[str(data['id'])]['answer'] = data['answer']
+            game.update(state=State.Question if data['answer'] else State.Stump,
+                        pending_stump=None)
+        elif event.kind == QUESTION_ASKED:
+            self.questions[str(data['id'])] = {'creator': event.actor, 'text': data['text'],
+                                               'answer': None, 'date_created': date}
+            game.update(state=State.PendingQuestion, pending_question=data['id'],
+                        transcript=transcript.add_question(game['transcript'], data['text']))
+        elif event.kind == QUESTION_ANSWERED:
+            self.questions[str(data['id'])]['answer'] = data['answer']
+            game.update(state=State.Question if data['answer'] else State.Stump,
+                        pending_question=None,
+                        transcript=transcript.answer_question(game['transcript'], data['answer']))
+        elif event.kind == CANCELLED:
+            target = data['target']
+            if target == 'game':
+                game.update(state=State.Cancelled)
+            elif target == 'stump':
+                self.stumps.pop(str(data['id']), None)
+                game.update(state=State.Stump, pending_stump=None, latest_stump=None)
+            elif target == 'question':
+                self.questions.pop(str(data['id']), None)
+                game.update(state=State.Question, pending_question=None,
+                            transcript=transcript.remove_question(game['transcript']))
+        else:
+            raise ValueError('Unknown event %s' % event.kind)
+
+        game['date_updated'] = date
+        self.last_event_id = event.id
+        self.replayed += 1
+
+    def to_models(self):
+        """Unsaved Game, Stumps and Questions holding the projected state"""
+        def turn(model, id, fields):
+            fields = dict(fields, date_created=parse_datetime(fields['date_created']))
+            return model(id=int(id), game_id=self.game_id, **fields)
+
+        stumps = {int(id): turn(Stump, id, t) for id, t in self.stumps.items()}
+        questions = {int(id): turn(Question, id, t) for id, t in self.questions.items()}
+
+        fields = dict(self.game)
+        fields['date_created'] = parse_datetime(fields['date_created'])
+        fields['date_updated'] = parse_datetime(fields['date_updated'])
+        game = Game(id=self.game_id,
+                    pending_stump=stumps.get(fields.pop('pending_stump')),
+                    pending_question=questions.get(fields.pop('pending_question')),
+                    latest_stump=stumps.get(fields.pop('latest_stump')),
+                    **fields)
+        return game, sorted(stumps.values(), key=lambda t: t.id), \
+            sorted(questions.values(), key=lambda t: t.id)
+
+def load(game_id, use_snapshot=True):
+    """The game's current state: its latest snapshot plus the events after it"""
+    snapshot = None
+    if use_snapshot:
+        snapshot = GameSnapshot.objects.filter(game_id=game_id) \
+            .order_by('-last_event_id').first()
+    if snapshot is not None:
+        projection = Projection.from_json(game_id, snapshot.state)
+    else:
+        projection = Projection(game_id)
+
+    events = GameEvent.objects.filter(game_id=game_id, id__gt=projection.last_event_id) \
+        .order_by('id')
+    for event in events.iterator():
+        projection.apply(event)
+    return projection
+
+def snapshot(game_id, min_events=1):
+    """
+    Store the game's current state if at least min_events happened since
+    its last snapshot. Returns the snapshot, or None.
+    """
+    projection = load(game_id)
+    if not projection.replayed or projection.replayed < min_events:
+        return None
+    return GameSnapshot.objects.create(game_id=game_id,
+                                       last_event_id=projection.last_event_id,
+                                       state=projection.to_json())
+
+def snapshot_active(min_events=1):
+    """Snapshot every unfinished game, returns how many were stored"""
+    ids = Game.objects.exclude(state__in=(State.Done, State.Cancelled)) \
+        .values_list('id', flat=True)
+    return sum(1 for id in list(ids) if snapshot(id, min_events) is not None)
+
+def game_ids():
+    """Every game in the log that has not been archived"""
+    ids = set(GameEvent.objects.values_list('game_id', flat=True).distinct())
+    return sorted(ids - set(ArchivedGame.objects.filter(id__in=ids).values_list('id', flat=True)))
+
+def rebuild(game_ids, use_snapshot=True):
+    """
+    Write the projections of the given games back into Game, Stump and
+    Question: rows are created or overwritten, and turns the log says were
+    cancelled are deleted. Returns the number of games rebuilt.
+    """
+    rebuilt = 0
+    with transaction.atomic():
+        for game_id in game_ids:
+            projection = load(game_id, use_snapshot)
+            if projection.game:
+                write(projection)
+                rebuilt += 1
+    return rebuilt
+
+TURN_FIELDS = ('creator', 'text', 'answer', 'date_created')
+
+def write(projection):
+    game, stumps, questions = projection.to_models()
+    if not Game.objects.filter(id=game.id).exists():
+        Game.objects.bulk_create([Game(id=game.id, creator=game.creator, letter=game.letter,
+                                       person=game.person, channel=game.channel)])
+
+    for model, turns in ((Stump, stumps), (Question, questions)):
+        model.objects.filter(game_id=game.id).exclude(id__in=[t.id for t in turns]).delete()
+        existing = {row[0]: row[1:] for row in
+                    model.objects.filter(game_id=game.id).values_list('id', *TURN_FIELDS)}
+        model.objects.bulk_create([t for t in turns if t.id not in existing])
+        for t in turns:
+            # bulk_create stamps date_created with now, and update() doesn't
+            values = tuple(getattr(t, f) for f in TURN_FIELDS)
+            if existing.get(t.id) != values:
+                model.objects.filter(id=t.id).update(**dict(zip(TURN_FIELDS, values)))
+
+    Game.objects.filter(id=game.id).update(
+        creator=game.creator, letter=game.letter, person=game.person, channel=game.channel,
+        state=game.state, transcript=game.transcript, date_created=game.date_created,
+        date_updated=game.date_updated,
+        pending_stump_id=game.pending_stump and game.pending_stump.id,
+        pending_question_id=game.pending_question and game.pending_question.id,
+        latest_stump_id=game.latest_stump and game.latest_stump.id)
+    invalidate_channel(game.channel)
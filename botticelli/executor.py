@@ -0,0 +1,205 @@
+import time
+import atexit
+import logging
+import threading
+import queue
+
+from django.db import close_old_connections
+
+from botticelli import logs
+from botticelli.ring import HashRing
+
+logger = logging.getLogger('botticelli')
+
+class ExecutorFull(Exception):
+    pass
+
+_STOP = object()
+
+class Task(object):
+    def __init__(self, key, func, args, request_id):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.request_id = request_id
+
+    def run(self):
+        # Log lines from the task carry the request that queued it
+        logs.set_request_id(self.request_id)
+        try:
+            self.func(*self.args)
+        finally:
+            logs.set_request_id('')
+
+def run_tasks(tasks):
+    """Run a batch one task at a time, the default batch runner"""
+    for task in tasks:
+        try:
+            task.run()
+        except Exception:
+            logger.exception('Deferred task %s failed', task.func)
+
+class Executor(object):
+    """
+    Bounded pool of worker threads for deferred Slack handling.
+
+    Every task is submitted with a key (the channel id) and keys are placed
+    on a consistent hash ring of workers, so tasks for one channel run one
+    at a time and in the order they were submitted. Each worker has its own
+    bounded queue; submit() waits up to `put_timeout` seconds for room and
+    then raises ExecutorFull so the caller can shed load.
+
+    A worker takes up to `batch_size` queued tasks at a time and hands them
+    to `batch_runner`, see botticelli.engine. add_workers() grows the pool
+    and moves only the keys the new workers take over.
+    """
+    def __init__(self, workers=4, queue_size=64, put_timeout=0.5,
+                 batch_size=1, batch_runner=run_tasks):
+        self.queue_size = queue_size
+        self.put_timeout = put_timeout
+        self.batch_size = batch_size
+        self.batch_runner = batch_runner
+        self.queues = []
+        self.threads = []
+        self.ring = HashRing()
+        self.stopped = False
+        # submit() counts itself in `submitting` so a rebalance can wait
+        # for puts routed with the old ring to land
+        self.cond = threading.Condition()
+        self.submitting = 0
+        self.pausing = False
+
+        for i in self._start_workers(workers):
+            self.ring.add(i)
+
+    def _start_workers(self, count):
+        added = []
+        for _ in range(count):
+            i = len(self.queues)
+            q = queue.Queue(maxsize=self.queue_size)
+            thread = threading.Thread(target=self._run, args=(q,),
+                                      name='botticelli-worker-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self.queues.append(q)
+            self.threads.append(thread)
+            added.append(i)
+        return added
+
+    def _queue_for(self, key):
+        return self.queues[self.ring.node_for(key)]
+
+    def submit(self, key, func, *args):
+        with self.cond:
+            while self.pausing:
+                self.cond.wait()
+            if self.stopped:
+                raise ExecutorFull('Executor is shutting down')
+            q = self._queue_for(key)
+            self.submitting += 1
+
+        try:
+            q.put(Task(key, func, args, logs.get_request_id()), timeout=self.put_timeout)
+        except queue.Full:
+            raise ExecutorFull('Too many pending requests for %s' % key)
+        finally:
+            with self.cond:
+                self.submitting -= 1
+                self.cond.notify_all()
+
+    def wait(self, key):
+        """Block until everything queued for key's worker has run"""
+        self._queue_for(key).join()
+
+    def add_workers(self, count):
+        """
+        Start `count` more workers and move their share of the keys to
+        them. Keys that move wait for the tasks already queued on their old
+        worker, so per-key order holds across the move.
+        """
+        with self.cond:
+            self.pausing = True
+            while self.submitting:
+                self.cond.wait()
+        try:
+            for q in self.queues:
+                q.join()
+            for i in self._start_workers(count):
+                self.ring.add(i)
+        finally:
+            with self.cond:
+                self.pausing = False
+                self.cond.notify_all()
+
+    def _take_batch(self, q):
+        """The next task, blocking, plus whatever else is already queued"""
+        items = [q.get()]
+        while len(items) < self.batch_size and items[-1] is not _STOP:
+            try:
+                items.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self, q):
+        while True:
+            items = self._take_batch(q)
+            tasks = [item for item in items if item is not _STOP]
+            try:
+                if tasks:
+                    close_old_connections()
+                    try:
+                        self.batch_runner(tasks)
+                    except Exception:
+                        logger.exception('Deferred batch of %d failed', len(tasks))
+                    finally:
+                        close_old_connections()
+            finally:
+                for _ in items:
+                    q.task_done()
+            if len(tasks) < len(items):
+                return
+
+    def shutdown(self, timeout=None):
+        """
+        Stop accepting work, drain what is queued and join the workers,
+        giving up on whatever is left after `timeout` seconds in all
+        """
+        with self.cond:
+            if self.stopped:
+                return
+            self.stopped = True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        def remaining():
+            return None if deadline is None else max(0, deadline - time.monotonic())
+
+        for q in self.queues:
+            try:
+                q.put(_STOP, timeout=remaining())
+            except queue.Full:
+                logger.warning('Executor shut down with a full queue')
+        for thread in self.threads:
+            thread.join(remaining())
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    from django.conf import settings
+
+    with _executor_lock:
+        if _executor is None:
+            if settings.BOTTICELLI_ENGINE:
+                from botticelli import engine
+                batch_size, batch_runner = settings.BOTTICELLI_ENGINE_BATCH, engine.run_batch
+            else:
+                batch_size, batch_runner = 1, run_tasks
+            _executor = Executor(workers=settings.BOTTICELLI_WORKERS,
+                                 queue_size=settings.BOTTICELLI_QUEUE_SIZE,
+                                 put_timeout=settings.BOTTICELLI_QUEUE_TIMEOUT,
+                                 batch_size=batch_size,
+                                 batch_runner=batch_runner)
+            atexit.register(_executor.shutdown, settings.BOTTICELLI_DRAIN_TIMEOUT)
+        return _executor
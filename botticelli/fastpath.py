@@ -0,0 +1,54 @@
+"""
+A short path to the Slack endpoints.
+
+Slack's webhooks don't use sessions, CSRF, auth, messages or frame
+options, yet through Django's handler every one of them would pass the
+whole MIDDLEWARE list. FastPath is a WSGI app that takes the routes in
+urls.slack_routes itself: it builds the request, runs only the request id
+and metrics middleware, and calls the view, which verifies the signature
+and reads the form body once. Everything else goes to Django's handler
+with the normal stack.
+"""
+
+from django.core import signals
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIRequest, get_script_name
+from django.urls import ResolverMatch, set_script_prefix
+from django.utils.encoding import force_str
+
+from botticelli.logs import RequestIdMiddleware
+from botticelli.metrics import MetricsMiddleware
+
+class FastPath(object):
+    def __init__(self, application, routes=None):
+        if routes is None:
+            from botticelli.urls import slack_routes as routes
+        self.application = application
+        self.handlers = {path: self._chain(view) for path, view in routes.items()}
+
+    def _chain(self, view):
+        def call_view(request):
+            # The metrics label requests by view name, like the resolver would
+            request.resolver_match = ResolverMatch(view, (), {})
+            return view(request)
+
+        handler = convert_exception_to_response(call_view)
+        for middleware in (MetricsMiddleware, RequestIdMiddleware):
+            handler = convert_exception_to_response(middleware(handler))
+        return handler
+
+    def __call__(self, environ, start_response):
+        handler = self.handlers.get(environ.get('PATH_INFO'))
+        if handler is None:
+            return self.application(environ, start_response)
+
+        # What django.core.handlers.wsgi.WSGIHandler does around a request
+        set_script_prefix(get_script_name(environ))
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        response = handler(WSGIRequest(environ))
+        # close() sends request_finished, which closes stale connections
+        response._handler_class = self.__class__
+
+        status = '%d %s' % (response.status_code, response.reason_phrase)
+        start_response(force_str(status), [(str(k), str(v)) for k, v in response.items()])
+        return response
@@ -0,0 +1,174 @@
+"""
+Question history of a game, read a page at a time.
+
+Each page after the first is read with keyset pagination on
+(date_created, id) from the last question of the page before, which the
+botticelli_question_history index serves directly. Starting at page N
+first has to find where it begins, an OFFSET over the index that costs
+O(N * page_size), after which the following pages are keyset again.
+
+post_history() posts the game's status message and streams the questions
+under it as thread replies, chunked to stay well inside Slack's message
+size limit.
+"""
+
+import queue
+import logging
+import threading
+
+from django.db.models import Q
+
+from botticelli import transcript
+from botticelli.models import Question
+
+logger = logging.getLogger('botticelli')
+
+PAGE_SIZE = 100
+
+# Slack truncates messages over 40000 characters and recommends staying
+# under 4000
+CHUNK_CHARS = 3000
+
+def page_start(game, page, page_size=PAGE_SIZE):
+    """
+    The (date_created, id) just before the page: None for the first page,
+    False if there are fewer pages. Skips the earlier pages with an OFFSET.
+    """
+    if page <= 1:
+        return None
+    keys = Question.objects.filter(game=game).order_by('date_created', 'id') \
+        .values_list('date_created', 'id')[(page - 1) * page_size - 1:(page - 1) * page_size]
+    keys = list(keys)
+    return keys[0] if keys else False
+
+def read_page(game, after, page_size=PAGE_SIZE):
+    questions = Question.objects.filter(game=game).order_by('date_created', 'id')
+    if after is not None:
+        date_created, id = after
+        questions = questions.filter(Q(date_created__gt=date_created) |
+                                     Q(date_created=date_created, id__gt=id))
+    return list(questions[:page_size])
+
+def pages(game, first_page=1, page_size=PAGE_SIZE):
+    """
+    Yield (number, questions) for each page from first_page on, reading
+    the next page only once the caller is done with the current one
+    """
+    after = page_start(game, first_page, page_size)
+    if after is False:
+        return
+
+    number = first_page
+    while True:
+        questions = read_page(game, after, page_size)
+        if not questions:
+            return
+        yield number, questions
+        if len(questions) < page_size:
+            return
+        after = (questions[-1].date_created, questions[-1].id)
+        number += 1
+
+def chunks(lines, limit=CHUNK_CHARS):
+    """Join lines into messages of at most about `limit` characters"""
+    chunk, size = [], 0
+    for line in lines:
+        if chunk and size + len(line) + 1 > limit:
+            yield '\n'.join(chunk)
+            chunk, size = [], 0
+        chunk.append(line[:limit])
+        size += len(line) + 1
+    if chunk:
+        yield '\n'.join(chunk)
+
+def question_lines(questions, first_number):
+    for number, question in enumerate(questions, first_number):
+        yield '%d. %s: %s' % (number, question.text, transcript.status_of(question.answer))
+
+class ThreadSender(object):
+    """
+    Posts thread replies from a background thread, so the next page is
+    read while the previous one is still going out. Replies are sent one
+    at a time, keeping their order, and send() blocks once max_pending
+    replies are waiting, so at most about a page is held in memory.
+    """
+    def __init__(self, slack, channel, parent, max_pending=4):
+        self.slack = slack
+        self.channel = channel
+        self.parent = parent
+        self.queue = queue.Queue(max_pending)
+        self.failed = False
+        self.thread = threading.Thread(target=self._run, name='botticelli-history')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, text):
+        self.queue.put(text)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            text = self.queue.get()
+            if text is None:
+                return
+            if self.failed:
+                continue
+            try:
+                ret = self.slack.send_thread_message(text, self.channel, self.parent)
+                self.failed = not ret.get('ok')
+            except Exception:
+                logger.exception('History reply to %s failed', self.channel)
+                self.failed = True
+
+class InlineSender(object):
+    """Queues thread replies in the outbox on the request's own connection"""
+    def __init__(self, slack, channel, parent):
+        self.slack = slack
+        self.channel = channel
+        self.parent = parent
+
+    def send(self, text):
+        self.slack.send_thread_message(text, self.channel, self.parent)
+
+    def close(self):
+        pass
+
+def post_history(slack, game, channel, first_page=1, page_size=PAGE_SIZE):
+    """
+    Post the game's status message and the questions from first_page on
+    as thread replies under it. Returns the number of questions posted.
+    """
+    page_iter = pages(game, first_page, page_size)
+    page = next(page_iter, None)
+    if page is None:
+        return 0
+
+    # A new status message rather than the last one, whose ts isn't kept
+    # and which a queued status may be about to replace
+    text = slack.short_status(channel, game)
+    if first_page > 1:
+        text += '\nQuestions from page %d in the thread' % first_page
+    parent = slack.send_message(text, channel)
+    if not parent.get('ok'):
+        return 0
+
+    if slack.use_outbox:
+        sender = InlineSender(slack, channel, parent)
+    else:
+        sender = ThreadSender(slack, channel, parent)
+
+    posted = 0
+    try:
+        while page is not None:
+            number, questions = page
+            first = (number - 1) * page_size + 1
+            for text in chunks(question_lines(questions, first)):
+                sender.send(text)
+            posted += len(questions)
+            page = next(page_iter, None)
+    finally:
+        sender.close()
+    return posted
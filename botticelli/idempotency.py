@@ -0,0 +1,102 @@
+"""
+Drops repeated Slack deliveries before they reach a handler.
+
+Slack retries a request it didn't get an answer to in time, and people
+double-click the yes/no buttons. The views claim a key for each delivery
+in a RequestCache and answer a repeat with an empty 200 straight away, so
+it makes no queries and no Slack calls:
+
+- a slash command is keyed on its trigger_id, which a retry keeps;
+  without one, only a delivery marked as a retry (X-Slack-Retry-Num, or
+  a Socket Mode retry_attempt) is keyed, on its whole body
+- a button click is keyed on the user and the callback_id, so once a user
+  has answered a stump or question their further clicks on it are
+  repeats, while other users' clicks still get their own reply
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+class RequestCache(object):
+    """
+    Keys seen in the last `ttl` seconds, at most `size` of them per
+    process. If `shared` is a Django cache, keys are claimed there with
+    add(), so a retry landing on another worker process is caught too.
+    """
+    def __init__(self, size=10000, ttl=300, shared=None, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.shared = shared
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _shared_key(self, key):
+        # callback_id JSON has characters memcached doesn't allow in keys
+        return 'botticelli:seen:%s' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def claim(self, key):
+        """Record key, returns False if it was already seen"""
+        if self.ttl <= 0:
+            return True
+        now = self.clock()
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is not None and expires > now:
+                return False
+            self.entries[key] = now + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        if self.shared is not None and not self.shared.add(self._shared_key(key), 1, self.ttl):
+            # Ask the shared cache again next time, the other claim may be released
+            with self.lock:
+                self.entries.pop(key, None)
+            return False
+        return True
+
+    def release(self, key):
+        """Forget key, for a delivery that was turned away and may be sent again"""
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+def body_hash(items):
+    text = '&'.join('%s=%s' % item for item in sorted(items))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def slash_key(data, retried):
+    if data.get('trigger_id'):
+        return 'slash:%s' % data['trigger_id']
+    if retried:
+        return 'slash:%s' % body_hash(data.items())
+    return None
+
+def action_key(payload):
+    return 'action:%s:%s:%s' % (payload.get('team', {}).get('id', ''),
+                                payload.get('user', {}).get('name', ''),
+                                payload.get('callback_id', ''))
+
+_requests = None
+_requests_lock = threading.Lock()
+
+def get_requests():
+    global _requests
+    from django.conf import settings
+    from django.core.cache import caches
+
+    with _requests_lock:
+        if _requests is None:
+            backend = settings.BOTTICELLI_DEDUPE_BACKEND
+            _requests = RequestCache(size=settings.BOTTICELLI_DEDUPE_SIZE,
+                                     ttl=settings.BOTTICELLI_DEDUPE_TTL,
+                                     shared=caches[backend] if backend else None)
+        return _requests
@@ -0,0 +1,152 @@
+"""
+Logging that never makes a request thread wait on stdout.
+
+AsyncHandler puts records on a bounded queue and a listener thread
+formats and writes them; when the queue is full records are dropped and
+counted instead of blocking. JsonFormatter writes one JSON object per line
+tagged with the current request id. The classes here are referenced from
+settings.LOGGING, so this module must not import Django settings.
+"""
+
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+
+_context = threading.local()
+
+# Every AsyncHandler, so after_fork() can find them
+_handlers = []
+
+def get_request_id():
+    return getattr(_context, 'request_id', '')
+
+def set_request_id(request_id):
+    _context.request_id = request_id
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    def __init__(self, target='logging.StreamHandler', queue_size=10000):
+        logging.handlers.QueueHandler.__init__(self, queue.Queue(queue_size))
+        module, _, name = target.rpartition('.')
+        self.target = getattr(__import__(module, fromlist=[name]), name)()
+        self.dropped = 0
+        self._start()
+        _handlers.append(self)
+        atexit.register(self.stop)
+
+    def _start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target,
+                                                       respect_handler_level=True)
+        self.listener.start()
+
+    def restart(self):
+        """
+        Start a new listener on a new queue, in a forked process where the
+        parent's listener thread doesn't exist
+        """
+        self.queue = queue.Queue(self.queue.maxsize)
+        self._start()
+
+    def setFormatter(self, formatter):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(formatter)
+
+    def prepare(self, record):
+        record.request_id = get_request_id()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+def after_fork():
+    """Restart the log listeners in a process forked after logging was set up"""
+    for handler in _handlers:
+        handler.restart()
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', '')
+        if request_id:
+            entry['request_id'] = request_id
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + \
+            '.%03dZ' % record.msecs
+
+class SampleFilter(logging.Filter):
+    """Let through `rate` of the records, for chatty per-call logs"""
+    def __init__(self, rate=1.0):
+        logging.Filter.__init__(self)
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return self.rate >= 1 or random.random() < self.rate
+
+REDACTED = ('token', 'response_url', 'trigger_id')
+
+def summarize(payload, limit=200):
+    """
+    A copy of a Slack payload that is safe and small enough to log: secrets
+    redacted, the echoed original_message reduced to its size and long
+    strings truncated.
+    """
+    if hasattr(payload, 'dict'):
+        payload = payload.dict()
+
+    summary = {}
+    for key, value in payload.items():
+        if key in REDACTED:
+            summary[key] = '<redacted>'
+        elif key == 'original_message':
+            summary[key] = '<%d chars>' % len(json.dumps(value))
+        elif isinstance(value, dict):
+            summary[key] = summarize(value, limit)
+        elif isinstance(value, str) and len(value) > limit:
+            summary[key] = value[:limit] + '...'
+        else:
+            summary[key] = value
+    return summary
+
+class Summary(object):
+    """Log argument that summarizes a payload only when it is formatted"""
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        return json.dumps(summarize(self.payload), default=str)
+
+class RequestIdMiddleware(object):
+    """Tag log records with Heroku's X-Request-ID, or a fresh id"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.META.get('HTTP_X_REQUEST_ID') or uuid.uuid4().hex
+        set_request_id(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            set_request_id('')
+        response['X-Request-ID'] = request_id
+        return response
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from botticelli import archive
+
+class Command(BaseCommand):
+    help = 'Move finished games and their turns into the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.BOTTICELLI_ARCHIVE_DAYS,
+                            help='Archive games finished more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=settings.BOTTICELLI_ARCHIVE_BATCH)
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to sleep between batches')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep archiving, every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600)
+
+    def handle(self, *args, **options):
+        while True:
+            total = archive.archive(options['days'], options['batch_size'], options['pause'])
+            self.stdout.write('Archived %d games' % total)
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,87 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from botticelli import clients, transport
+from botticelli.bench import overhead, payloads, runner
+from botticelli.bench.fakeslack import FakeSlack
+
+BASELINES = os.path.join(os.path.dirname(runner.__file__), 'baselines.json')
+
+class Command(BaseCommand):
+    help = 'Replay Slack traffic against the endpoints and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channels', type=int, default=20)
+        parser.add_argument('--turns', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--stream', help='Replay steps from this JSONL file')
+        parser.add_argument('--save-stream', help='Write the generated steps to this file')
+        parser.add_argument('--deferred', action='store_true',
+                            help='Measure with BOTTICELLI_DEFERRED on')
+        parser.add_argument('--engine', action='store_true',
+                            help='Measure with BOTTICELLI_ENGINE on, Web API calls stay in the outbox')
+        parser.add_argument('--scenario', default='default')
+        parser.add_argument('--baselines', default=BASELINES)
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed p95 slowdown over the baseline, as a fraction')
+        parser.add_argument('--update-baseline', action='store_true')
+        parser.add_argument('--overhead-requests', type=int, default=2000,
+                            help='Requests timed for the dispatch overhead, 0 to skip it')
+
+    def handle(self, *args, **options):
+        if options['stream']:
+            streams = payloads.load(options['stream'])
+        else:
+            streams = payloads.generate(seed=options['seed'],
+                                        channels=options['channels'],
+                                        turns=options['turns'])
+        if options['save_stream']:
+            payloads.save(streams, options['save_stream'])
+
+        fake_slack = FakeSlack().start()
+        transport.get_transport().api_url = fake_slack.url + 'api/'
+        settings.SLACK_API_URL = fake_slack.url + 'api/'
+        settings.SLACK_OATH_TOKEN = settings.SLACK_OATH_TOKEN or 'xoxb-bench'
+        # Requests are signed with it, as Slack's would be
+        settings.SLACK_SIGNING_SECRET = settings.SLACK_SIGNING_SECRET or 'bench-secret'
+        clients.get_clients().clear()
+        settings.BOTTICELLI_ENGINE = options['engine']
+        settings.SLACK_OUTBOX = options['engine']
+        settings.BOTTICELLI_DEFERRED = options['deferred'] or options['engine']
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Look the team up once up front, like a warm process would have
+            clients.get_clients().get(payloads.TEAM)
+            report = runner.Runner(streams, fake_slack, options['concurrency']).run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            fake_slack.stop()
+
+        self.stdout.write(report.format())
+        if options['overhead_requests']:
+            cost = overhead.measure(options['overhead_requests'])
+            self.stdout.write('dispatch overhead %.0f us through Django, %.0f us fast path' % (
+                cost['django_us'], cost['fast_path_us']))
+
+        summary = report.summary()
+        baselines = runner.load_baselines(options['baselines'])
+        if options['update_baseline']:
+            baselines[options['scenario']] = summary
+            runner.save_baselines(options['baselines'], baselines)
+            self.stdout.write('Saved baseline %s' % options['scenario'])
+            return
+
+        baseline = baselines.get(options['scenario'])
+        if baseline is None:
+            self.stdout.write('No baseline for %s' % options['scenario'])
+            return
+
+        problems = runner.regressions(summary, baseline, options['tolerance'])
+        if problems:
+            raise CommandError('Regressed against baseline:\n' + '\n'.join(problems))
+        self.stdout.write('Within baseline %s' % options['scenario'])
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from botticelli.bench import startup
+from botticelli.bench.fakeslack import FakeSlack
+
+class Command(BaseCommand):
+    help = 'Time fresh web processes from start to their first answered request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Processes started for each profile, the median is reported')
+        parser.add_argument('--max-cold-ms', type=float, default=0,
+                            help='Fail if a preloaded webhook process takes longer than this')
+
+    def handle(self, *args, **options):
+        fake_slack = FakeSlack().start()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            env = {'DATABASE_URL': startup.database_url(connection.settings_dict),
+                   'SLACK_API_URL': fake_slack.url + 'api/',
+                   'SLACK_OATH_TOKEN': settings.SLACK_OATH_TOKEN or 'xoxb-bench',
+                   'SLACK_SIGNING_SECRET': settings.SLACK_SIGNING_SECRET or 'bench-secret'}
+            # The children connect to the test database themselves
+            connection.close()
+            results = startup.measure(options['runs'], fake_slack.url + 'response', env)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            fake_slack.stop()
+
+        self.stdout.write(startup.format_results(results))
+
+        before, after = results['full lazy'], results['webhook preload']
+        self.stdout.write('First request %.1f ms sooner, %.1f ms in the request window '
+                          'instead of %.1f ms' % (before['cold_ms'] - after['cold_ms'],
+                                                  after['first_request_ms'],
+                                                  before['first_request_ms']))
+        bad = [name for name, row in results.items() if not row['status'].startswith('200')]
+        if bad:
+            raise CommandError('First request failed for %s' % ', '.join(sorted(bad)))
+        if options['max_cold_ms'] and after['cold_ms'] > options['max_cold_ms']:
+            raise CommandError('Cold start took %.1f ms, over %.1f ms'
+                               % (after['cold_ms'], options['max_cold_ms']))
@@ -0,0 +1,28 @@
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from botticelli import names
+
+class Command(BaseCommand):
+    help = 'Compile a list of names, one per line, into the index start and suggest use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Text file of names, or - for stdin')
+        parser.add_argument('--output', default=settings.BOTTICELLI_NAMES_PATH,
+                            help='Index file to write, BOTTICELLI_NAMES_PATH by default')
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set BOTTICELLI_NAMES_PATH or pass --output')
+
+        start = time.time()
+        if options['source'] == '-':
+            count = names.build(sys.stdin, options['output'])
+        else:
+            with open(options['source'], encoding='utf-8') as f:
+                count = names.build(f, options['output'])
+        self.stdout.write('Wrote %d names to %s in %.1fs' % (count, options['output'],
+                                                             time.time() - start))
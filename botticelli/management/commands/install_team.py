@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from botticelli.models import Installation
+
+class Command(BaseCommand):
+    help = 'Add or update the bot token for a Slack workspace'
+
+    def add_arguments(self, parser):
+        parser.add_argument('team_id')
+        parser.add_argument('bot_token')
+        parser.add_argument('--name', default='')
+        parser.add_argument('--app-token', default='',
+                            help="App-level token if the workspace has its own app, for Socket Mode")
+
+    def handle(self, *args, **options):
+        installation, created = Installation.objects.update_or_create(
+            team_id=options['team_id'],
+            defaults={'bot_token': options['bot_token'], 'team_name': options['name'],
+                      'app_token': options['app_token']})
+        self.stdout.write('%s %s' % ('Installed' if created else 'Updated', installation.team_id))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from botticelli import stats
+
+class Command(BaseCommand):
+    help = 'Recompute the stats counters from live and archived games'
+
+    def handle(self, *args, **options):
+        rows = stats.rebuild()
+        self.stdout.write('Rebuilt %d stats rows' % rows)
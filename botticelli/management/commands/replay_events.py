@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from botticelli import events
+
+class Command(BaseCommand):
+    help = 'Rebuild games, stumps and questions from the game event log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_ids', nargs='*', type=int,
+                            help='Games to rebuild, every game that is not archived by default')
+        parser.add_argument('--full', action='store_true',
+                            help='Replay from the first event, ignoring snapshots')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Games rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        ids = options['game_ids'] or events.game_ids()
+        size = options['batch_size']
+        total = 0
+        for start in range(0, len(ids), size):
+            total += events.rebuild(ids[start:start + size], use_snapshot=not options['full'])
+        self.stdout.write('Rebuilt %d games' % total)
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from botticelli.clients import ClientPool
+from botticelli.outbox import Dispatcher
+
+class Command(BaseCommand):
+    help = 'Send queued Slack Web API calls from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Make one pass over the outbox and exit')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=0.5)
+
+    def handle(self, *args, **options):
+        clients = ClientPool(size=settings.SLACK_CLIENT_POOL_SIZE,
+                             ttl=settings.SLACK_CLIENT_TTL,
+                             use_outbox=False)
+        dispatcher = Dispatcher(clients=clients,
+                                batch_size=options['batch_size'],
+                                poll_interval=options['poll_interval'],
+                                retention=timedelta(days=settings.SLACK_OUTBOX_RETENTION_DAYS))
+        if options['once']:
+            dispatcher.run_once()
+        else:
+            dispatcher.run_forever()
@@ -0,0 +1,35 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from botticelli import executor, socketmode
+from botticelli.transport import get_transport
+
+class Command(BaseCommand):
+    help = 'Receive Slack commands and button clicks over Socket Mode websockets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-backoff', type=float, default=60,
+                            help='Most seconds to wait before reconnecting')
+
+    def handle(self, *args, **options):
+        tokens = socketmode.app_tokens()
+        if not tokens:
+            raise CommandError('Set SLACK_APP_TOKEN or install a team with --app-token')
+
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stop.set())
+
+        threads = socketmode.start(tokens, get_transport(), stop,
+                                   max_backoff=options['max_backoff'])
+        self.stdout.write('Listening on %d Socket Mode connections' % len(threads))
+
+        while not stop.wait(1):
+            pass
+        for thread in threads:
+            thread.join()
+        # Finish deferred work before exiting
+        executor.get_executor().shutdown(settings.BOTTICELLI_DRAIN_TIMEOUT)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from botticelli import events
+
+class Command(BaseCommand):
+    help = 'Snapshot active games so replay starts from a recent state'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-events', type=int, default=20,
+                            help='Skip games with fewer new events since their last snapshot')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep snapshotting, every --interval seconds')
+        parser.add_argument('--interval', type=float, default=600)
+
+    def handle(self, *args, **options):
+        while True:
+            total = events.snapshot_active(options['min_events'])
+            self.stdout.write('Snapshotted %d games' % total)
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
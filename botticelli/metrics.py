@@ -0,0 +1,326 @@
+"""
+Request, database and Slack call metrics in Prometheus text format.
+
+Each thread records into its own dict, so the hot path takes no locks;
+a scrape merges every thread's dict. When BOTTICELLI_METRICS_DIR is set,
+each process also writes its merged numbers to <dir>/<pid>.json every few
+seconds and a scrape adds up all the files, so any worker can answer for
+the whole dyno. When a worker goes, its counters are folded into
+<dir>/retired.json and its gauges dropped, so the dyno's totals never go
+down and don't look like a counter reset.
+"""
+
+import os
+import json
+import fcntl
+import time
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COUNTER, HISTOGRAM, GAUGE = 'counter', 'histogram', 'gauge'
+
+# Counters of the processes that have exited, see Registry.retire
+RETIRED = 'retired.json'
+
+HELP = {
+    'botticelli_requests_total': (COUNTER, 'HTTP requests by view, action and status'),
+    'botticelli_request_seconds': (HISTOGRAM, 'HTTP request latency'),
+    'botticelli_handler_seconds': (HISTOGRAM, 'Slack handler latency, inline or deferred'),
+    'botticelli_db_queries_total': (COUNTER, 'Database queries made by Slack handlers'),
+    'botticelli_db_seconds_total': (COUNTER, 'Time spent in database queries by Slack handlers'),
+    'botticelli_slack_calls_total': (COUNTER, 'Outbound Slack calls by method and result'),
+    'botticelli_slack_call_seconds': (HISTOGRAM, 'Outbound Slack call latency'),
+    'botticelli_db_pool_connections': (GAUGE, 'Pooled database connections by state'),
+    'botticelli_db_pool_opened_total': (COUNTER, 'Database connections opened by the pool'),
+    'botticelli_db_pool_closed_total': (COUNTER, 'Pooled connections closed, old or broken'),
+    'botticelli_db_pool_waits_total': (COUNTER, 'Times a thread waited for a free connection'),
+    'botticelli_db_pool_wait_seconds_total': (COUNTER, 'Time spent waiting for a free connection'),
+    'botticelli_db_pool_timeouts_total': (COUNTER, 'Waits for a free connection that timed out'),
+    'botticelli_db_pool_failed_checks_total': (COUNTER, 'Idle connections that failed their ping'),
+}
+
+class Registry(object):
+    def __init__(self):
+        self.local = threading.local()
+        self.stores = []
+        self.retired = {}
+        self.lock = threading.Lock()
+        self.next_flush = 0
+        # Functions returning numbers kept elsewhere, like the database pools
+        self.collectors = []
+
+    def _store(self):
+        store = getattr(self.local, 'store', None)
+        if store is None:
+            store = self.local.store = {}
+            with self.lock:
+                self._retire()
+                self.stores.append((threading.current_thread(), store))
+        return store
+
+    def _retire(self):
+        """Fold the stores of finished threads into one, so they don't pile up"""
+        live = []
+        for thread, store in self.stores:
+            if thread.is_alive():
+                live.append((thread, store))
+            else:
+                for key, value in store.items():
+                    merge(self.retired, key, value)
+        self.stores = live
+
+    def inc(self, name, labels, value=1):
+        store = self._store()
+        key = (name, labels)
+        store[key] = store.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, labels, seconds):
+        store = self._store()
+        key = (name, labels)
+        histogram = store.get(key)
+        if histogram is None:
+            # Bucket counts, then the sum, then the count
+            histogram = store[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        histogram[-2] += seconds
+        histogram[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self):
+        """Every thread's numbers added together, keyed by (name, labels)"""
+        with self.lock:
+            self._retire()
+            stores = [store for _, store in self.stores]
+            merged = {}
+            for key, value in self.retired.items():
+                merge(merged, key, value)
+
+        for store in stores:
+            for key, value in store.copy().items():
+                merge(merged, key, value)
+        for collector in self.collectors:
+            for key, value in collector().items():
+                merge(merged, key, value)
+        return merged
+
+    def _maybe_flush(self):
+        directory = settings.BOTTICELLI_METRICS_DIR
+        if not directory or time.time() < self.next_flush:
+            return
+        if not self.lock.acquire(False):
+            return
+        try:
+            self.next_flush = time.time() + settings.BOTTICELLI_METRICS_FLUSH_INTERVAL
+        finally:
+            self.lock.release()
+        self.flush(directory)
+
+    def flush(self, directory):
+        write_values(os.path.join(directory, '%d.json' % os.getpid()), self.snapshot())
+
+    def retire(self, directory):
+        """
+        At exit, fold this process's counters into the dyno's retired
+        ones, so the totals a scrape sees don't go down
+        """
+        with locked(directory):
+            path = os.path.join(directory, RETIRED)
+            retired = read_values(path) or {}
+            fold(retired, self.snapshot())
+            write_values(path, retired)
+            try:
+                os.remove(os.path.join(directory, '%d.json' % os.getpid()))
+            except FileNotFoundError:
+                pass
+
+    def collect(self):
+        """
+        This process's live numbers plus every other process's last flush
+        and the counters of processes that have gone
+        """
+        merged = self.snapshot()
+        directory = settings.BOTTICELLI_METRICS_DIR
+        if not directory:
+            return merged
+
+        own = '%d.json' % os.getpid()
+        # Folding a dead worker's file and removing it is one step to
+        # every other scrape
+        with locked(directory):
+            retired_path = os.path.join(directory, RETIRED)
+            retired = read_values(retired_path) or {}
+            dead = []
+            for filename in os.listdir(directory):
+                if filename in (own, RETIRED) or not filename.endswith('.json'):
+                    continue
+                path = os.path.join(directory, filename)
+                values = read_values(path)
+                if values is None:
+                    continue
+                if pid_alive(filename[:-len('.json')]):
+                    for key, value in values.items():
+                        merge(merged, key, value)
+                else:
+                    # Killed before it could retire itself
+                    fold(retired, values)
+                    dead.append(path)
+            if dead:
+                write_values(retired_path, retired)
+                for path in dead:
+                    os.remove(path)
+
+        for key, value in retired.items():
+            merge(merged, key, value)
+        return merged
+
+@contextmanager
+def locked(directory):
+    with open(os.path.join(directory, 'lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def read_values(path):
+    """A file written by write_values as {(name, labels): value}, or None"""
+    try:
+        with open(path) as f:
+            rows = json.load(f)
+    except (IOError, ValueError):
+        return None
+    return {(name, tuple(tuple(l) for l in labels)): value for name, labels, value in rows}
+
+def write_values(path, values):
+    rows = [[name, list(labels), value] for (name, labels), value in values.items()]
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(rows, f)
+    os.rename(tmp, path)
+
+def fold(retired, values):
+    """Add a gone process's counters and histograms to retired, not its gauges"""
+    for (name, labels), value in values.items():
+        if HELP.get(name, (COUNTER,))[0] != GAUGE:
+            merge(retired, (name, labels), value)
+
+def pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        # Not a file we wrote, leave it be
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, just not ours to signal
+        pass
+    return True
+
+def merge(merged, key, value):
+    if isinstance(value, list):
+        current = merged.get(key)
+        if current is None:
+            merged[key] = list(value)
+        else:
+            merged[key] = [a + b for a, b in zip(current, value)]
+    else:
+        merged[key] = merged.get(key, 0) + value
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in pairs)
+
+def render(values):
+    lines = []
+    for name in sorted(set(key[0] for key in values)):
+        kind, text = HELP.get(name, (COUNTER, name))
+        lines.append('# HELP %s %s' % (name, text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for (key_name, labels), value in sorted(values.items()):
+            if key_name != name:
+                continue
+            if kind == HISTOGRAM:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, value):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (name, format_labels(labels, [('le', bound)]), cumulative))
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels, [('le', '+Inf')]), value[-1]))
+                lines.append('%s_sum%s %f' % (name, format_labels(labels), value[-2]))
+                lines.append('%s_count%s %d' % (name, format_labels(labels), value[-1]))
+            else:
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+def collect_db_pools():
+    from botticelli.db import pool
+    return pool.collect()
+
+registry.collectors.append(collect_db_pools)
+
+def labels(**kwargs):
+    return tuple(sorted(kwargs.items()))
+
+def observe_slack_call(method, seconds, result):
+    registry.inc('botticelli_slack_calls_total', labels(method=method, result=result))
+    registry.observe('botticelli_slack_call_seconds', labels(method=method), seconds)
+
+@contextmanager
+def track_handler(endpoint, action):
+    """Time a Slack handler and count the queries it makes on this thread"""
+    wrappers = []
+    for wrapper in connections.all():
+        wrappers.append((wrapper, wrapper.force_debug_cursor, len(wrapper.queries_log)))
+        wrapper.force_debug_cursor = True
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        queries, query_seconds = 0, 0.0
+        for wrapper, forced, first in wrappers:
+            logged = list(wrapper.queries_log)[first:]
+            queries += len(logged)
+            query_seconds += sum(float(q['time']) for q in logged)
+            wrapper.force_debug_cursor = forced
+            if not forced and not settings.DEBUG:
+                wrapper.queries_log.clear()
+
+        tags = labels(endpoint=endpoint, action=action)
+        registry.observe('botticelli_handler_seconds', tags, seconds)
+        registry.inc('botticelli_db_queries_total', tags, queries)
+        registry.inc('botticelli_db_seconds_total', tags, query_seconds)
+
+class MetricsMiddleware(object):
+    """Counts and times every request, by view and Slack action"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        seconds = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.func.__name__ if match else 'unknown'
+        action = getattr(request, 'botticelli_action', '')
+
+        registry.inc('botticelli_requests_total',
+                     labels(view=view, action=action, status=response.status_code))
+        registry.observe('botticelli_request_seconds', labels(view=view, action=action), seconds)
+        return response
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+DONE, CANCELLED = 4, 5
+
+def cancel_duplicate_games(apps, schema_editor):
+    """Keep only the newest active game per channel so the unique index builds"""
+    Game = apps.get_model('botticelli', 'Game')
+    seen = set()
+    games = Game.objects.exclude(state__in=(DONE, CANCELLED)).order_by('-date_created')
+    for game in games:
+        if game.channel in seen:
+            game.state = CANCELLED
+            game.save()
+        seen.add(game.channel)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0002_auto_20170815_0119'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_games, migrations.RunPython.noop),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX botticelli_game_active_channel '
+             'ON botticelli_game (channel) WHERE NOT (state IN (%d, %d))' % (DONE, CANCELLED)],
+            ['DROP INDEX botticelli_game_active_channel']),
+        migrations.RunSQL(
+            ['CREATE INDEX botticelli_stump_pending '
+             'ON botticelli_stump (game_id) WHERE answer IS NULL'],
+            ['DROP INDEX botticelli_stump_pending']),
+        migrations.RunSQL(
+            ['CREATE INDEX botticelli_question_pending '
+             'ON botticelli_question (game_id) WHERE answer IS NULL'],
+            ['DROP INDEX botticelli_question_pending']),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 05:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_turn_pointers(apps, schema_editor):
+    Game = apps.get_model('botticelli', 'Game')
+    for game in Game.objects.iterator():
+        game.pending_stump = game.stump_set.filter(answer=None).order_by('-date_created').first()
+        game.pending_question = game.question_set.filter(answer=None).order_by('-date_created').first()
+        game.latest_stump = game.stump_set.order_by('-date_created').first()
+        game.save(update_fields=['pending_stump', 'pending_question', 'latest_stump'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0003_active_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='latest_stump',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='botticelli.Stump'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='pending_question',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='botticelli.Question'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='pending_stump',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='botticelli.Stump'),
+        ),
+        migrations.RunPython(backfill_turn_pointers, migrations.RunPython.noop),
+    ]
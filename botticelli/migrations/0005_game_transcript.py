@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 05:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# botticelli.transcript as it was, so later changes to it don't change
+# what this migration writes
+HEADER = 'Previous questions:'
+
+def render(questions):
+    transcript = ''
+    for question in questions:
+        status = 'Pending' if question.answer is None else 'Yes' if question.answer else 'No'
+        line = '%s: %s' % (question.text, status)
+        if not transcript:
+            transcript = HEADER + '\n\n' + line
+        elif transcript.endswith(': Yes'):
+            transcript += '\n' + line
+        else:
+            transcript += '\n\n' + line
+    return transcript
+
+def backfill_transcripts(apps, schema_editor):
+    Game = apps.get_model('botticelli', 'Game')
+    for game in Game.objects.iterator():
+        game.transcript = render(game.question_set.order_by('date_created'))
+        game.save(update_fields=['transcript'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0004_turn_pointers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='transcript',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(backfill_transcripts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 05:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0005_game_transcript'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Outbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(max_length=16)),
+                ('method', models.CharField(max_length=32)),
+                ('payload', models.TextField()),
+                ('state', models.IntegerField(default=0)),
+                ('coalesce_key', models.CharField(blank=True, default='', max_length=32)),
+                ('ref_model', models.CharField(blank=True, default='', max_length=16)),
+                ('ref_id', models.IntegerField(blank=True, null=True)),
+                ('result_ts', models.CharField(blank=True, default='', max_length=32)),
+                ('error', models.CharField(blank=True, default='', max_length=64)),
+                ('attempts', models.IntegerField(default=0)),
+                ('not_before', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='botticelli.Outbox')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outbox',
+            index=models.Index(fields=['state', 'id'], name='botticelli__state_ed7287_idx'),
+        ),
+    ]
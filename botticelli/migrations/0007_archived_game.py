@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 06:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0006_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('creator', models.CharField(max_length=64)),
+                ('letter', models.CharField(max_length=1)),
+                ('person', models.CharField(max_length=64)),
+                ('channel', models.CharField(max_length=16)),
+                ('state', models.IntegerField()),
+                ('date_updated', models.DateTimeField()),
+                ('date_created', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('date_archived', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedgame',
+            index=models.Index(fields=['channel', 'date_created'], name='botticelli__channel_109e37_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 06:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0007_archived_game'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(max_length=16)),
+                ('username', models.CharField(blank=True, max_length=64)),
+                ('games_started', models.IntegerField(default=0)),
+                ('stumps_asked', models.IntegerField(default=0)),
+                ('stumps_won', models.IntegerField(default=0)),
+                ('questions_asked', models.IntegerField(default=0)),
+                ('questions_hit', models.IntegerField(default=0)),
+                ('stumps_faced', models.IntegerField(default=0)),
+                ('stumps_lost', models.IntegerField(default=0)),
+                ('questions_faced', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['channel', '-stumps_won'], name='botticelli__channel_0dc6f9_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='playerstats',
+            unique_together=set([('channel', 'username')]),
+        ),
+    ]
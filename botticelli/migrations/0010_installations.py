@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 06:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0009_question_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Installation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('team_id', models.CharField(max_length=16, unique=True)),
+                ('team_name', models.CharField(blank=True, default='', max_length=128)),
+                ('bot_token', models.CharField(max_length=128)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='outbox',
+            name='team_id',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 06:14
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models
+
+
+def backfill_events(apps, schema_editor):
+    # Events for the games played before the log existed, in the order the
+    # handlers would have written them
+    Game = apps.get_model('botticelli', 'Game')
+    GameEvent = apps.get_model('botticelli', 'GameEvent')
+
+    def event(game, kind, actor, date, **data):
+        return GameEvent(game_id=game.id, channel=game.channel, kind=kind, actor=actor,
+                         data=json.dumps(data)), date
+
+    for game in Game.objects.order_by('id').iterator():
+        events = [event(game, 'game_started', game.creator, game.date_created,
+                        person=game.person, letter=game.letter)]
+        turns = [('stump', t) for t in game.stump_set.all()] + \
+            [('question', t) for t in game.question_set.all()]
+        for kind, turn in sorted(turns, key=lambda t: (t[1].date_created, t[1].id)):
+            events.append(event(game, kind + '_asked', turn.creator, turn.date_created,
+                                id=turn.id, text=turn.text))
+            if turn.answer is not None:
+                events.append(event(game, kind + '_answered', game.creator, turn.date_updated,
+                                    id=turn.id, answer=turn.answer))
+        if game.state == 5:
+            events.append(event(game, 'cancelled', game.creator, game.date_updated,
+                                target='game', id=game.id))
+
+        created = GameEvent.objects.bulk_create([e for e, _ in events])
+        # date_created is auto_now_add, so the real dates go in afterwards
+        for row, (_, date) in zip(created, events):
+            GameEvent.objects.filter(id=row.id).update(date_created=date)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0010_installations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_id', models.IntegerField()),
+                ('channel', models.CharField(max_length=16)),
+                ('kind', models.CharField(max_length=24)),
+                ('actor', models.CharField(blank=True, default='', max_length=64)),
+                ('data', models.TextField(default='{}')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GameSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_id', models.IntegerField()),
+                ('last_event_id', models.IntegerField()),
+                ('state', models.TextField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='gamesnapshot',
+            index=models.Index(fields=['game_id', '-last_event_id'], name='botticelli__game_id_9d476b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gameevent',
+            index=models.Index(fields=['game_id', 'id'], name='botticelli__game_id_f1d66f_idx'),
+        ),
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 06:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botticelli', '0011_game_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='installation',
+            name='app_token',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+    ]
@@ -1,8 +1,14 @@
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Max
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 import logging
 
+from botticelli import routers
+from botticelli.cache import get_active_games, owned_channels
+
 class State(object):
     Stump = 0
     PendingStump = 1
@@ -11,6 +17,12 @@ class State(object):
     Done = 4
     Cancelled = 5
 
+class OutboxState(object):
+    Pending = 0
+    Sent = 1
+    Failed = 2
+    Cancelled = 3
+
 class Game(models.Model):
     creator = models.CharField(max_length=64)
     letter = models.CharField(max_length=1)
@@ -20,28 +32,83 @@ class Game(models.Model):
     date_updated = models.DateTimeField(auto_now=True)
     date_created = models.DateTimeField(auto_now_add=True)
 
+    # Current turn, kept up to date by transition() so status needs no
+    # extra queries
+    pending_stump = models.ForeignKey('Stump', null=True, blank=True,
+                                      related_name='+', on_delete=models.SET_NULL)
+    pending_question = models.ForeignKey('Question', null=True, blank=True,
+                                         related_name='+', on_delete=models.SET_NULL)
+    latest_stump = models.ForeignKey('Stump', null=True, blank=True,
+                                     related_name='+', on_delete=models.SET_NULL)
+
+    # Rendered question history, see botticelli.transcript
+    transcript = models.TextField(default='', blank=True)
+
     def get_active_stump(self):
-        stumps = self.stump_set.filter(answer=None)
-        if stumps:
-            return stumps[0]
-        return None
+        return self.pending_stump
 
     def get_active_question(self):
-        questions = self.question_set.filter(answer=None)
-        if questions:
-            return questions[0]
-        return None
+        return self.pending_question
 
     def get_most_recent_stump(self):
-        return self.stump_set.all().order_by('-date_created')[0]
+        return self.latest_stump
 
     @staticmethod
     def get_active(channel_id):
-        games = Game.objects.filter(channel=channel_id) \
-            .exclude(state__in=(State.Done, State.Cancelled))
-        if not games:
-            return None
-        return games[0]
+        # A game read from a replica may be behind, so it isn't cached
+        store = routers.read_alias() is None
+        owned = owned_channels()
+        if owned is not None:
+            return owned.get_or_load(channel_id, Game.load_active, store)
+        return get_active_games().get_or_load(channel_id, Game.load_active, store)
+
+    @staticmethod
+    def load_active(channel_id):
+        return Game.objects \
+            .select_related('pending_stump', 'pending_question', 'latest_stump') \
+            .filter(channel=channel_id) \
+            .exclude(state__in=(State.Done, State.Cancelled)).first()
+
+    def transition(self, from_state, to_state, turn=None, answer=None, **fields):
+        """
+        Move the game from from_state to to_state with one conditional
+        UPDATE, and record `answer` on the pending stump or question `turn`
+        in the same transaction. Other game fields passed as keywords
+        (pending_stump=None, transcript=..., ...) are set by the same
+        UPDATE. Returns False, changing nothing, if another request already
+        changed the game or answered the turn. Inside an outer transaction
+        no savepoint is taken, so a loss rolls the outer transaction back
+        too; callers abandon it anyway.
+        """
+        now = timezone.now()
+        with transaction.atomic(savepoint=False):
+            won = Game.objects.filter(id=self.id, state=from_state,
+                                      date_updated=self.date_updated) \
+                .update(state=to_state, date_updated=now, **fields)
+            if won and turn is not None:
+                won = type(turn).objects.filter(id=turn.id, answer=None) \
+                    .update(answer=answer, date_updated=now)
+                if not won:
+                    transaction.set_rollback(True)
+
+        # update() skips the model signals
+        invalidate_channel(self.channel)
+
+        if not won:
+            return False
+
+        self.state = to_state
+        self.date_updated = now
+        for name, value in fields.items():
+            setattr(self, name, value)
+        if turn is not None:
+            turn.answer = answer
+            turn.date_updated = now
+
+        owned = owned_channels()
+        if owned is not None:
+            owned.adopt(self.channel, None if to_state in (State.Done, State.Cancelled) else self)
+        return True
 
     def __str__(self):
         return repr(self)
@@ -64,6 +131,11 @@ class Question(models.Model):
     date_updated = models.DateTimeField(auto_now = True)
     date_created = models.DateTimeField(auto_now_add = True)
 
+    class Meta:
+        # Keyset pagination for history
+        indexes = [models.Index(fields=['game', 'date_created', 'id'],
+                                name='botticelli_question_history')]
+
     def __str__(self):
         return repr(self)
 
@@ -93,3 +165,186 @@ class Stump(models.Model):
                           'Updated: ' + repr(self.date_updated),
                           'Created: ' + repr(self.date_created)])
 
+class GameEvent(models.Model):
+    """One thing that happened to a game, append only, see botticelli.events"""
+    # Not a foreign key, events outlive archived and deleted games
+    game_id = models.IntegerField()
+    channel = models.CharField(max_length=16)
+    kind = models.CharField(max_length=24)
+    actor = models.CharField(max_length=64, blank=True, default='')
+    # JSON: turn id, text, answer, ...
+    data = models.TextField(default='{}')
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['game_id', 'id'])]
+
+    def __str__(self):
+        return repr(self)
+
+    def __repr__(self):
+        return ', '.join(['Game: '    + repr(self.game_id),
+                          'Kind: '    + self.kind,
+                          'Actor: '   + self.actor,
+                          'Data: '    + self.data,
+                          'Created: ' + repr(self.date_created)])
+
+class GameSnapshot(models.Model):
+    """A game's state as of an event, so replay can start there"""
+    game_id = models.IntegerField()
+    last_event_id = models.IntegerField()
+    # JSON of botticelli.events.Projection
+    state = models.TextField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['game_id', '-last_event_id'])]
+
+    def __str__(self):
+        return repr(self)
+
+    def __repr__(self):
+        return ', '.join(['Game: '    + repr(self.game_id),
+                          'Event: '   + repr(self.last_event_id),
+                          'Created: ' + repr(self.date_created)])
+
+class Installation(models.Model):
+    """A workspace Botticelli is installed in, see botticelli.clients"""
+    team_id = models.CharField(max_length=16, unique=True)
+    team_name = models.CharField(max_length=128, blank=True, default='')
+    bot_token = models.CharField(max_length=128)
+    # For a workspace with its own Slack app, see botticelli.socketmode
+    app_token = models.CharField(max_length=128, blank=True, default='')
+    date_updated = models.DateTimeField(auto_now=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return repr(self)
+
+    def __repr__(self):
+        return ', '.join(['Team: '    + self.team_id,
+                          'Name: '    + self.team_name,
+                          'Updated: ' + repr(self.date_updated)])
+
+class Outbox(models.Model):
+    """A Slack Web API call waiting to be made, see botticelli.outbox"""
+    # Workspace whose token makes the call, '' for SLACK_OATH_TOKEN
+    team_id = models.CharField(max_length=16, blank=True, default='')
+    channel = models.CharField(max_length=16)
+    method = models.CharField(max_length=32)
+    payload = models.TextField()
+    state = models.IntegerField(default=OutboxState.Pending)
+    # Pending rows with the same key in a channel collapse into the newest
+    coalesce_key = models.CharField(max_length=32, blank=True, default='')
+    # Message this call threads under or deletes, its ts is filled in on send
+    parent = models.ForeignKey('self', null=True, blank=True,
+                               related_name='+', on_delete=models.SET_NULL)
+    # Stump or Question whose thread_ts is set from the posted message
+    ref_model = models.CharField(max_length=16, blank=True, default='')
+    ref_id = models.IntegerField(null=True, blank=True)
+    result_ts = models.CharField(max_length=32, blank=True, default='')
+    error = models.CharField(max_length=64, blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    not_before = models.DateTimeField(default=timezone.now)
+    date_updated = models.DateTimeField(auto_now=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['state', 'id'])]
+
+    def __str__(self):
+        return repr(self)
+
+    def __repr__(self):
+        return ', '.join(['Channel: ' + self.channel,
+                          'Method: '  + self.method,
+                          'State: '   + repr(self.state),
+                          'Attempts: ' + repr(self.attempts),
+                          'Created: ' + repr(self.date_created)])
+
+class ArchivedGame(models.Model):
+    """A finished game moved out of the hot tables, see botticelli.archive"""
+    # Same id the Game had
+    id = models.IntegerField(primary_key=True)
+    creator = models.CharField(max_length=64)
+    letter = models.CharField(max_length=1)
+    person = models.CharField(max_length=64)
+    channel = models.CharField(max_length=16)
+    state = models.IntegerField()
+    date_updated = models.DateTimeField()
+    date_created = models.DateTimeField()
+    # zlib compressed JSON of the transcript, stumps and questions
+    data = models.BinaryField()
+    date_archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['channel', 'date_created'])]
+
+    def __str__(self):
+        return repr(self)
+
+    def __repr__(self):
+        return ', '.join(['Creator: ' + self.creator,
+                          'Letter: '  + self.letter,
+                          'Channel: ' + self.channel,
+                          'person: '  + self.person,
+                          'state: '   + repr(self.state),
+                          'Created: ' + repr(self.date_created),
+                          'Archived: ' + repr(self.date_archived)])
+
+
+class PlayerStats(models.Model):
+    """
+    Running totals for a user in a channel, kept by botticelli.stats. The
+    row with an empty username holds the channel's totals.
+    """
+    channel = models.CharField(max_length=16)
+    username = models.CharField(max_length=64, blank=True)
+    games_started = models.IntegerField(default=0)
+    # As the one asking
+    stumps_asked = models.IntegerField(default=0)
+    stumps_won = models.IntegerField(default=0)
+    questions_asked = models.IntegerField(default=0)
+    questions_hit = models.IntegerField(default=0)
+    # As the game's creator, answering
+    stumps_faced = models.IntegerField(default=0)
+    stumps_lost = models.IntegerField(default=0)
+    questions_faced = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('channel', 'username')]
+        indexes = [models.Index(fields=['channel', '-stumps_won'])]
+
+    def __str__(self):
+        return repr(self)
+
+    def __repr__(self):
+        return ', '.join(['Channel: ' + self.channel,
+                          'User: '    + self.username,
+                          'Stumps: '  + '%d/%d' % (self.stumps_won, self.stumps_asked),
+                          'Questions: ' + '%d/%d' % (self.questions_hit, self.questions_asked)])
+
+
+def invalidate_channel(channel):
+    cache = get_active_games()
+    cache.invalidate(channel)
+    routers.note_write(channel)
+    transaction.on_commit(lambda: cache.invalidate(channel))
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def game_changed(sender, instance, **kwargs):
+    invalidate_channel(instance.channel)
+
+@receiver(post_save, sender=Stump)
+@receiver(post_delete, sender=Stump)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def turn_changed(sender, instance, **kwargs):
+    if sender.game.is_cached(instance):
+        channel = instance.game.channel
+    else:
+        channel = Game.objects.filter(id=instance.game_id) \
+            .values_list('channel', flat=True).first()
+    if channel:
+        invalidate_channel(channel)
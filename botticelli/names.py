@@ -0,0 +1,153 @@
+"""
+Dictionary of famous names the secret person is checked against.
+
+`manage.py build_names` compiles a list of names, one per line, into a
+sorted file that is memory-mapped rather than read, so opening it is
+instant whatever its size, and every worker process on a host shares one
+copy through the page cache. The file is:
+
+- a header: MAGIC, the byte order and the number of names
+- count + 1 offsets, 8 bytes each in that byte order, into the entries
+- the entries, each the name's key, a NUL and the name as written,
+  sorted by key
+
+A key is the name casefolded with its whitespace collapsed, so lookups
+ignore case and spacing, and prefix search is a binary search for the
+first key at or after the prefix.
+"""
+
+import os
+import sys
+import mmap
+import struct
+import logging
+import threading
+from array import array
+
+logger = logging.getLogger('botticelli')
+
+MAGIC = b'BOTNAMES'
+HEADER = struct.Struct('<8scxxxxxxxQ')
+
+def clean(name):
+    return ' '.join(name.split())
+
+def key_of(name):
+    return clean(name).casefold().encode('utf-8')
+
+def build(names, path):
+    """
+    Write the index of `names` to path, returns how many it holds. The
+    file is replaced in one rename, so running workers keep using the old
+    one until they restart.
+    """
+    entries = {}
+    for name in names:
+        name = clean(name)
+        if name:
+            # The first spelling of a name wins
+            entries.setdefault(key_of(name), name.encode('utf-8'))
+
+    offsets = array('Q', [0])
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, sys.byteorder[0].encode('ascii'), len(entries)))
+        # Offsets are filled in once the entries are written
+        f.seek(HEADER.size + 8 * (len(entries) + 1))
+        for key in sorted(entries):
+            f.write(key + b'\0' + entries[key])
+            offsets.append(f.tell() - HEADER.size - 8 * (len(entries) + 1))
+        f.seek(HEADER.size)
+        offsets.tofile(f)
+    os.replace(tmp, path)
+    return len(entries)
+
+class NameIndex(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byteorder, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or byteorder != sys.byteorder[0].encode('ascii'):
+            self.map.close()
+            raise ValueError('%s is not a names index built on this platform' % path)
+        start = HEADER.size + 8 * (self.count + 1)
+        self.view = memoryview(self.map)
+        self.offsets = self.view[HEADER.size:start].cast('Q')
+        self.entries = start
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        start = self.entries + self.offsets[i]
+        end = self.entries + self.offsets[i + 1]
+        split = self.map.find(b'\0', start, end)
+        return self.map[start:split], self.map[split + 1:end]
+
+    def _key(self, i):
+        start = self.entries + self.offsets[i]
+        return self.map[start:self.map.find(b'\0', start)]
+
+    def _first_at_or_after(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, name):
+        """The name as written in the dictionary, or None"""
+        key = key_of(name)
+        i = self._first_at_or_after(key)
+        if i < self.count:
+            found, written = self._entry(i)
+            if found == key:
+                return written.decode('utf-8')
+        return None
+
+    def prefix(self, text, limit=10, whole_word=False):
+        """
+        Up to `limit` names starting with text, in key order. With
+        `whole_word` the text has to be followed by a space, so "Al"
+        finds "Al Gore" but not "Alan Turing".
+        """
+        key = key_of(text)
+        if whole_word:
+            key += b' '
+        names = []
+        i = self._first_at_or_after(key)
+        while i < self.count and len(names) < limit:
+            found, written = self._entry(i)
+            if not found.startswith(key):
+                break
+            names.append(written.decode('utf-8'))
+            i += 1
+        return names
+
+    def close(self):
+        self.offsets.release()
+        self.view.release()
+        self.map.close()
+
+_names = None
+_names_path = None
+_names_lock = threading.Lock()
+
+def get_names():
+    """The NameIndex at BOTTICELLI_NAMES_PATH, or None when there isn't one"""
+    global _names, _names_path
+    from django.conf import settings
+
+    path = settings.BOTTICELLI_NAMES_PATH
+    with _names_lock:
+        if path != _names_path:
+            _names, _names_path = None, path
+            if path:
+                try:
+                    _names = NameIndex(path)
+                except (OSError, ValueError):
+                    logger.exception('Could not open the names index %s', path)
+        return _names
@@ -0,0 +1,233 @@
+"""
+Durable queue of outbound Slack Web API calls.
+
+Handlers enqueue calls as Outbox rows instead of calling Slack. A single
+dispatcher process (manage.py run_outbox) sends them oldest first, one
+channel head at a time so a channel's messages keep their order, applies
+per-channel and per-method token buckets, and backs off on Slack's
+Retry-After. Rows survive restarts, so nothing is lost when a dyno cycles.
+
+Each head is sent holding its row lock, taken with SKIP LOCKED, so a
+second dispatcher (scaled up, or overlapping during a deploy) moves on
+to other channels instead of sending the same call again. Finished rows
+are deleted once they are older than the retention.
+"""
+
+import json
+import time
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from botticelli.models import Outbox, OutboxState, Stump, Question
+from botticelli.ratelimit import RateLimiter
+
+logger = logging.getLogger('botticelli')
+
+MAX_ATTEMPTS = 5
+
+FINISHED = (OutboxState.Sent, OutboxState.Failed, OutboxState.Cancelled)
+
+# Which argument of the call takes the parent message's ts
+PARENT_ARGS = {
+    'chat.postMessage': 'thread_ts',
+    'chat.delete': 'ts',
+    'chat.update': 'ts',
+}
+
+# Slack errors that may go away on their own, besides ratelimited
+RETRYABLE_ERRORS = {'internal_error', 'fatal_error', 'service_unavailable', 'request_timeout'}
+
+REF_MODELS = {
+    'stump': Stump,
+    'question': Question,
+}
+
+def retryable(error):
+    """Whether a failed call is worth making again, 5xx responses are"""
+    return error in RETRYABLE_ERRORS or error.startswith('http_5')
+
+def enqueue(method, parent=None, ref=None, coalesce_key='', team_id='', **kwargs):
+    """Queue a Web API call and return a reply shaped like Slack's"""
+    row = Outbox.objects.create(team_id=team_id,
+                                channel=kwargs['channel'],
+                                method=method,
+                                payload=json.dumps(kwargs),
+                                parent=parent,
+                                ref_model=type(ref).__name__.lower() if ref else '',
+                                ref_id=ref.id if ref else None,
+                                coalesce_key=coalesce_key)
+    return {'ok': True, 'queued': True, 'outbox': row}
+
+def enqueue_delete(channel, ts, ref=None, team_id=''):
+    """
+    Queue deletion of a message. If we only know the message by the stump
+    or question it was posted for, delete it through its outbox row, or
+    just cancel the row if it hasn't gone out yet.
+    """
+    if ts or ref is None:
+        return enqueue('chat.delete', team_id=team_id, channel=channel, ts=ts)
+
+    post = Outbox.objects.filter(ref_model=type(ref).__name__.lower(), ref_id=ref.id) \
+        .order_by('-id').first()
+    if post is None:
+        return {'ok': False, 'error': 'message_not_found'}
+
+    cancelled = Outbox.objects.filter(id=post.id, state=OutboxState.Pending) \
+        .update(state=OutboxState.Cancelled)
+    if cancelled:
+        return {'ok': True, 'queued': True, 'outbox': post}
+
+    return enqueue('chat.delete', parent=post, team_id=team_id, channel=channel)
+
+class Dispatcher(object):
+    """
+    Sends rows with `slack`, or with the client `clients` has for the
+    row's team, each with its own rate limiter
+    """
+    def __init__(self, slack=None, limiter=None, batch_size=100, poll_interval=0.5,
+                 backoff=5, clients=None, retention=timedelta(days=7), purge_interval=3600):
+        self.slack = slack
+        self.limiter = limiter or RateLimiter()
+        self.clients = clients
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.retention = retention
+        self.purge_interval = purge_interval
+
+    def heads(self, now):
+        """
+        The oldest pending row of each channel that is due by `now`. A
+        channel whose head is backing off waits, without holding up the
+        others however many rows it has queued.
+        """
+        oldest = Outbox.objects.filter(state=OutboxState.Pending) \
+            .values('channel').annotate(head=Min('id')).values('head')
+        return Outbox.objects.filter(id__in=oldest, not_before__lte=now) \
+            .order_by('id')[:self.batch_size]
+
+    def superseded(self, head):
+        """Whether a newer pending row in the channel has head's coalesce key"""
+        return Outbox.objects.filter(state=OutboxState.Pending, channel=head.channel,
+                                     coalesce_key=head.coalesce_key,
+                                     id__gt=head.id).exists()
+
+    def run_once(self):
+        """Send at most one call per channel. Returns the number of calls made."""
+        sent = 0
+        for head in self.heads(timezone.now()):
+            with transaction.atomic():
+                # Gone if another dispatcher is sending it or has since
+                head = Outbox.objects.filter(id=head.id, state=OutboxState.Pending) \
+                    .select_for_update(skip_locked=True).first()
+                if head is not None and self.dispatch(head):
+                    sent += 1
+        return sent
+
+    def dispatch(self, head):
+        """Send a claimed head row, returns whether a call was made"""
+        # Only the newest status message in a channel is worth sending
+        if head.coalesce_key and self.superseded(head):
+            self.finish(head, OutboxState.Cancelled, error='coalesced')
+            return False
+
+        slack, limiter = self.client_for(head)
+        if slack is None:
+            self.finish(head, OutboxState.Failed, error='not_installed')
+            return False
+        if limiter.acquire(head.channel, head.method) > 0:
+            return False
+
+        self.send(head, slack, limiter)
+        return True
+
+    def purge(self, now, batch_size=1000):
+        """
+        Delete finished rows last updated before the retention, keeping
+        any a pending row still threads under. Returns how many went.
+        """
+        parents = Outbox.objects.filter(state=OutboxState.Pending, parent__isnull=False) \
+            .values('parent_id')
+        old = Outbox.objects.filter(state__in=FINISHED, date_updated__lt=now - self.retention) \
+            .exclude(id__in=parents).order_by('id').values_list('id', flat=True)
+        purged = 0
+        while True:
+            ids = list(old[:batch_size])
+            if not ids:
+                return purged
+            purged += Outbox.objects.filter(id__in=ids).delete()[1].get(Outbox._meta.label, 0)
+
+    def client_for(self, row):
+        if self.clients is None:
+            return self.slack, self.limiter
+        slack = self.clients.get(row.team_id)
+        return slack, slack and slack.limiter
+
+    def run_forever(self):
+        next_purge = 0
+        while True:
+            if time.time() >= next_purge:
+                logger.info('Purged %d finished outbox rows', self.purge(timezone.now()))
+                next_purge = time.time() + self.purge_interval
+            if not self.run_once():
+                time.sleep(self.poll_interval)
+
+    def send(self, row, slack, limiter):
+        kwargs = json.loads(row.payload)
+
+        if row.parent_id:
+            if row.parent.state != OutboxState.Sent:
+                self.finish(row, OutboxState.Cancelled, error='parent_not_sent')
+                return
+            kwargs[PARENT_ARGS[row.method]] = row.parent.result_ts
+
+        try:
+            ret = slack.api_call(row.method, **kwargs)
+            transient = False
+        except Exception as e:
+            logger.exception('Outbox %d failed', row.id)
+            ret = {'ok': False, 'error': type(e).__name__}
+            transient = True
+
+        if ret.get('ok'):
+            self.finish(row, OutboxState.Sent, result_ts=ret.get('ts', ''))
+            self.update_ref(row)
+        elif ret.get('error') == 'ratelimited':
+            retry_after = ret.get('retry_after', 1)
+            limiter.block(row.channel, row.method, retry_after)
+            self.retry(row, retry_after, count=False)
+        else:
+            error = ret.get('error', '')
+            logger.warning('Outbox %d %s failed: %s', row.id, row.method, error)
+            # Trying again won't find a deleted channel or fix a token
+            if not (transient or retryable(error)) or row.attempts + 1 >= MAX_ATTEMPTS:
+                self.finish(row, OutboxState.Failed, error=error)
+            else:
+                self.retry(row, self.backoff * 2 ** row.attempts)
+
+    def retry(self, row, seconds, count=True):
+        row.not_before = timezone.now() + timedelta(seconds=seconds)
+        if count:
+            row.attempts += 1
+        row.save(update_fields=['not_before', 'attempts', 'date_updated'])
+
+    def finish(self, row, state, **fields):
+        row.state = state
+        for name, value in fields.items():
+            setattr(row, name, value)
+        row.save(update_fields=['state', 'date_updated'] + list(fields))
+
+    def update_ref(self, row):
+        model = REF_MODELS.get(row.ref_model)
+        if model is None or not row.result_ts:
+            return
+
+        with transaction.atomic():
+            obj = model.objects.filter(id=row.ref_id).first()
+            if obj:
+                obj.thread_ts = row.result_ts
+                obj.save(update_fields=['thread_ts', 'date_updated'])
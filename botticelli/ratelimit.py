@@ -0,0 +1,78 @@
+import time
+import threading
+
+# Slack's documented limits: about one message per second per channel, and
+# per-method tiers across the workspace. (rate per second, burst)
+CHANNEL_RATE = (1.0, 3)
+METHOD_RATES = {
+    'chat.postMessage': (1.0, 20),
+    'chat.delete': (50 / 60.0, 10),
+    'chat.update': (50 / 60.0, 10),
+}
+DEFAULT_METHOD_RATE = (20 / 60.0, 5)
+
+class TokenBucket(object):
+    def __init__(self, rate, burst, clock=time.time):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.stamp = clock()
+        self.blocked_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self):
+        """Seconds until a token is available, 0 if one is available now"""
+        now = self.clock()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill(self.clock())
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Honor a Retry-After from Slack"""
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+        self.tokens = 0
+
+class RateLimiter(object):
+    """Token buckets per channel and per Web API method"""
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.channels = {}
+        self.methods = {}
+        self.lock = threading.Lock()
+
+    def _buckets(self, channel, method):
+        if channel not in self.channels:
+            self.channels[channel] = TokenBucket(*CHANNEL_RATE, clock=self.clock)
+        if method not in self.methods:
+            rate = METHOD_RATES.get(method, DEFAULT_METHOD_RATE)
+            self.methods[method] = TokenBucket(*rate, clock=self.clock)
+        return self.channels[channel], self.methods[method]
+
+    def acquire(self, channel, method):
+        """
+        Take a token from both buckets if both have one and return 0,
+        otherwise take nothing and return how long to wait.
+        """
+        with self.lock:
+            buckets = self._buckets(channel, method)
+            wait = max(bucket.wait_time() for bucket in buckets)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket.take()
+            return wait
+
+    def block(self, channel, method, seconds):
+        with self.lock:
+            for bucket in self._buckets(channel, method):
+                bucket.block(seconds)
@@ -0,0 +1,40 @@
+import bisect
+import hashlib
+
+def hash_key(key):
+    return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16)
+
+class HashRing(object):
+    """
+    Consistent hashing of keys onto nodes. Every node owns `replicas`
+    points on the ring and a key belongs to the first point at or after
+    its hash, so adding a node only moves the keys the new node takes over,
+    about 1/n of them, and every other key stays where it was.
+    """
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.points = []
+        self.owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = hash_key('%s#%d' % (node, i))
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        keep = [(p, o) for p, o in zip(self.points, self.owners) if o != node]
+        self.points = [p for p, _ in keep]
+        self.owners = [o for _, o in keep]
+
+    def nodes(self):
+        return set(self.owners)
+
+    def node_for(self, key):
+        if not self.points:
+            raise ValueError('Hash ring has no nodes')
+        index = bisect.bisect_left(self.points, hash_key(key)) % len(self.points)
+        return self.owners[index]
@@ -0,0 +1,140 @@
+"""
+Sends read-only queries to a read replica when one is configured.
+
+Every query goes to the primary ('default') unless it runs inside
+replica_reads(), which the read-only handlers (status, history, stats,
+leaderboard) wrap their reads in. Even there a read stays on the primary
+when
+
+- the unit of work (one Slack delivery, see views.run_slash) has written
+  anything, so a reply never shows state older than the write it follows
+- the channel was written in the last BOTTICELLI_REPLICA_PIN_SECONDS, so
+  a status right after clicking a button doesn't race the replica's lag
+- it runs inside a transaction on the primary
+
+Replicas are the database aliases in BOTTICELLI_REPLICAS, see settings.
+"""
+
+import time
+import random
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+def reset():
+    _state.pinned = False
+    _state.replica = False
+
+@contextmanager
+def unit_of_work():
+    """Reads and writes of one delivery, pinned to the primary once it writes"""
+    reset()
+    try:
+        yield
+    finally:
+        reset()
+
+def pin():
+    _state.pinned = True
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+@contextmanager
+def replica_reads(channel):
+    """Let reads about `channel` go to a replica, see the module docstring"""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = bool(settings.BOTTICELLI_REPLICAS) and \
+        not get_recent_writes().contains(channel)
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+def note_write(channel):
+    """Keep the channel's reads on the primary for a while, called on every write"""
+    if settings.BOTTICELLI_REPLICAS:
+        get_recent_writes().note(channel)
+
+def read_alias():
+    """The replica the next read should use, or None for the primary"""
+    if not getattr(_state, 'replica', False) or is_pinned():
+        return None
+    replicas = settings.BOTTICELLI_REPLICAS
+    if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    return random.choice(replicas)
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        return read_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+class RecentWrites(object):
+    """
+    Channels written in the last `seconds`, at most `size` of them per
+    process. If `shared` is a Django cache, a write is recorded there too,
+    so reads on other worker processes also stay on the primary.
+    """
+    def __init__(self, seconds=5, size=10000, shared=None, clock=time.time):
+        self.seconds = seconds
+        self.size = size
+        self.shared = shared
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _shared_key(self, channel):
+        return 'botticelli:written:%s' % channel
+
+    def note(self, channel):
+        if self.seconds <= 0:
+            return
+        with self.lock:
+            self.entries[channel] = self.clock() + self.seconds
+            self.entries.move_to_end(channel)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(channel), 1, self.seconds)
+
+    def contains(self, channel):
+        if self.seconds <= 0:
+            return False
+        with self.lock:
+            expires = self.entries.get(channel)
+            if expires is not None:
+                if expires > self.clock():
+                    return True
+                del self.entries[channel]
+        return self.shared is not None and self.shared.get(self._shared_key(channel)) is not None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_recent_writes = None
+_recent_writes_lock = threading.Lock()
+
+def get_recent_writes():
+    global _recent_writes
+    from django.core.cache import caches
+
+    with _recent_writes_lock:
+        if _recent_writes is None:
+            backend = settings.BOTTICELLI_GAME_CACHE_BACKEND
+            _recent_writes = RecentWrites(seconds=settings.BOTTICELLI_REPLICA_PIN_SECONDS,
+                                          shared=caches[backend] if backend else None)
+        return _recent_writes
@@ -17,34 +17,119 @@ DEBUG = os.environ.get('BOTTICELLI_DEBUG') == 'TRUE'
 
 SLACK_OATH_TOKEN = os.environ.get('SLACK_OATH_TOKEN', '')
 
+# Requests to the Slack endpoints must be signed with it, see botticelli.signing
+SLACK_SIGNING_SECRET = os.environ.get('SLACK_SIGNING_SECRET', '')
+# App-level token (xapp-...) for receiving over Socket Mode instead of
+# HTTP, see botticelli.socketmode
+SLACK_APP_TOKEN = os.environ.get('SLACK_APP_TOKEN', '')
+
+# Outbound HTTP to Slack
+SLACK_API_URL = os.environ.get('SLACK_API_URL', 'https://slack.com/api/')
+SLACK_HTTP_POOL_SIZE = int(os.environ.get('SLACK_HTTP_POOL_SIZE', 10))
+SLACK_HTTP_CONNECT_TIMEOUT = float(os.environ.get('SLACK_HTTP_CONNECT_TIMEOUT', 3.05))
+SLACK_HTTP_READ_TIMEOUT = float(os.environ.get('SLACK_HTTP_READ_TIMEOUT', 10))
+
+# Channel-affine workers that keep live games in memory and commit in
+# batches, see botticelli.engine. Needs the outbox and deferred handling.
+BOTTICELLI_ENGINE = os.environ.get('BOTTICELLI_ENGINE') == 'TRUE'
+BOTTICELLI_ENGINE_BATCH = int(os.environ.get('BOTTICELLI_ENGINE_BATCH', 16))
+
+# Queue Web API calls in the outbox table for `manage.py run_outbox`,
+# which deletes finished calls after this many days
+SLACK_OUTBOX = os.environ.get('SLACK_OUTBOX') == 'TRUE' or BOTTICELLI_ENGINE
+SLACK_OUTBOX_RETENTION_DAYS = float(os.environ.get('SLACK_OUTBOX_RETENTION_DAYS', 7))
+
+# Slack clients kept for the most recently active workspaces, each with
+# its own connection pool and rate limits. Entries are reloaded after
+# SLACK_CLIENT_TTL seconds so token changes reach every process.
+SLACK_CLIENT_POOL_SIZE = int(os.environ.get('SLACK_CLIENT_POOL_SIZE', 32))
+SLACK_CLIENT_TTL = float(os.environ.get('SLACK_CLIENT_TTL', 300))
+
+# Active game cache; set the backend to a CACHES alias to share
+# invalidations between worker processes
+BOTTICELLI_GAME_CACHE_SIZE = int(os.environ.get('BOTTICELLI_GAME_CACHE_SIZE', 256))
+BOTTICELLI_GAME_CACHE_TTL = float(os.environ.get('BOTTICELLI_GAME_CACHE_TTL', 30))
+BOTTICELLI_GAME_CACHE_BACKEND = os.environ.get('BOTTICELLI_GAME_CACHE_BACKEND', '')
+
+# Share /metrics between worker processes through files in this directory
+BOTTICELLI_METRICS_DIR = os.environ.get('BOTTICELLI_METRICS_DIR', '')
+BOTTICELLI_METRICS_FLUSH_INTERVAL = float(os.environ.get('BOTTICELLI_METRICS_FLUSH_INTERVAL', 5))
+
+# Acknowledge Slack immediately and handle commands on a background pool
+BOTTICELLI_DEFERRED = os.environ.get('BOTTICELLI_DEFERRED') == 'TRUE' or BOTTICELLI_ENGINE
+BOTTICELLI_WORKERS = int(os.environ.get('BOTTICELLI_WORKERS', 4))
+BOTTICELLI_QUEUE_SIZE = int(os.environ.get('BOTTICELLI_QUEUE_SIZE', 64))
+BOTTICELLI_QUEUE_TIMEOUT = float(os.environ.get('BOTTICELLI_QUEUE_TIMEOUT', 0.5))
+BOTTICELLI_DRAIN_TIMEOUT = float(os.environ.get('BOTTICELLI_DRAIN_TIMEOUT', 10))
+
+# Repeated Slack deliveries are dropped for this long, see botticelli.idempotency
+BOTTICELLI_DEDUPE_TTL = float(os.environ.get('BOTTICELLI_DEDUPE_TTL', 300))
+BOTTICELLI_DEDUPE_SIZE = int(os.environ.get('BOTTICELLI_DEDUPE_SIZE', 10000))
+BOTTICELLI_DEDUPE_BACKEND = os.environ.get('BOTTICELLI_DEDUPE_BACKEND', '')
+
+# Questions and stumpers sharing at least this share of their character
+# trigrams with an earlier one in the game are turned back, 0 turns the
+# check off; indexes are kept for this many games, see botticelli.similar
+BOTTICELLI_SIMILAR_THRESHOLD = float(os.environ.get('BOTTICELLI_SIMILAR_THRESHOLD', 0.7))
+BOTTICELLI_SIMILAR_GAMES = int(os.environ.get('BOTTICELLI_SIMILAR_GAMES', 1000))
+
+# Name dictionary built by `manage.py build_names`; when set, start only
+# takes people in it, see botticelli.names
+BOTTICELLI_NAMES_PATH = os.environ.get('BOTTICELLI_NAMES_PATH', '')
+
+# Finished games older than this many days move to ArchivedGame
+BOTTICELLI_ARCHIVE_DAYS = int(os.environ.get('BOTTICELLI_ARCHIVE_DAYS', 30))
+BOTTICELLI_ARCHIVE_BATCH = int(os.environ.get('BOTTICELLI_ARCHIVE_BATCH', 100))
+
 if DEBUG:
     logger.info('Running in DEBUG mode')
+elif not SLACK_SIGNING_SECRET:
+    logger.warning('SLACK_SIGNING_SECRET is not set, the Slack endpoints will refuse every request')
 
 ALLOWED_HOSTS = ['*']
 
 
 # Application definition
 
-INSTALLED_APPS = [
-    'django.contrib.admin',
-    'django.contrib.auth',
-    'django.contrib.contenttypes',
-    'django.contrib.sessions',
-    'django.contrib.messages',
-    'django.contrib.staticfiles',
-    'botticelli',
-    'django_nose'
-]
+# 'webhook' serves only the Slack endpoints, /ping and /metrics: no admin,
+# auth, sessions or static files, so a worker starts and answers sooner.
+# Migrations and management commands want the full profile.
+BOTTICELLI_PROFILE = os.environ.get('BOTTICELLI_PROFILE', 'full')
 
-MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-]
+if BOTTICELLI_PROFILE == 'webhook':
+    INSTALLED_APPS = [
+        'botticelli',
+    ]
+
+    MIDDLEWARE = [
+        'botticelli.logs.RequestIdMiddleware',
+        'botticelli.metrics.MetricsMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    ]
+else:
+    INSTALLED_APPS = [
+        'django.contrib.admin',
+        'django.contrib.auth',
+        'django.contrib.contenttypes',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+        'botticelli',
+        'django_nose'
+    ]
+
+    MIDDLEWARE = [
+        'botticelli.logs.RequestIdMiddleware',
+        'botticelli.metrics.MetricsMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ]
 
 ROOT_URLCONF = 'botticelli.urls'
 
@@ -64,20 +149,33 @@ TEMPLATES = [
     },
 ]
 
+# Records are written by a listener thread so requests never wait on
+# stdout. Set BOTTICELLI_LOG_FORMAT=text for the plain format when
+# running locally.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'default'
+            'class': 'botticelli.logs.AsyncHandler',
+            'queue_size': int(os.environ.get('BOTTICELLI_LOG_QUEUE_SIZE', 10000)),
+            'formatter': os.environ.get('BOTTICELLI_LOG_FORMAT', 'json'),
         },
     },
     'formatters': {
-        'default': {
-            'format': '%(levelname)s %(asctime)s %(message)s'
+        'json': {
+            '()': 'botticelli.logs.JsonFormatter',
+        },
+        'text': {
+            'format': '%(levelname)s %(asctime)s %(request_id)s %(message)s'
         }
     },
+    'filters': {
+        'sample': {
+            '()': 'botticelli.logs.SampleFilter',
+            'rate': float(os.environ.get('BOTTICELLI_LOG_SAMPLE_RATE', 1.0)),
+        },
+    },
     'loggers': {
         'django': {
             'handlers': ['console'],
@@ -87,9 +185,12 @@ LOGGING = {
             'handlers': ['console'],
             'level': os.getenv('BOTTICELLI_LOG_LEVEL', 'INFO'),
         },
+        # Per-call detail, sampled by BOTTICELLI_LOG_SAMPLE_RATE
+        'botticelli.calls': {
+            'filters': ['sample'],
+        },
     },
 }
-
 logging.config.dictConfig(LOGGING)
 
 WSGI_APPLICATION = 'botticelli.wsgi.application'
@@ -106,9 +207,52 @@ if 'test' in sys.argv:
 else:
     db = dj_database_url.parse(os.environ['DATABASE_URL'])
 
-DATABASES = {
-    'default': db
-}
+# How database connections are kept, see botticelli.db: '' opens one per
+# request, 'persistent' keeps each thread's connection, 'pool' shares a
+# bounded pool between a process's threads
+BOTTICELLI_DB_POOL = os.environ.get('BOTTICELLI_DB_POOL', '')
+BOTTICELLI_DB_MAX_LIFETIME = int(os.environ.get('BOTTICELLI_DB_MAX_LIFETIME', 600))
+
+if BOTTICELLI_DB_POOL:
+    db['ENGINE'] = 'botticelli.db'
+    db['CONN_MAX_AGE'] = BOTTICELLI_DB_MAX_LIFETIME if BOTTICELLI_DB_POOL == 'persistent' else 0
+    db['POOL'] = {
+        'MODE': BOTTICELLI_DB_POOL,
+        'MIN_SIZE': int(os.environ.get('BOTTICELLI_DB_POOL_MIN', 1)),
+        'MAX_SIZE': int(os.environ.get('BOTTICELLI_DB_POOL_MAX', 10)),
+        # Seconds to wait for a free connection
+        'TIMEOUT': float(os.environ.get('BOTTICELLI_DB_POOL_TIMEOUT', 5)),
+        'MAX_LIFETIME': BOTTICELLI_DB_MAX_LIFETIME,
+        # Ping a connection that sat idle this long before using it
+        'CHECK_AFTER': float(os.environ.get('BOTTICELLI_DB_CHECK_AFTER', 30)),
+    }
+
+# Read replicas, comma separated database URLs. Status, history, stats and
+# leaderboard reads go to one of them, see botticelli.routers
+BOTTICELLI_REPLICA_URLS = [url.strip() for url in
+                           os.environ.get('BOTTICELLI_REPLICA_URLS', '').split(',') if url.strip()]
+# Seconds a channel's reads stay on the primary after a write to it, longer
+# than the replicas usually lag
+BOTTICELLI_REPLICA_PIN_SECONDS = float(os.environ.get('BOTTICELLI_REPLICA_PIN_SECONDS', 5))
+
+replicas = {}
+if 'test' in sys.argv:
+    # A second database for the router tests, which route to it with
+    # override_settings(BOTTICELLI_REPLICAS=['replica'])
+    replicas['replica'] = dj_database_url.parse('postgres://localhost/testreplica')
+    BOTTICELLI_REPLICAS = []
+else:
+    for number, url in enumerate(BOTTICELLI_REPLICA_URLS, 1):
+        replicas['replica%d' % number] = dj_database_url.parse(url)
+    BOTTICELLI_REPLICAS = sorted(replicas)
+
+for replica in replicas.values():
+    for key in ('ENGINE', 'CONN_MAX_AGE', 'POOL'):
+        if key in db:
+            replica[key] = db[key]
+
+DATABASES = dict(replicas, default=db)
+DATABASE_ROUTERS = ['botticelli.routers.ReplicaRouter']
 
 logger.info('Using db %s as %s', db['NAME'], db['USER'])
 
@@ -0,0 +1,36 @@
+"""
+Slack request signing.
+
+Slack signs every request with the app's signing secret:
+X-Slack-Signature is "v0=" plus the hex HMAC-SHA256 of
+"v0:<X-Slack-Request-Timestamp>:<raw body>". Requests older than
+MAX_AGE seconds are refused too, so a captured request can't be replayed.
+With no SLACK_SIGNING_SECRET configured every request is refused, unless
+DEBUG is on for local development.
+"""
+
+import hmac
+import time
+import hashlib
+
+from django.conf import settings
+
+MAX_AGE = 300
+
+def signature(secret, timestamp, body):
+    message = b'v0:' + timestamp.encode('utf-8') + b':' + body
+    return 'v0=' + hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def verify(request, now=None):
+    """True if the request carries a valid, recent Slack signature"""
+    secret = settings.SLACK_SIGNING_SECRET
+    if not secret:
+        return settings.DEBUG
+
+    timestamp = request.META.get('HTTP_X_SLACK_REQUEST_TIMESTAMP', '')
+    given = request.META.get('HTTP_X_SLACK_SIGNATURE', '')
+    if not timestamp.isdigit() or not given:
+        return False
+    if abs((now or time.time()) - int(timestamp)) > MAX_AGE:
+        return False
+    return hmac.compare_digest(signature(secret, timestamp, request.body), given)
@@ -0,0 +1,198 @@
+"""
+Spots a question or stumper the game has already seen.
+
+Texts are compared by their character trigrams, after lowercasing and
+dropping punctuation, so "Are you alive?" matches "are u alive" but not
+"are you a live action hero". Each game's earlier texts are kept in a
+TextIndex, an inverted index from trigram to text, so a check only
+touches texts sharing a trigram with the new one.
+
+Indexes are built on a game's first check and then kept up to date
+incrementally, without reading the question history:
+
+- questions come from the game's transcript, which already holds every
+  question in order with its answer; only lines added since the last
+  check are indexed, and lines a cancel removed are dropped
+- stumpers are read with id > the last one indexed, and only when the
+  game's latest_stump is newer than that, so usually no query is made
+
+The indexes of at most BOTTICELLI_SIMILAR_GAMES games are kept per
+process, and a game's are dropped when it is cancelled.
+"""
+
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+from botticelli import transcript
+
+def normalize(text):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+def trigrams(text):
+    padded = ' %s ' % normalize(text)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TextIndex(object):
+    """Texts in the order they were added, with a trigram to text index"""
+    def __init__(self):
+        # (key, text, trigrams)
+        self.entries = []
+        self.postings = defaultdict(set)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, text):
+        grams = trigrams(text)
+        position = len(self.entries)
+        self.entries.append((key, text, grams))
+        for gram in grams:
+            self.postings[gram].add(position)
+
+    def truncate(self, length):
+        """Drop the entries from position `length` on"""
+        while len(self.entries) > length:
+            position = len(self.entries) - 1
+            _, _, grams = self.entries.pop()
+            for gram in grams:
+                self.postings[gram].discard(position)
+
+    def match(self, text, threshold):
+        """
+        The (key, text, score) of the most similar entry whose Jaccard
+        similarity of trigrams is at least threshold, or None
+        """
+        grams = trigrams(text)
+        shared = defaultdict(int)
+        for gram in grams:
+            for position in self.postings.get(gram, ()):
+                shared[position] += 1
+
+        best = None
+        for position, count in shared.items():
+            key, earlier, earlier_grams = self.entries[position]
+            score = count / (len(grams) + len(earlier_grams) - count)
+            if score >= threshold and (best is None or score > best[2]):
+                best = (key, earlier, score)
+        return best
+
+class GameIndex(object):
+    def __init__(self):
+        self.questions = TextIndex()
+        self.stumps = TextIndex()
+        self.last_stump_id = 0
+
+    def sync_questions(self, lines):
+        """Bring the question index in line with the transcript's lines"""
+        kept = 0
+        for (_, text, _), line in zip(self.questions.entries, lines):
+            if text != line[0]:
+                break
+            kept += 1
+        self.questions.truncate(kept)
+        for position in range(kept, len(lines)):
+            self.questions.add(position, lines[position][0])
+
+    def add_stump(self, id, text):
+        if id > self.last_stump_id:
+            self.stumps.add(id, text)
+            self.last_stump_id = id
+
+def new_stumps(game, last_stump_id):
+    """(id, text) of the game's stumpers after last_stump_id, oldest first"""
+    from botticelli.models import Stump
+
+    if not game.latest_stump_id or game.latest_stump_id <= last_stump_id:
+        return []
+    return list(Stump.objects.filter(game_id=game.id, id__gt=last_stump_id)
+                .order_by('id').values_list('id', 'text'))
+
+def transcript_lines(text):
+    """(question, status) for every question in a game's transcript"""
+    lines = []
+    for section in transcript.sections(text):
+        for line in section.split('\n'):
+            if line == transcript.HEADER:
+                continue
+            question, _, status = line.rpartition(': ')
+            lines.append((question, status))
+    return lines
+
+class SimilarityIndexes(object):
+    """GameIndexes of the most recently checked games"""
+    def __init__(self, threshold=0.7, size=1000):
+        self.threshold = threshold
+        self.size = size
+        self.games = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _index(self, game_id):
+        index = self.games.get(game_id)
+        if index is None:
+            index = self.games[game_id] = GameIndex()
+            while len(self.games) > self.size:
+                self.games.popitem(last=False)
+        self.games.move_to_end(game_id)
+        return index
+
+    def question(self, game, text):
+        """The (earlier question, its status) that text repeats, or None"""
+        if self.threshold <= 0:
+            return None
+        lines = transcript_lines(game.transcript)
+        with self.lock:
+            index = self._index(game.id)
+            index.sync_questions(lines)
+            match = index.questions.match(text, self.threshold)
+        if match is None:
+            return None
+        return lines[match[0]]
+
+    def stump(self, game, text):
+        """The (earlier stumper, its answer) that text repeats, or None"""
+        from botticelli.models import Stump
+
+        if self.threshold <= 0:
+            return None
+        with self.lock:
+            index = self._index(game.id)
+            last_stump_id = index.last_stump_id
+        # Read without the lock, so other games' checks don't wait on the query
+        stumps = new_stumps(game, last_stump_id)
+        with self.lock:
+            for id, earlier in stumps:
+                index.add_stump(id, earlier)
+            match = index.stumps.match(text, self.threshold)
+        if match is None:
+            return None
+        # A cancelled stumper is deleted, it doesn't count
+        answers = list(Stump.objects.filter(id=match[0]).values_list('answer', flat=True))
+        if not answers:
+            return None
+        return match[1], answers[0]
+
+    def add_stump(self, game, stump):
+        with self.lock:
+            self._index(game.id).add_stump(stump.id, stump.text)
+
+    def forget(self, game_id):
+        with self.lock:
+            self.games.pop(game_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.games.clear()
+
+_indexes = None
+_indexes_lock = threading.Lock()
+
+def get_indexes():
+    global _indexes
+    from django.conf import settings
+
+    with _indexes_lock:
+        if _indexes is None:
+            _indexes = SimilarityIndexes(threshold=settings.BOTTICELLI_SIMILAR_THRESHOLD,
+                                         size=settings.BOTTICELLI_SIMILAR_GAMES)
+        return _indexes
@@ -1,62 +1,154 @@
 import re
 import json
 import logging
-import requests
-import slackclient
 
+from django.conf import settings
+from django.db import transaction, IntegrityError
+
+from botticelli import events, history, names, outbox, routers, similar, stats, transcript
+from botticelli.cache import owned_channels
+from botticelli.ratelimit import RateLimiter
+from botticelli.transport import get_transport
 from botticelli.models import Game, Question, Stump, State
 
 logger = logging.getLogger('botticelli')
+call_logger = logging.getLogger('botticelli.calls')
+
+STATE_CHANGED = 'The game changed while you were typing, check status and try again'
+REPEATED_QUESTION = 'Already asked: *%s* - %s\nTo ask it anyway: /botticelli ask !%s'
+REPEATED_STUMP = 'Already asked: *%s* - %s\nTo ask it anyway: /botticelli stump !%s'
+# Names shown by suggest and for an unknown person
+SUGGESTIONS = 10
 
 class SlackException(Exception):
     pass
 
 class Slack(object):
-    def __init__(self, token):
-        self.client = slackclient.SlackClient(token)
+    def __init__(self, token, transport=None, use_outbox=None, team_id=''):
+        self.token = token
+        self.transport = transport or get_transport()
+        if use_outbox is None:
+            use_outbox = settings.SLACK_OUTBOX
+        self.use_outbox = use_outbox
+        self.team_id = team_id
+        # The outbox dispatcher paces this workspace's calls with it
+        self.limiter = RateLimiter()
+
+    def api_call(self, method, **kwargs):
+        ret = self.transport.api_call(method, self.token, **kwargs)
+        if not ret.get('ok'):
+            logger.warning('%s failed: %s', method, ret.get('error'))
+        return ret
+
+    def send_message(self, text, channel, attachments=[], ref=None, coalesce_key=''):
+        """
+        Post a message, or queue it when the outbox is on. If `ref` is a
+        Stump or Question its thread_ts is set to the posted message's ts.
+        """
+        call_logger.info('posting message %s %s %s', text, channel, attachments)
+        if self.use_outbox:
+            return outbox.enqueue('chat.postMessage',
+                                  team_id=self.team_id,
+                                  ref=ref,
+                                  coalesce_key=coalesce_key,
+                                  text=text,
+                                  channel=channel,
+                                  attachments=attachments)
 
-    def send_message(self, text, channel, attachments=[]):
-        logger.info('posting message %s %s %s', text, channel, repr(attachments))
-        ret = self.client.api_call('chat.postMessage',
-                                   text=text,
-                                   channel=channel,
-                                   attachments=attachments)
+        ret = self.api_call('chat.postMessage',
+                            text=text,
+                            channel=channel,
+                            attachments=attachments)
 
-        logger.info(ret)
+        call_logger.info('chat.postMessage: %s', ret)
+        if ref is not None and ret.get('ok'):
+            ref.thread_ts = ret['ts']
+            ref.save()
         return ret
  
-    def delete_message(self, channel, thread_ts):
-        logger.info('deleting %s %s', channel, thread_ts)
-        rc = self.client.api_call('chat.delete',
-                                  channel=channel,
-                                  ts=thread_ts)
+    def delete_message(self, channel, thread_ts, ref=None):
+        call_logger.info('deleting %s %s', channel, thread_ts)
+        if self.use_outbox:
+            return outbox.enqueue_delete(channel, thread_ts, ref, self.team_id)
+
+        rc = self.api_call('chat.delete',
+                           channel=channel,
+                           ts=thread_ts)
 
-        logger.info(rc)
+        call_logger.info('chat.delete: %s', rc)
         return rc
 
-    def send_thread_message(self, text, channel, thread_ts):
-        rc = self.client.api_call('chat.postMessage',
+    def delete_on_commit(self, channel, thread_ts, ref):
+        """
+        Delete a message as part of the current transaction: the outbox
+        row is queued in it, a direct call waits until it commits, so the
+        transaction isn't held open across Slack and a rollback keeps the
+        message
+        """
+        if self.use_outbox:
+            self.delete_message(channel, thread_ts, ref)
+            return
+
+        def delete():
+            try:
+                self.delete_message(channel, thread_ts, ref)
+            except Exception:
+                logger.exception('Deleting %s %s failed', channel, thread_ts)
+        transaction.on_commit(delete)
+
+    def send_thread_message(self, text, channel, parent):
+        """
+        Reply in the thread of `parent`, a message ts or the reply
+        send_message() gave for it, which may still be queued
+        """
+        if isinstance(parent, dict):
+            if self.use_outbox and 'outbox' in parent:
+                return outbox.enqueue('chat.postMessage',
+                                      team_id=self.team_id,
+                                      parent=parent['outbox'],
+                                      text=text,
+                                      channel=channel)
+            parent = parent.get('ts')
+
+        if self.use_outbox:
+            return outbox.enqueue('chat.postMessage',
+                                  team_id=self.team_id,
                                   text=text,
                                   channel=channel,
-                                  thread_ts=thread_ts)
-        logger.info(rc)
-        return rc
+                                  thread_ts=parent)
 
-    def handle_slash(self, data):
-        logger.info(data)
-
-        action, params = parse_slash_command(data['text'])
+        rc = self.api_call('chat.postMessage',
+                           text=text,
+                           channel=channel,
+                           thread_ts=parent)
+        call_logger.info('chat.postMessage: %s', rc)
+        return rc
 
-        func = {
+    def slash_handlers(self):
+        return {
             'status': self.handle_status,
             'help': self.handle_help,
             'ask': self.handle_question,
             'stump': self.handle_stump,
             'start': self.handle_start,
-            'cancel': self.handle_cancel
-        }.get(action) or self.handle_help
+            'cancel': self.handle_cancel,
+            'stats': self.handle_stats,
+            'leaderboard': self.handle_leaderboard,
+            'history': self.handle_history,
+            'suggest': self.handle_suggest,
+        }
+
+    def slash_action(self, data):
+        """The slash command's action, or 'help' for anything unknown"""
+        action = parse_slash_command(data['text'])[0]
+        return action if action in self.slash_handlers() else 'help'
 
-        logger.info('action %s, params %s' % (action, params))
+    def handle_slash(self, data):
+        action, params = parse_slash_command(data['text'])
+
+        func = self.slash_handlers().get(action) or self.handle_help
+
+        call_logger.info('action %s, params %s', action, params)
 
         func(data, params)
 
@@ -98,29 +190,7 @@ class Slack(object):
                 'Currently waiting on *<@%s|user>* to *%s*' % (waiting_on, to_do)
             ]
 
-            questions = game.question_set.all().order_by('date_created')
-
-            if questions:
-                sub_lines = ['Previous questions:']
-                next_msg = [] 
-                for question in questions:
-                    if question.answer is None:
-                        status = 'Pending'
-                    elif question.answer:
-                        status = 'Yes'
-                    else:
-                        status = 'No'
-
-                    next_msg.append('%s: %s' % (question.text, status))
-
-                    if not question.answer:
-                        sub_lines.append('\n'.join(next_msg))
-                        next_msg = []
-
-                if next_msg:
-                    sub_lines.append('\n'.join(next_msg))
-
-                status_lines['sub_lines'] = sub_lines
+            status_lines['sub_lines'] = transcript.sections(game.transcript)
 
             status_lines['footer'] = "**************************************"
 
@@ -130,7 +200,8 @@ class Slack(object):
         channel = data['channel_id']
         url = data['response_url']
 
-        status = self.get_status(channel)
+        with routers.replica_reads(channel):
+            status = self.get_status(channel)
 
         text = '\n'.join( \
             [status['header']] + \
@@ -146,38 +217,99 @@ class Slack(object):
         url = data['response_url']
         username = data['user_name']
 
+        if type not in ('game', 'stump', 'question'):
+            raise SlackException("No cancel argument provided")
+
+        game = Game.get_active(channel_id)
+        if not game:
+            raise SlackException("No active game")
+
         if type == 'game':
-            game = Game.get_active(channel_id)
-            game.state = State.Cancelled
-            game.save()
+            with transaction.atomic():
+                if not game.transition(game.state, State.Cancelled):
+                    raise SlackException(STATE_CHANGED)
+                events.record(game, events.CANCELLED, username, target='game', id=game.id)
+            similar.get_indexes().forget(game.id)
             text = '*%s* cancelled current game' % username
             self.reply_text(text, url)
         elif type == 'stump':
-            game = Game.get_active(channel_id)
             stump = game.get_active_stump()
             if stump:
-                stump.game.state = State.Stump
-                stump.game.save()
-                stump.delete()
+                with transaction.atomic():
+                    if not game.transition(State.PendingStump, State.Stump,
+                                           pending_stump=None, latest_stump=None):
+                        raise SlackException(STATE_CHANGED)
+                    events.record(game, events.CANCELLED, username, target='stump', id=stump.id)
+                    self.delete_on_commit(channel_id, stump.thread_ts, stump)
+                    stump.delete()
                 text = '*%s* cancelled current stump' % username
-                self.delete_message(channel_id, stump.thread_ts)
                 self.reply_text(text, url)
             else:
                 self.reply_ephemeral_text('No active stump to cancel!', url)
         elif type == 'question':
-            game = Game.get_active(channel_id)
             question = game.get_active_question()
             if question:
-                question.game.state = State.Question
-                question.game.save()
-                question.delete()
+                with transaction.atomic():
+                    if not game.transition(State.PendingQuestion, State.Question,
+                                           pending_question=None,
+                                           transcript=transcript.remove_question(game.transcript)):
+                        raise SlackException(STATE_CHANGED)
+                    events.record(game, events.CANCELLED, username,
+                                  target='question', id=question.id)
+                    self.delete_on_commit(channel_id, question.thread_ts, question)
+                    question.delete()
                 text = '*%s* cancelled current question' % username
-                self.delete_message(channel_id, question.thread_ts)
                 self.reply_text(text, url)
             else:
                 self.reply_ephemeral_text('No active question to cancel!', url)
-        else:
-            raise SlackException("No cancel argument provided")
+
+    def handle_history(self, data, page):
+        channel_id = data['channel_id']
+        if page and not page.isdigit():
+            raise SlackException("History takes a page number, like: history 2")
+        page = int(page or 1)
+
+        with routers.replica_reads(channel_id):
+            game = Game.get_active(channel_id)
+            if not game:
+                raise SlackException("No active game")
+
+            posted = history.post_history(self, game, channel_id, page)
+        if not posted:
+            self.reply_ephemeral_text('No questions on page %d' % page, data['response_url'])
+
+    def handle_stats(self, data, username):
+        channel_id = data['channel_id']
+        username = username.lstrip('@') or data['user_name']
+
+        with routers.replica_reads(channel_id):
+            user, channel = stats.get_stats(channel_id, username)
+        lines = [
+            '*%s* in this channel:' % username,
+            'Stumped the creator with %s' % ratio(user.stumps_won, user.stumps_asked, 'stumper'),
+            'Got a yes to %s' % ratio(user.questions_hit, user.questions_asked, 'question'),
+            'Was stumped by %s, answered %d questions and started %d games' % (
+                ratio(user.stumps_lost, user.stumps_faced, 'stumper'),
+                user.questions_faced, user.games_started),
+            'Channel: %d games, %s stumped, %s answered yes' % (
+                channel.games_started,
+                ratio(channel.stumps_won, channel.stumps_asked, 'stumper'),
+                ratio(channel.questions_hit, channel.questions_asked, 'question')),
+        ]
+        self.reply_ephemeral_text('\n'.join(lines), data['response_url'])
+
+    def handle_leaderboard(self, data, _):
+        with routers.replica_reads(data['channel_id']):
+            leaders = stats.leaderboard(data['channel_id'])
+        if not leaders:
+            self.reply_ephemeral_text('Nobody has stumped anyone yet!', data['response_url'])
+            return
+
+        lines = ['*Top stumpers*']
+        for place, row in enumerate(leaders, 1):
+            lines.append('%d. *%s* - %s' % (place, row.username,
+                                            ratio(row.stumps_won, row.stumps_asked, 'stumper')))
+        self.reply_text('\n'.join(lines), data['response_url'])
 
     def handle_help(self, data, _):
         text = """
@@ -189,41 +321,71 @@ class Slack(object):
             Ex: /botticelli stump did you write some dumb book?
         *ask* - Ask a round 2 question
             Ex: /botticelli ask are you alive?
+            Start with ! to ask something close to an earlier question or stumper
         *cancel* - Cancel the game
             Ex: /botticell cancel game
+        *history* - Post the game's questions in a thread, a page at a time
+            Ex: /botticelli history 2
+        *stats* - Show your stats in this channel, or someone else's
+            Ex: /botticelli stats @bob
+        *leaderboard* - Show the channel's best stumpers
+        *suggest* - Show famous names starting with some text, only to you
+            Ex: /botticelli suggest Ada L
         """
         self.reply_ephemeral_text(text, data['response_url'])
 
 
     def handle_start(self, data, person):
+        person, force = strip_force(person)
+        person = names.clean(person)
         if not person:
             raise SlackException("Must start botticelli by providing a person!")
 
+        index = names.get_names()
+        if index is not None and not force:
+            known = index.lookup(person)
+            if known is None:
+                raise SlackException(unknown_person(index, person))
+            person = known
+
         letter = person.split(' ')[-1][0].upper()
         channel_id = data['channel_id']
         username = data['user_name']
         url = data['response_url']
 
-        # Get active games
-        games = Game.get_active(channel_id)
-
-        # Validate state
-        if games:
-            raise SlackException("You already have an active botticelli game for this channel")
-
-        # Create new game
+        # Create new game, the active game index rejects a second one
         game = Game(creator=username, 
                     channel=channel_id,
                     person=person,
                     letter=letter)
-        game.save()
+        try:
+            with transaction.atomic():
+                game.save()
+                events.record(game, events.GAME_STARTED, username, person=person, letter=letter)
+                stats.record_game(game)
+        except IntegrityError:
+            raise SlackException("You already have an active botticelli game for this channel")
 
         # Send reply
         text = '*%s* has begun a game of Botticelli for letter *%s*... <@channel|user>, begin!' % (username, letter)
         self.reply_text(text, url)
 
 
+    def handle_suggest(self, data, text):
+        index = names.get_names()
+        if index is None:
+            raise SlackException("No name dictionary is installed")
+        if not text:
+            raise SlackException("Suggest takes the start of a name, like: suggest Ada L")
+
+        suggestions = index.prefix(text, SUGGESTIONS)
+        if not suggestions:
+            self.reply_ephemeral_text('No names start with *%s*' % text, data['response_url'])
+            return
+        self.reply_ephemeral_text('\n'.join(suggestions), data['response_url'])
+
     def handle_stump(self, data, stump_text):
+        stump_text, force = strip_force(stump_text)
         if not stump_text:
             raise SlackException("Ya gotta ask a dang stumper!")
 
@@ -244,23 +406,31 @@ class Slack(object):
         if game.state == State.PendingQuestion or game.state == State.Question:
             raise SlackException("We're asking questions, not stumps!")
 
-        # Create stump
-        stump = game.stump_set.create(creator=username, text=stump_text)
-
-        # Change state
-        game.state = State.PendingStump
-        game.save()
+        indexes = similar.get_indexes()
+        earlier = None if force else indexes.stump(game, stump_text)
+        if earlier:
+            outcome = {True: 'Stumped', False: 'Not stumped'}.get(earlier[1], transcript.PENDING)
+            self.reply_ephemeral_text(REPEATED_STUMP % (earlier[0], outcome, stump_text), url)
+            return
+
+        # Create stump and change state
+        with transaction.atomic():
+            stump = game.stump_set.create(creator=username, text=stump_text)
+            if not game.transition(State.Stump, State.PendingStump,
+                                   pending_stump=stump, latest_stump=stump):
+                raise SlackException(STATE_CHANGED)
+            events.record(game, events.STUMP_ASKED, username, id=stump.id, text=stump_text)
+            transaction.on_commit(lambda: indexes.add_stump(game, stump))
 
         # Send stump message attachment
         text = '*%s* asks stumper:\n*%s*' % (username, stump_text)
         footer = '<@%s|user>, Are you stumped? If not, prove it!' % game.creator
         callback_id = json.dumps({'type': 'stump', 'id': stump.id})
-        ret = self.send_yesno(text, footer, callback_id, channel_id, 'I\'m stumped!', 'Not stumped!')
-
-        stump.thread_ts = ret['ts']
-        stump.save()
+        self.send_yesno(text, footer, callback_id, channel_id, 'I\'m stumped!', 'Not stumped!',
+                        ref=stump)
 
     def handle_question(self, data, question_text):
+        question_text, force = strip_force(question_text)
         if not question_text:
             raise SlackException("Ya gotta ask a dang question!")
 
@@ -283,23 +453,28 @@ class Slack(object):
 
         #TODO: validate user
 
-        # Create question
-        question = game.question_set.create(creator=username, 
-                                            text=question_text)
-
-        # Change state
-        game.state = State.PendingQuestion
-        game.save()
-
+        earlier = None if force else similar.get_indexes().question(game, question_text)
+        if earlier:
+            self.reply_ephemeral_text(REPEATED_QUESTION % (earlier[0], earlier[1], question_text),
+                                      url)
+            return
+
+        # Create question and change state
+        with transaction.atomic():
+            question = game.question_set.create(creator=username, 
+                                                text=question_text)
+            if not game.transition(State.Question, State.PendingQuestion,
+                                   pending_question=question,
+                                   transcript=transcript.add_question(game.transcript, question_text)):
+                raise SlackException(STATE_CHANGED)
+            events.record(game, events.QUESTION_ASKED, username,
+                          id=question.id, text=question_text)
 
         # Send question message attachment
         text = '*%s* asks yes/no question for <@%s|user>:\n*%s*' \
             % (username, game.creator, question_text)
         callback_id = json.dumps({'type': 'question', 'id': question.id})
-        ret = self.send_yesno(text, '', callback_id, channel_id)
-
-        question.thread_ts = ret['ts']
-        question.save()
+        self.send_yesno(text, '', callback_id, channel_id, ref=question)
 
 
     def reply_text(self, text, url):
@@ -319,12 +494,22 @@ class Slack(object):
         self.respond_to_url(payload, url)
 
     def respond_to_url(self, data, url):
-        logger.info('posting %s to %s' % (data, url))
-        headers = {'Content-Type': 'application/json'}
-        result = requests.post(url, json=data, headers=headers)
-        result.raise_for_status()
-
-    def send_yesno(self, stump_text, footer, callback_id, channel_id, yes_text='Yes', no_text='No'):
+        call_logger.info('posting %s to response_url', data)
+        if owned_channels() is None:
+            self.transport.post_json(url, data)
+            return
+
+        # In an engine batch, don't tell the user about changes that may
+        # still roll back
+        def post():
+            try:
+                self.transport.post_json(url, data)
+            except Exception:
+                logger.exception('Reply to response_url failed')
+        transaction.on_commit(post)
+
+    def send_yesno(self, stump_text, footer, callback_id, channel_id, yes_text='Yes', no_text='No',
+                   ref=None):
         data = {
             "text": stump_text,
             "response_type": "in_channel",
@@ -342,7 +527,7 @@ class Slack(object):
             ]
         }
 
-        return self.send_message(data['text'], channel_id, data['attachments'])
+        return self.send_message(data['text'], channel_id, data['attachments'], ref=ref)
 
 
     def handle_stump_action(self, data, callback_id):
@@ -352,30 +537,36 @@ class Slack(object):
         channel = data['channel']['id']
         username = data['user']['name']
 
-        # Update stump record
-        stump = Stump.objects.get(id=stump_id)
-
-        if stump.game.creator != username:
-            raise SlackException("Only %s can answer the stump!" % stump.creator)
-
-        stump.answer = data['actions'][0]['value'] == 'yes'
-        stump.save()
-
-        # Update game state
-        new_state = State.Question if stump.answer else State.Stump
-        stump.game.state=new_state
-        stump.game.save()
+        # Find the stump being answered
+        game = Game.get_active(channel)
+        stump = game and game.get_active_stump()
+        if not stump or stump.id != stump_id:
+            stump = Stump.objects.select_related('game').get(id=stump_id)
+            game = stump.game
+
+        if game.creator != username:
+            raise SlackException("Only %s can answer the stump!" % game.creator)
+
+        # Update stump and game state together
+        answer = data['actions'][0]['value'] == 'yes'
+        new_state = State.Question if answer else State.Stump
+        with transaction.atomic():
+            if not game.transition(State.PendingStump, new_state, stump, answer,
+                                   pending_stump=None):
+                raise SlackException("That stump has already been answered")
+            events.record(game, events.STUMP_ANSWERED, username, id=stump.id, answer=answer)
+            stats.record_stump(game, stump)
 
         # send a message reply
         if stump.answer:
             text = '%s\n\n*%s* was stumped. *<@%s|user> can now ask questions*.' \
-                % (original_text, stump.game.creator, stump.creator)
+                % (original_text, game.creator, stump.creator)
         else:
             text = '%s\n\n*%s* wasn\'t stumped. *Make sure he proves it*, then try again <@channel|user>!' \
-                % (original_text, stump.game.creator)
+                % (original_text, game.creator)
         self.reply_text(text, url)
 
-        self.send_short_status(channel, stump.game)
+        self.send_short_status(channel, game)
 
     def handle_question_action(self, data, callback_id):
         url = data['response_url']
@@ -384,18 +575,32 @@ class Slack(object):
         channel = data['channel']['id']
         username = data['user']['name']
 
-        # Update question record
-        question = Question.objects.get(id=question_id)
-        if question.game.creator != username:
-            raise SlackException("Only %s can answer the question!" % stump.creator)
-
-        question.answer = data['actions'][0]['value'] == 'yes'
-        question.save()
-
-        # Update game state
-        new_state = State.Question if question.answer else State.Stump
-        question.game.state=new_state
-        question.game.save()
+        # Find the question being answered
+        game = Game.get_active(channel)
+        question = game and game.get_active_question()
+        if not question or question.id != question_id:
+            question = Question.objects.select_related('game').get(id=question_id)
+            game = question.game
+
+        if game.creator != username:
+            raise SlackException("Only %s can answer the question!" % game.creator)
+
+        # The transcript only has a pending answer to fill in while this
+        # question is the pending one
+        if game.state != State.PendingQuestion or game.pending_question_id != question.id:
+            raise SlackException("That question has already been answered")
+
+        # Update question and game state together
+        answer = data['actions'][0]['value'] == 'yes'
+        new_state = State.Question if answer else State.Stump
+        with transaction.atomic():
+            if not game.transition(State.PendingQuestion, new_state, question, answer,
+                                   pending_question=None,
+                                   transcript=transcript.answer_question(game.transcript, answer)):
+                raise SlackException("That question has already been answered")
+            events.record(game, events.QUESTION_ANSWERED, username,
+                          id=question.id, answer=answer)
+            stats.record_question(game, question)
 
         # send a message reply
         if question.answer:
@@ -406,15 +611,19 @@ class Slack(object):
                 % (original_text)
         self.reply_text(text, url)
 
-        self.send_short_status(channel, question.game)
+        self.send_short_status(channel, game)
 
-    def send_short_status(self, channel, game):
+    def short_status(self, channel, game):
+        """The status without the previous questions"""
         status = self.get_status(channel, game)
-        text = '\n'.join( \
+        return '\n'.join( \
             [status['header']] + \
             status['text_lines'] + \
             [status['footer']])
-        ret = self.send_message(text, channel)
+
+    def send_short_status(self, channel, game):
+        text = self.short_status(channel, game)
+        ret = self.send_message(text, channel, coalesce_key='status')
         
         #if ret['ok']:
         #    thread_ts = ret['ts']
@@ -422,6 +631,28 @@ class Slack(object):
         #        self.send_thread_message(line, channel, thread_ts)
 
 
+def ratio(hits, total, noun):
+    if not total:
+        return '0 of 0 %ss' % noun
+    return '%d of %d %s%s (%d%%)' % (hits, total, noun, '' if total == 1 else 's',
+                                     round(100.0 * hits / total))
+
+def unknown_person(index, person):
+    """Error for a person missing from the name dictionary, with names like it"""
+    # The whole name, then its first word, which finds "Mike Tyson" for "Mike Tison"
+    suggestions = index.prefix(person, SUGGESTIONS) or \
+        index.prefix(person.split()[0], SUGGESTIONS, whole_word=True)
+    text = "*%s* isn't in the name dictionary." % person
+    if suggestions:
+        text += ' Did you mean: %s?' % ', '.join(suggestions)
+    return text + ' To use it anyway: /botticelli start !%s' % person
+
+def strip_force(text):
+    """Text without a leading !, and whether it had one to skip the repeat check"""
+    if text.startswith('!'):
+        return text[1:].strip(), True
+    return text, False
+
 def parse_slash_command(text):
     match = re.match('(\w+)(.*)', text)
     if not match:
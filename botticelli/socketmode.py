@@ -0,0 +1,177 @@
+"""
+Receives slash commands and button clicks over Slack's Socket Mode.
+
+Instead of Slack POSTing each interaction to /slack/slash and
+/slack/action, `manage.py run_socket_mode` keeps one websocket open per
+app token (SLACK_APP_TOKEN, and Installation.app_token for workspaces
+with their own app), so no public HTTP endpoint is needed.
+
+Each envelope is acknowledged as soon as it arrives, then goes through
+the same repeat check, client lookup and executor as the HTTP views. A
+command turned away because the team isn't installed or the executor is
+full gets the same reply, posted to its response_url.
+
+A dropped connection is opened again after a backoff that doubles up to
+`max_delay`, with jitter so a fleet of workers doesn't reconnect in step;
+it resets once Slack says hello. Slack's own disconnect message, sent
+before it rotates a connection, reconnects straight away.
+"""
+
+import json
+import random
+import logging
+import threading
+
+import websocket
+from django.db import close_old_connections
+
+from botticelli import idempotency, logs, views
+
+logger = logging.getLogger('botticelli')
+call_logger = logging.getLogger('botticelli.calls')
+
+class ConnectionFailed(Exception):
+    pass
+
+class Backoff(object):
+    def __init__(self, initial=1, max_delay=60, rng=random.random):
+        self.initial = initial
+        self.max_delay = max_delay
+        self.rng = rng
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.max_delay, self.initial * 2 ** self.attempts)
+        self.attempts += 1
+        # Between half and all of the delay
+        return delay * (0.5 + self.rng() / 2)
+
+    def reset(self):
+        self.attempts = 0
+
+def websocket_connect(url, timeout):
+    return websocket.create_connection(url, timeout=timeout)
+
+class SocketConnection(object):
+    """
+    One Socket Mode connection, opened with `app_token` through
+    `transport` and kept open by run() until `stop` is set.
+    """
+    def __init__(self, app_token, transport, stop, connect=websocket_connect,
+                 max_backoff=60, deferred=True, poll_timeout=1):
+        self.app_token = app_token
+        self.transport = transport
+        self.stop = stop
+        self.connect = connect
+        self.backoff = Backoff(max_delay=max_backoff)
+        self.deferred = deferred
+        self.poll_timeout = poll_timeout
+        self.socket = None
+
+    def open(self):
+        ret = self.transport.api_call('apps.connections.open', self.app_token)
+        if not ret.get('ok'):
+            raise ConnectionFailed(ret.get('error', 'unknown'))
+        return self.connect(ret['url'], self.poll_timeout)
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                self.socket = self.open()
+                reconnect_now = self.receive()
+            except Exception:
+                logger.exception('Socket Mode connection failed')
+                reconnect_now = False
+            finally:
+                self.close()
+            if not reconnect_now:
+                self.stop.wait(self.backoff.next_delay())
+
+    def receive(self):
+        """
+        Handle envelopes until the socket closes or stop is set. Returns
+        True if Slack asked us to reconnect.
+        """
+        while not self.stop.is_set():
+            try:
+                text = self.socket.recv()
+            except websocket.WebSocketTimeoutException:
+                # Only here to look at stop now and then
+                continue
+            if not text:
+                raise ConnectionFailed('Socket closed')
+            try:
+                if self.handle(json.loads(text)):
+                    return True
+            finally:
+                # Like the end of a request, this thread lives on
+                close_old_connections()
+        return False
+
+    def handle(self, envelope):
+        """Handle one envelope, returns True for a disconnect"""
+        kind = envelope.get('type')
+        if kind == 'hello':
+            self.backoff.reset()
+        elif kind == 'disconnect':
+            logger.info('Slack asked to reconnect: %s', envelope.get('reason', ''))
+            return True
+        elif 'envelope_id' in envelope:
+            self.socket.send(json.dumps({'envelope_id': envelope['envelope_id']}))
+            logs.set_request_id(envelope['envelope_id'])
+            try:
+                self.dispatch(kind, envelope.get('payload') or {},
+                              envelope.get('retry_attempt', 0) > 0)
+            except Exception:
+                logger.exception('Socket Mode %s failed', kind)
+            finally:
+                logs.set_request_id('')
+        return False
+
+    def dispatch(self, kind, payload, retried):
+        if kind == 'slash_commands':
+            call_logger.info('slash %s', logs.Summary(payload))
+            key = idempotency.slash_key(payload, retried)
+            if not views.is_repeat(key):
+                self.reply(payload, *views.dispatch_slash(payload, key, self.deferred))
+        elif kind == 'interactive':
+            call_logger.info('action %s', logs.Summary(payload))
+            key = idempotency.action_key(payload)
+            if not views.is_repeat(key):
+                self.reply(payload, *views.dispatch_action(payload, key, self.deferred))
+        else:
+            logger.info('Ignoring Socket Mode %s', kind)
+
+    def reply(self, payload, action, reply):
+        """Post the reply to a delivery the views turned away"""
+        if reply is not None:
+            self.transport.post_json(payload['response_url'], reply)
+
+    def close(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except Exception:
+                logger.exception('Closing a Socket Mode connection failed')
+            self.socket = None
+
+def app_tokens():
+    """SLACK_APP_TOKEN and the workspaces' own app tokens, each once"""
+    from django.conf import settings
+    from botticelli.models import Installation
+
+    tokens = [settings.SLACK_APP_TOKEN] + list(
+        Installation.objects.exclude(app_token='').order_by('id')
+        .values_list('app_token', flat=True))
+    return sorted(set(token for token in tokens if token), key=tokens.index)
+
+def start(tokens, transport, stop, **kwargs):
+    """A thread running a SocketConnection for each token"""
+    threads = []
+    for number, token in enumerate(tokens):
+        connection = SocketConnection(token, transport, stop, **kwargs)
+        thread = threading.Thread(target=connection.run, name='botticelli-socket-%d' % number)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    return threads
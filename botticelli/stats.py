@@ -0,0 +1,143 @@
+"""
+Per-user and per-channel counters behind the stats and leaderboard commands.
+
+Handlers call the record_* functions inside the transaction that answers
+the turn, and each call is a single upsert, so the counters are always in
+step with the games and reading them is a lookup on one or two rows.
+rebuild() recomputes everything from the live and archived history.
+"""
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, IntegerField, Sum, When
+
+from botticelli import archive
+from botticelli.models import ArchivedGame, Game, PlayerStats, Question, Stump
+
+COUNTERS = ('games_started', 'stumps_asked', 'stumps_won', 'questions_asked',
+            'questions_hit', 'stumps_faced', 'stumps_lost', 'questions_faced')
+
+# The username of a channel's totals row
+CHANNEL = ''
+
+def stump_deltas(channel, game_creator, asker, answer):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for username in (asker, CHANNEL):
+        deltas[channel, username]['stumps_asked'] += 1
+        deltas[channel, username]['stumps_won'] += int(bool(answer))
+    deltas[channel, game_creator]['stumps_faced'] += 1
+    deltas[channel, game_creator]['stumps_lost'] += int(bool(answer))
+    return deltas
+
+def question_deltas(channel, game_creator, asker, answer):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for username in (asker, CHANNEL):
+        deltas[channel, username]['questions_asked'] += 1
+        deltas[channel, username]['questions_hit'] += int(bool(answer))
+    deltas[channel, game_creator]['questions_faced'] += 1
+    return deltas
+
+def add(deltas):
+    """Add {(channel, username): {counter: n}} to the stored counters"""
+    if not deltas:
+        return
+
+    table = PlayerStats._meta.db_table
+    columns = ', '.join(COUNTERS)
+    updates = ', '.join('%s = %s.%s + EXCLUDED.%s' % (c, table, c, c) for c in COUNTERS)
+    rows, params = [], []
+    # Sorted so concurrent upserts lock rows in the same order
+    for (channel, username), counts in sorted(deltas.items()):
+        rows.append('(%s)' % ', '.join(['%s'] * (len(COUNTERS) + 2)))
+        params += [channel, username] + [counts.get(c, 0) for c in COUNTERS]
+
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO %s (channel, username, %s) VALUES %s '
+                       'ON CONFLICT (channel, username) DO UPDATE SET %s'
+                       % (table, columns, ', '.join(rows), updates), params)
+
+def record_game(game):
+    add({(game.channel, game.creator): {'games_started': 1},
+         (game.channel, CHANNEL): {'games_started': 1}})
+
+def record_stump(game, stump):
+    add(stump_deltas(game.channel, game.creator, stump.creator, stump.answer))
+
+def record_question(game, question):
+    add(question_deltas(game.channel, game.creator, question.creator, question.answer))
+
+def get_stats(channel, username):
+    """The user's and the channel's counters, unsaved empty rows if none"""
+    rows = {row.username: row for row in
+            PlayerStats.objects.filter(channel=channel, username__in=(username, CHANNEL))}
+    return (rows.get(username) or PlayerStats(channel=channel, username=username),
+            rows.get(CHANNEL) or PlayerStats(channel=channel, username=CHANNEL))
+
+def leaderboard(channel, limit=5):
+    """The channel's best stumpers"""
+    return list(PlayerStats.objects
+                .filter(channel=channel, stumps_won__gt=0)
+                .exclude(username=CHANNEL)
+                .order_by('-stumps_won', 'stumps_asked')[:limit])
+
+def answered(value):
+    return Sum(Case(When(answer=value, then=1), default=0, output_field=IntegerField()))
+
+def merge(totals, deltas):
+    for key, counts in deltas.items():
+        for name, value in counts.items():
+            totals[key][name] += value
+
+def rebuild():
+    """
+    Recompute every counter from scratch: one aggregate query per kind of
+    counter over the live tables, plus one pass over the archive. Answers
+    wait on the table lock until it is done, so none are lost.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE'
+                           % PlayerStats._meta.db_table)
+        totals = count_history()
+        PlayerStats.objects.all().delete()
+        PlayerStats.objects.bulk_create([
+            PlayerStats(channel=channel, username=username, **counts)
+            for (channel, username), counts in totals.items()])
+    return len(totals)
+
+def count_history():
+    totals = defaultdict(lambda: defaultdict(int))
+
+    for model in (Game, ArchivedGame):
+        for row in model.objects.values('channel', 'creator').annotate(n=Count('id')):
+            merge(totals, {(row['channel'], row['creator']): {'games_started': row['n']},
+                           (row['channel'], CHANNEL): {'games_started': row['n']}})
+
+    for model, asked, won in ((Stump, 'stumps_asked', 'stumps_won'),
+                              (Question, 'questions_asked', 'questions_hit')):
+        answers = model.objects.filter(answer__isnull=False)
+        for row in answers.values('game__channel', 'creator') \
+                .annotate(n=Count('id'), yes=answered(True)):
+            for username in (row['creator'], CHANNEL):
+                merge(totals, {(row['game__channel'], username): {asked: row['n'],
+                                                                  won: row['yes']}})
+        for row in answers.values('game__channel', 'game__creator') \
+                .annotate(n=Count('id'), yes=answered(True)):
+            key = (row['game__channel'], row['game__creator'])
+            if model is Stump:
+                merge(totals, {key: {'stumps_faced': row['n'], 'stumps_lost': row['yes']}})
+            else:
+                merge(totals, {key: {'questions_faced': row['n']}})
+
+    for game in archive.archived_games():
+        for stump in game.stumps:
+            if stump['answer'] is not None:
+                merge(totals, stump_deltas(game.channel, game.creator,
+                                           stump['creator'], stump['answer']))
+        for question in game.questions:
+            if question['answer'] is not None:
+                merge(totals, question_deltas(game.channel, game.creator,
+                                              question['creator'], question['answer']))
+
+    return totals
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import archive
+from ..models import ArchivedGame, Game, Question, Stump, State
+
+def finished_game(channel, state=State.Done, days_ago=60):
+    game = Game.objects.create(creator='alice', letter='T', person='Mike Tyson',
+                               channel=channel, state=state)
+    stump = Stump.objects.create(creator='bob', text='did you box?', answer=True, game=game)
+    Question.objects.create(creator='bob', text='are you alive?', answer=False, game=game)
+    Game.objects.filter(id=game.id).update(latest_stump=stump, transcript='history',
+                                           date_updated=timezone.now() - timedelta(days=days_ago))
+    return game
+
+class TestArchive(TestCase):
+    def test_archive_old_games(self):
+        old = finished_game('C1')
+        cancelled = finished_game('C2', state=State.Cancelled)
+        recent = finished_game('C3', days_ago=1)
+        active = finished_game('C4', state=State.Question)
+
+        self.assertEqual(archive.archive(days=30, batch_size=1), 2)
+
+        self.assertEqual(set(Game.objects.values_list('id', flat=True)), {recent.id, active.id})
+        self.assertEqual(Stump.objects.count(), 2)
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual(set(ArchivedGame.objects.values_list('id', flat=True)),
+                         {old.id, cancelled.id})
+
+        game = archive.get_finished_game(old.id)
+        self.assertTrue(game.archived)
+        self.assertEqual(game.transcript, 'history')
+        self.assertEqual([s['text'] for s in game.stumps], ['did you box?'])
+        self.assertEqual([q['answer'] for q in game.questions], [False])
+
+    def test_finished_games_reads_live_and_archived(self):
+        old = finished_game('C1')
+        archive.archive(days=30)
+        recent = finished_game('C1', days_ago=1)
+        finished_game('C1', state=State.Stump)
+
+        games = list(archive.finished_games(channel='C1'))
+        self.assertEqual([(g.id, g.archived) for g in games],
+                         [(recent.id, False), (old.id, True)])
+        self.assertEqual(type(games[0].stumps[0]['date_created']),
+                         type(games[1].stumps[0]['date_created']))
@@ -0,0 +1,29 @@
+import unittest
+
+from ..bench import payloads, runner
+
+class TestPayloads(unittest.TestCase):
+    def test_replayable(self):
+        self.assertEqual(payloads.generate(seed=3, channels=2),
+                         payloads.generate(seed=3, channels=2))
+
+    def test_game_shape(self):
+        steps = payloads.generate(channels=1, turns=5)['CB00000']
+        self.assertEqual(steps[0][3].split()[0], 'start')
+        self.assertEqual(steps[-1][3], 'cancel game')
+
+class TestRegressions(unittest.TestCase):
+    def row(self, p95, queries):
+        return {'p95_ms': p95, 'queries_per_request': queries, 'errors': 0}
+
+    def test_within_baseline(self):
+        self.assertEqual(runner.regressions({'all': self.row(12, 3)},
+                                            {'all': self.row(10, 3)}, 0.5), [])
+
+    def test_slower_or_more_queries(self):
+        problems = runner.regressions({'all': self.row(20, 4)},
+                                      {'all': self.row(10, 3)}, 0.5)
+        self.assertEqual(len(problems), 2)
+
+    def test_percentile(self):
+        self.assertEqual(runner.percentile(list(range(101)), 95), 95)
@@ -0,0 +1,67 @@
+from django.test import TestCase, override_settings
+
+from ..clients import ClientPool
+from ..models import Installation, Outbox
+from ..outbox import Dispatcher
+from .slack_test import FakeTransport
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@override_settings(SLACK_OATH_TOKEN='')
+class TestClientPool(TestCase):
+    def setUp(self):
+        Installation.objects.create(team_id='T1', bot_token='xoxb-1')
+        Installation.objects.create(team_id='T2', bot_token='xoxb-2')
+        self.clock = Clock()
+        self.pool = ClientPool(size=1, ttl=60, clock=self.clock)
+
+    def test_token_per_team(self):
+        self.assertEqual(self.pool.get('T1').token, 'xoxb-1')
+        self.assertEqual(self.pool.get('T1').team_id, 'T1')
+        self.assertEqual(self.pool.get('T2').token, 'xoxb-2')
+        self.assertIsNone(self.pool.get('T3'))
+
+    @override_settings(SLACK_OATH_TOKEN='xoxb-default')
+    def test_default_token(self):
+        self.assertEqual(self.pool.get('T3').token, 'xoxb-default')
+
+    def test_reuse_and_evict(self):
+        client = self.pool.get('T1')
+        self.assertIs(self.pool.get('T1'), client)
+        self.assertIsNot(client.transport, self.pool.get('T2').transport)
+        self.assertEqual(list(self.pool.entries), ['T2'])
+        self.assertIsNot(self.pool.get('T1'), client)
+
+    def test_reload_after_ttl(self):
+        client = self.pool.get('T1')
+        self.clock.now += 120
+        self.assertIs(self.pool.get('T1'), client)
+
+        Installation.objects.filter(team_id='T1').update(bot_token='xoxb-new')
+        self.clock.now += 120
+        self.assertEqual(self.pool.get('T1').token, 'xoxb-new')
+
+class TestDispatchPerTeam(TestCase):
+    def test_rows_go_out_with_their_team(self):
+        Installation.objects.create(team_id='T1', bot_token='xoxb-1')
+        Installation.objects.create(team_id='T2', bot_token='xoxb-2')
+        transport = FakeTransport()
+        tokens = []
+        transport.api_call = lambda method, token, **kwargs: tokens.append(token) or {'ok': True}
+
+        handlers = ClientPool(use_outbox=True)
+        handlers.get('T1').send_message('hi', 'C1')
+        handlers.get('T2').send_message('hi', 'C2')
+        self.assertEqual(sorted(Outbox.objects.values_list('team_id', flat=True)), ['T1', 'T2'])
+
+        senders = ClientPool(use_outbox=False)
+        for team in ('T1', 'T2'):
+            senders.get(team).transport = transport
+        Dispatcher(clients=senders).run_once()
+        self.assertEqual(sorted(tokens), ['xoxb-1', 'xoxb-2'])
+        self.assertIsNot(senders.get('T1').limiter, senders.get('T2').limiter)
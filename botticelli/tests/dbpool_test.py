@@ -0,0 +1,110 @@
+import copy
+import threading
+
+from django.db import connection
+from django.test import TestCase
+
+from .. import metrics
+from ..db import pool
+from ..db.base import DatabaseWrapper
+from .clients_test import Clock
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed = 1
+
+class TestConnectionPool(TestCase):
+    def setUp(self):
+        self.healthy = True
+        self.pool = self.new_pool()
+
+    def new_pool(self, **kwargs):
+        return pool.ConnectionPool(FakeConnection, lambda conn: self.healthy,
+                                   min_size=1, max_size=2, timeout=0.05,
+                                   max_lifetime=600, check_after=30, **kwargs)
+
+    def test_reuse_and_bound(self):
+        self.pool.warm()
+        first = self.pool.get()
+        second = self.pool.get()
+        self.assertIsNot(first, second)
+        with self.assertRaises(pool.PoolTimeout):
+            self.pool.get()
+        self.pool.put(second)
+        self.assertIs(self.pool.get(), second)
+        stats = self.pool.snapshot()
+        self.assertEqual((stats['opened'], stats['timeouts'], stats['waits']), (2, 1, 1))
+
+    def test_waiter_gets_returned_connection(self):
+        self.pool.timeout = 5
+        conns = [self.pool.get(), self.pool.get()]
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(self.pool.get()))
+        waiter.start()
+        self.pool.put(conns[0])
+        waiter.join()
+        self.assertEqual(got, [conns[0]])
+
+    def test_old_and_broken_replaced(self):
+        self.clock = Clock()
+        self.pool = self.new_pool(clock=self.clock)
+        conn = self.pool.get()
+        self.pool.put(conn)
+        self.clock.now += 601
+        replacement = self.pool.get()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+
+        self.pool.put(replacement)
+        self.clock.now += 31
+        self.healthy = False
+        conn = self.pool.get()
+        self.assertIsNot(conn, replacement)
+        self.assertEqual(self.pool.snapshot()['failed_checks'], 1)
+
+        self.pool.put(conn, usable=False)
+        self.assertEqual(self.pool.snapshot()['size'], 0)
+
+class TestPooledBackend(TestCase):
+    def setUp(self):
+        settings_dict = copy.deepcopy(connection.settings_dict)
+        settings_dict['POOL'] = {'MODE': 'pool', 'MIN_SIZE': 1, 'MAX_SIZE': 2}
+        self.settings_dict = settings_dict
+        self.addCleanup(pool.close_pools, settings_dict['NAME'])
+
+    def wrapper(self):
+        return DatabaseWrapper(self.settings_dict, alias='pooltest')
+
+    def test_connection_goes_back_to_pool(self):
+        db = self.wrapper()
+        db.ensure_connection()
+        raw = db.connection
+        with db.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        db.close()
+        self.assertFalse(raw.closed)
+
+        other = self.wrapper()
+        other.ensure_connection()
+        self.assertIs(other.connection, raw)
+        other.close()
+
+        exported = metrics.render(metrics.registry.snapshot())
+        self.assertIn('botticelli_db_pool_connections{alias="pooltest",state="idle"} 1', exported)
+
+    def test_open_transaction_rolled_back(self):
+        db = self.wrapper()
+        db.ensure_connection()
+        db.set_autocommit(False)
+        with db.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        db.close()
+
+        other = self.wrapper()
+        with other.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertTrue(other.get_autocommit())
+        other.close()
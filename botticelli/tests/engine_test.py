@@ -0,0 +1,57 @@
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import engine
+from ..cache import get_active_games, set_owned_channels
+from ..executor import Task
+from ..models import Game, Outbox, State, Stump
+from ..slack import Slack
+from ..views import run_action, run_slash
+from .slack_test import FakeTransport, action, slash
+
+class TestEngine(TransactionTestCase):
+    def setUp(self):
+        get_active_games().clear()
+        engine.owned_channels().clear()
+        self.transport = FakeTransport()
+        self.slack = Slack('token', self.transport, use_outbox=True)
+
+    def run_batch(self, *steps):
+        engine.run_batch([Task('C1', func, (self.slack, data), '') for func, data in steps])
+
+    def test_batch_commits_and_replies_after(self):
+        self.run_batch((run_slash, slash('start Mike Tyson')),
+                       (run_slash, slash('stump did you box?', user='bob')))
+        game = Game.objects.get()
+        self.assertEqual(game.state, State.PendingStump)
+        self.assertEqual(len(self.transport.replies), 1)
+        self.assertEqual(Outbox.objects.count(), 1)
+
+        self.run_batch((run_action, action('stump', Stump.objects.get().id, 'yes')))
+        self.assertEqual(Game.objects.get().state, State.Question)
+
+    def test_keeps_game_after_own_write(self):
+        self.run_batch((run_slash, slash('start Mike Tyson')))
+        self.run_batch((run_slash, slash('status')))
+        self.run_batch((run_slash, slash('stump did you box?', user='bob')))
+
+        set_owned_channels(engine.owned_channels())
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                game = Game.get_active('C1')
+        finally:
+            set_owned_channels(None)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(game.state, State.PendingStump)
+
+    def test_failed_task_rolls_back_alone(self):
+        def fail(slack, data):
+            Game.objects.create(creator='x', channel='C2', person='x', letter='X')
+            raise RuntimeError('boom')
+
+        self.run_batch((run_slash, slash('start Mike Tyson')),
+                       (fail, None),
+                       (run_slash, slash('stump did you box?', user='bob')))
+        self.assertEqual(list(Game.objects.values_list('channel', flat=True)), ['C1'])
+        self.assertEqual(Game.objects.get().state, State.PendingStump)
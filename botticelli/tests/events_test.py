@@ -0,0 +1,75 @@
+from .. import events
+from ..models import Game, GameEvent, GameSnapshot, Question, Stump
+from ..slack import SlackException
+from .slack_test import SlackTestCase, action, slash
+
+GAME_FIELDS = ('creator', 'letter', 'person', 'channel', 'state', 'transcript',
+               'pending_stump_id', 'pending_question_id', 'latest_stump_id')
+TURN_FIELDS = ('id', 'creator', 'text', 'answer')
+
+def tables():
+    game = Game.objects.values(*GAME_FIELDS).get()
+    return (game,
+            list(Stump.objects.order_by('id').values_list(*TURN_FIELDS)),
+            list(Question.objects.order_by('id').values_list(*TURN_FIELDS)))
+
+class TestEvents(SlackTestCase):
+    def play(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.slack.handle_slash(slash('cancel stump', user='bob'))
+        self.slack.handle_slash(slash('stump did you bite an ear?', user='carol'))
+        self.slack.handle_action(action('stump', Stump.objects.latest('id').id, 'yes'))
+        self.slack.handle_slash(slash('ask are you alive?', user='carol'))
+        self.slack.handle_action(action('question', Question.objects.latest('id').id, 'yes'))
+        self.slack.handle_slash(slash('ask are you a boxer?', user='carol'))
+        self.slack.handle_slash(slash('cancel question', user='carol'))
+        self.slack.handle_slash(slash('ask are you retired?', user='carol'))
+        return Game.objects.get()
+
+    def test_projection_matches_tables(self):
+        game = self.play()
+        self.assertEqual(GameEvent.objects.filter(game_id=game.id).count(), 10)
+
+        projected, stumps, questions = events.load(game.id).to_models()
+        self.assertEqual({f: getattr(projected, f) for f in GAME_FIELDS}, tables()[0])
+        self.assertEqual([tuple(getattr(t, f) for f in TURN_FIELDS) for t in stumps],
+                         tables()[1])
+        self.assertEqual([tuple(getattr(t, f) for f in TURN_FIELDS) for t in questions],
+                         tables()[2])
+        self.assertEqual(self.slack.get_status('C1', projected),
+                         self.slack.get_status('C1', Game.objects.get()))
+
+    def test_snapshot_then_tail(self):
+        game = self.play()
+        self.assertIsNone(events.snapshot(game.id, min_events=11))
+        self.assertIsNotNone(events.snapshot(game.id))
+        self.assertIsNone(events.snapshot(game.id))
+
+        self.slack.handle_action(action('question', Question.objects.latest('id').id, 'no'))
+        loaded = events.load(game.id)
+        self.assertEqual(loaded.replayed, 1)
+        self.assertEqual(loaded.to_json(), events.load(game.id, use_snapshot=False).to_json())
+
+    def test_rebuild_restores_tables(self):
+        game = self.play()
+        events.snapshot(game.id)
+        self.slack.handle_slash(slash('cancel game'))
+        before = tables()
+
+        Question.objects.all().update(answer=None, text='?')
+        Stump.objects.filter(answer=True).delete()
+        Game.objects.update(state=0, transcript='', pending_question=None)
+        Stump.objects.create(game=game, creator='mallory', text='never asked')
+
+        self.assertEqual(events.rebuild(events.game_ids()), 1)
+        self.assertEqual(tables(), before)
+
+    def test_lost_transition_records_nothing(self):
+        game = self.play()
+        count = GameEvent.objects.count()
+        Question.objects.filter(id=game.pending_question_id).update(answer=False)
+        with self.assertRaises(SlackException):
+            self.slack.handle_action(action('question', game.pending_question_id, 'yes'))
+        self.assertEqual(GameEvent.objects.count(), count)
+        self.assertFalse(GameSnapshot.objects.exists())
@@ -0,0 +1,74 @@
+import time
+import threading
+import unittest
+
+from ..executor import Executor, ExecutorFull
+
+class TestExecutor(unittest.TestCase):
+    def test_channel_order(self):
+        pool = Executor(workers=3, queue_size=100)
+        seen = []
+        for i in range(50):
+            pool.submit('C1', seen.append, i)
+        pool.shutdown()
+        self.assertEqual(seen, list(range(50)))
+
+    def test_backpressure(self):
+        pool = Executor(workers=1, queue_size=1, put_timeout=0.01)
+        started, gate = threading.Event(), threading.Event()
+        pool.submit('C1', lambda _: started.set() or gate.wait(), None)
+        started.wait()
+        pool.submit('C1', lambda _: None, None)
+        with self.assertRaises(ExecutorFull):
+            pool.submit('C1', lambda _: None, None)
+        gate.set()
+        pool.shutdown()
+
+    def test_shutdown_timeout_overall(self):
+        pool = Executor(workers=2, queue_size=1, put_timeout=0.01)
+        started, gate = threading.Event(), threading.Event()
+        pool.submit('C1', lambda _: started.set() or gate.wait(), None)
+        started.wait()
+        pool.submit('C1', lambda _: None, None)
+        # The stuck worker's queue is full, the other's isn't
+        start = time.monotonic()
+        pool.shutdown(0.2)
+        self.assertLess(time.monotonic() - start, 0.5)
+        gate.set()
+
+    def test_no_submit_after_shutdown(self):
+        pool = Executor(workers=1)
+        pool.shutdown()
+        with self.assertRaises(ExecutorFull):
+            pool.submit('C1', lambda _: None, None)
+
+    def test_add_workers_keeps_order(self):
+        pool = Executor(workers=2, queue_size=1000)
+        seen = {}
+        keys = ['C%d' % i for i in range(20)]
+        for i in range(50):
+            for key in keys:
+                pool.submit(key, lambda args: seen.setdefault(args[0], []).append(args[1]),
+                            (key, i))
+            if i == 25:
+                pool.add_workers(2)
+        pool.shutdown()
+        self.assertEqual(seen, {key: list(range(50)) for key in keys})
+        self.assertEqual(pool.ring.nodes(), {0, 1, 2, 3})
+
+    def test_batches(self):
+        batches = []
+        gate = threading.Event()
+
+        def run(tasks):
+            gate.wait()
+            batches.append([task.args[0] for task in tasks])
+
+        pool = Executor(workers=1, batch_size=3, batch_runner=run)
+        for i in range(7):
+            pool.submit('C1', None, i)
+        gate.set()
+        pool.shutdown()
+        self.assertEqual(sum(batches, []), list(range(7)))
+        self.assertTrue(all(len(batch) <= 3 for batch in batches))
+        self.assertLess(len(batches), 7)
@@ -0,0 +1,84 @@
+import io
+import time
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import TestCase, override_settings
+
+from .. import signing
+from ..cache import get_active_games
+from ..fastpath import FastPath
+
+def environ(path, form, headers=None):
+    body = urlencode(form).encode('utf-8')
+    env = {'REQUEST_METHOD': 'POST', 'PATH_INFO': path, 'SCRIPT_NAME': '',
+           'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+           'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+           'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)}
+    env.update(headers or {})
+    return env, body
+
+class Request(object):
+    def __init__(self, body, headers):
+        self.body = body
+        self.META = headers
+
+class TestSigning(TestCase):
+    def headers(self, body, timestamp=None, secret='s3cret'):
+        timestamp = str(int(timestamp or time.time()))
+        return {'HTTP_X_SLACK_REQUEST_TIMESTAMP': timestamp,
+                'HTTP_X_SLACK_SIGNATURE': signing.signature(secret, timestamp, body)}
+
+    @override_settings(SLACK_SIGNING_SECRET='s3cret')
+    def test_verify(self):
+        body = b'text=status'
+        self.assertTrue(signing.verify(Request(body, self.headers(body))))
+        self.assertFalse(signing.verify(Request(body + b'!', self.headers(body))))
+        self.assertFalse(signing.verify(Request(body, self.headers(body, secret='other'))))
+        self.assertFalse(signing.verify(Request(body, self.headers(body, time.time() - 600))))
+        self.assertFalse(signing.verify(Request(body, {})))
+
+    @override_settings(SLACK_SIGNING_SECRET='')
+    def test_no_secret_refused(self):
+        self.assertFalse(signing.verify(Request(b'text=status', {})))
+        with override_settings(DEBUG=True):
+            self.assertTrue(signing.verify(Request(b'text=status', {})))
+
+class TestFastPath(TestCase):
+    def setUp(self):
+        get_active_games().clear()
+        self.app = FastPath(WSGIHandler())
+
+    def call(self, env):
+        statuses = []
+        response = self.app(env, lambda status, headers: statuses.append((status, dict(headers))))
+        content = b''.join(response)
+        response.close()
+        return statuses[0][0], statuses[0][1], content
+
+    @override_settings(SLACK_SIGNING_SECRET='', DEBUG=True)
+    def test_slack_routes_skip_middleware(self):
+        env, _ = environ('/slack/slash', {'text': 'help'}, {'HTTP_X_REQUEST_ID': 'req-1'})
+        status, headers, _ = self.call(env)
+        self.assertEqual(status, '400 Bad Request')
+        self.assertEqual(headers['X-Request-ID'], 'req-1')
+        # The full stack would have added these
+        self.assertNotIn('X-Frame-Options', headers)
+
+    def test_other_paths_keep_the_stack(self):
+        env, _ = environ('/ping', {})
+        env['REQUEST_METHOD'] = 'GET'
+        status, headers, _ = self.call(env)
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['X-Frame-Options'], 'DENY')
+
+    @override_settings(SLACK_SIGNING_SECRET='s3cret')
+    def test_unsigned_refused(self):
+        env, body = environ('/slack/slash', {'text': 'help'})
+        self.assertEqual(self.call(env)[0], '403 Forbidden')
+
+        timestamp = str(int(time.time()))
+        env, body = environ('/slack/slash', {'text': 'help'}, {
+            'HTTP_X_SLACK_REQUEST_TIMESTAMP': timestamp,
+            'HTTP_X_SLACK_SIGNATURE': signing.signature('s3cret', timestamp, body)})
+        self.assertEqual(self.call(env)[0], '400 Bad Request')
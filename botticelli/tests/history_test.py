@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .. import history
+from ..models import Game, Outbox, Question
+from ..slack import Slack
+from .slack_test import SlackTestCase, slash
+
+class TestHistory(SlackTestCase):
+    def setUp(self):
+        super(TestHistory, self).setUp()
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.game = Game.objects.get()
+
+    def add_questions(self, count):
+        # Pairs of questions share a timestamp, so the id breaks ties
+        start = timezone.now()
+        for i in range(count):
+            question = Question.objects.create(game=self.game, creator='bob',
+                                               text='q%d' % i, answer=i % 3 == 0)
+            Question.objects.filter(id=question.id) \
+                .update(date_created=start + timedelta(seconds=i // 2))
+
+    def test_pages(self):
+        self.add_questions(25)
+        pages = list(history.pages(self.game, page_size=10))
+        self.assertEqual([number for number, _ in pages], [1, 2, 3])
+        texts = [q.text for _, questions in pages for q in questions]
+        self.assertEqual(texts, ['q%d' % i for i in range(25)])
+
+        pages = list(history.pages(self.game, first_page=3, page_size=10))
+        self.assertEqual([q.text for q in pages[0][1]], ['q%d' % i for i in range(20, 25)])
+        self.assertEqual(list(history.pages(self.game, first_page=4, page_size=10)), [])
+
+    def test_chunks(self):
+        chunks = list(history.chunks(['x' * 10] * 10, limit=35))
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(all(len(chunk) <= 35 for chunk in chunks))
+
+    def test_history_posts_thread(self):
+        self.add_questions(3)
+        self.slack.handle_slash(slash('history'))
+        status, replies = self.transport.calls[0], self.transport.calls[1:]
+        self.assertEqual(status[0], 'chat.postMessage')
+        self.assertIn('Current Status', status[1]['text'])
+        self.assertEqual(len(replies), 1)
+        self.assertEqual(replies[0][1]['thread_ts'], '1.0001')
+        self.assertEqual(replies[0][1]['text'], '1. q0: Yes\n2. q1: No\n3. q2: No')
+
+    def test_history_through_outbox(self):
+        self.add_questions(3)
+        slack = Slack('token', self.transport, use_outbox=True)
+        slack.handle_slash(slash('history'))
+        header, reply = Outbox.objects.order_by('id')
+        self.assertEqual(reply.parent_id, header.id)
+
+    def test_empty_page(self):
+        self.slack.handle_slash(slash('history 2'))
+        self.assertEqual(self.transport.calls, [])
+        self.assertIn('No questions on page 2', self.transport.replies[-1][1]['text'])
@@ -0,0 +1,119 @@
+import json
+import time
+from urllib.parse import urlencode
+
+from django.test import Client, TestCase, override_settings
+
+from .. import clients, idempotency, signing
+from ..cache import get_active_games
+from ..models import Game, Installation, Stump
+from .clients_test import Clock
+from .slack_test import FakeTransport, action, slash
+
+class TestRequestCache(TestCase):
+    def test_claim_once_until_expired(self):
+        clock = Clock()
+        seen = idempotency.RequestCache(size=2, ttl=60, clock=clock)
+        self.assertTrue(seen.claim('a'))
+        self.assertFalse(seen.claim('a'))
+        clock.now += 61
+        self.assertTrue(seen.claim('a'))
+
+    def test_evicts_oldest(self):
+        seen = idempotency.RequestCache(size=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            seen.claim(key)
+        self.assertEqual(list(seen.entries), ['b', 'c'])
+        self.assertTrue(seen.claim('a'))
+
+    def test_shared_catches_other_process(self):
+        from django.core.cache.backends.locmem import LocMemCache
+        shared = LocMemCache('dedupe-test', {})
+        one = idempotency.RequestCache(shared=shared)
+        other = idempotency.RequestCache(shared=shared)
+        self.assertTrue(one.claim('action:T1:alice:{"id": 1}'))
+        self.assertFalse(other.claim('action:T1:alice:{"id": 1}'))
+        one.release('action:T1:alice:{"id": 1}')
+        self.assertTrue(other.claim('action:T1:alice:{"id": 1}'))
+
+@override_settings(SLACK_OATH_TOKEN='', SLACK_SIGNING_SECRET='s3cret')
+class TestRepeatedDeliveries(TestCase):
+    def setUp(self):
+        get_active_games().clear()
+        idempotency.get_requests().clear()
+        clients.get_clients().clear()
+        Installation.objects.create(team_id='T1', bot_token='xoxb-1')
+        self.transport = FakeTransport()
+        clients.get_clients().get('T1').transport = self.transport
+        self.client = Client()
+
+    def post(self, path, form, **headers):
+        body = urlencode(form)
+        timestamp = str(int(time.time()))
+        headers['HTTP_X_SLACK_REQUEST_TIMESTAMP'] = timestamp
+        headers['HTTP_X_SLACK_SIGNATURE'] = signing.signature('s3cret', timestamp,
+                                                              body.encode('utf-8'))
+        return self.client.post(path, body, content_type='application/x-www-form-urlencoded',
+                                **headers)
+
+    def post_slash(self, text, user='alice', trigger_id='', **headers):
+        form = dict(slash(text, user), team_id='T1', trigger_id=trigger_id)
+        return self.post('/slack/slash', form, **headers)
+
+    def post_action(self, type, id, value):
+        payload = dict(action(type, id, value), team={'id': 'T1'})
+        return self.post('/slack/action', {'payload': json.dumps(payload)})
+
+    def test_slash_retry_dropped(self):
+        self.post_slash('start Mike Tyson', trigger_id='1.2.abc')
+        replies = len(self.transport.replies)
+        response = self.post_slash('start Mike Tyson', trigger_id='1.2.abc')
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(len(self.transport.replies), replies)
+        self.assertEqual(Game.objects.count(), 1)
+
+    def test_retry_header_without_trigger(self):
+        self.post_slash('start Mike Tyson')
+        self.post_slash('status', HTTP_X_SLACK_RETRY_NUM='1')
+        self.post_slash('status', HTTP_X_SLACK_RETRY_NUM='2')
+        self.post_slash('status')
+        self.assertEqual(len(self.transport.replies), 3)
+
+    def test_double_click_dropped(self):
+        self.post_slash('start Mike Tyson')
+        self.post_slash('stump did you box?', user='bob')
+        stump = Stump.objects.get()
+        self.post_action('stump', stump.id, 'yes')
+        replies, calls = len(self.transport.replies), len(self.transport.calls)
+        self.post_action('stump', stump.id, 'no')
+        self.assertEqual((len(self.transport.replies), len(self.transport.calls)),
+                         (replies, calls))
+        self.assertTrue(Stump.objects.get().answer)
+
+    @override_settings(BOTTICELLI_DEFERRED=True)
+    def test_busy_delivery_can_retry(self):
+        from threading import Event
+        from .. import executor
+        started, blocked = Event(), Event()
+        full = executor.Executor(workers=1, queue_size=1, put_timeout=0)
+        full.submit('C1', lambda: started.set() or blocked.wait())
+        started.wait()
+        full.submit('C1', lambda: None)
+        old, executor._executor = executor._executor, full
+        try:
+            response = self.post_slash('start Mike Tyson', trigger_id='1.2.abc')
+            self.assertIn('busy', response.json()['text'])
+        finally:
+            blocked.set()
+            full.shutdown()
+            executor._executor = old
+        self.assertTrue(idempotency.get_requests().claim('slash:1.2.abc'))
+
+    def test_failed_delivery_can_retry(self):
+        from unittest import mock
+        from ..slack import Slack
+        with mock.patch.object(Slack, 'handle_slash', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.post_slash('start Mike Tyson', trigger_id='1.2.abc')
+        self.post_slash('start Mike Tyson', trigger_id='1.2.abc', HTTP_X_SLACK_RETRY_NUM='1')
+        self.assertEqual(Game.objects.count(), 1)
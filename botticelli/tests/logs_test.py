@@ -0,0 +1,84 @@
+import json
+import logging
+import unittest
+
+from .. import logs
+from ..executor import Executor
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+def record(message, *args):
+    return logging.LogRecord('botticelli', logging.INFO, __file__, 1, message, args, None)
+
+class TestLogs(unittest.TestCase):
+    def test_summarize(self):
+        summary = logs.summarize({
+            'token': 'secret',
+            'response_url': 'https://hooks.slack.com/x',
+            'original_message': {'text': 'x' * 1000},
+            'channel': {'id': 'C1', 'name': 'general'},
+            'text': 'y' * 300,
+        })
+        self.assertEqual(summary['token'], '<redacted>')
+        self.assertEqual(summary['response_url'], '<redacted>')
+        self.assertEqual(summary['original_message'], '<1012 chars>')
+        self.assertEqual(summary['channel'], {'id': 'C1', 'name': 'general'})
+        self.assertEqual(len(summary['text']), 203)
+
+    def test_json_format(self):
+        r = record('posting %s', 'hello')
+        r.request_id = 'abc'
+        entry = json.loads(logs.JsonFormatter().format(r))
+        self.assertEqual(entry['message'], 'posting hello')
+        self.assertEqual(entry['request_id'], 'abc')
+        self.assertEqual(entry['level'], 'INFO')
+
+    def test_async_handler(self):
+        handler = logs.AsyncHandler('botticelli.tests.logs_test.ListHandler')
+        handler.setFormatter(logging.Formatter('%(request_id)s %(message)s'))
+        logs.set_request_id('req1')
+        try:
+            handler.handle(record('one %d', 1))
+        finally:
+            logs.set_request_id('')
+        handler.stop()
+        self.assertEqual(handler.target.lines, ['req1 one 1'])
+
+    def test_async_handler_drops_when_full(self):
+        handler = logs.AsyncHandler('botticelli.tests.logs_test.ListHandler', queue_size=1)
+        handler.listener.stop()
+        handler.handle(record('one'))
+        handler.handle(record('two'))
+        self.assertEqual(handler.dropped, 1)
+
+    def test_restart_after_fork(self):
+        handler = logs.AsyncHandler('botticelli.tests.logs_test.ListHandler')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        # A forked child has the queue but not the listener thread
+        handler.listener.stop()
+        handler.handle(record('lost'))
+        handler.restart()
+        handler.handle(record('after'))
+        handler.stop()
+        self.assertEqual(handler.target.lines, ['after'])
+
+    def test_sampling(self):
+        self.assertFalse(any(logs.SampleFilter(0).filter(record('x')) for _ in range(100)))
+        self.assertTrue(all(logs.SampleFilter(1).filter(record('x')) for _ in range(100)))
+
+    def test_executor_carries_request_id(self):
+        pool = Executor(workers=1)
+        seen = []
+        logs.set_request_id('req2')
+        try:
+            pool.submit('C1', lambda _: seen.append(logs.get_request_id()), None)
+        finally:
+            logs.set_request_id('')
+        pool.shutdown()
+        self.assertEqual(seen, ['req2'])
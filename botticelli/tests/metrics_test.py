@@ -0,0 +1,82 @@
+import os
+import tempfile
+import subprocess
+import threading
+
+from django.test import TestCase, override_settings
+
+from .. import metrics
+
+class TestRegistry(TestCase):
+    def test_merges_threads(self):
+        registry = metrics.Registry()
+        tags = metrics.labels(method='chat.postMessage')
+
+        def work():
+            for _ in range(100):
+                registry.inc('botticelli_slack_calls_total', tags)
+                registry.observe('botticelli_slack_call_seconds', tags, 0.02)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        values = registry.snapshot()
+        self.assertEqual(values[('botticelli_slack_calls_total', tags)], 400)
+        self.assertEqual(values[('botticelli_slack_call_seconds', tags)][-1], 400)
+
+        text = metrics.render(values)
+        self.assertIn('botticelli_slack_calls_total{method="chat.postMessage"} 400', text)
+        self.assertIn('botticelli_slack_call_seconds_bucket{method="chat.postMessage",le="0.025"} 400', text)
+
+    def test_merges_processes(self):
+        directory = tempfile.mkdtemp()
+        other = metrics.Registry()
+        other.inc('botticelli_requests_total', metrics.labels(view='ping'), 2)
+        other.flush(directory)
+
+        os.rename(os.path.join(directory, '%d.json' % os.getpid()),
+                  os.path.join(directory, '1.json'))
+
+        registry = metrics.Registry()
+        registry.inc('botticelli_requests_total', metrics.labels(view='ping'))
+        with override_settings(BOTTICELLI_METRICS_DIR=directory):
+            values = registry.collect()
+        self.assertEqual(values[('botticelli_requests_total', (('view', 'ping'),))], 3)
+
+    def test_totals_kept_when_workers_go(self):
+        directory = tempfile.mkdtemp()
+        ping = ('botticelli_requests_total', (('view', 'ping'),))
+        connections = ('botticelli_db_pool_connections', (('state', 'idle'),))
+        killed = metrics.Registry()
+        killed.inc('botticelli_requests_total', metrics.labels(view='ping'), 2)
+        killed.collectors.append(lambda: {connections: 3})
+        killed.flush(directory)
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        dead = os.path.join(directory, '%d.json' % exited.pid)
+        os.rename(os.path.join(directory, '%d.json' % os.getpid()), dead)
+
+        registry = metrics.Registry()
+        registry.inc('botticelli_requests_total', metrics.labels(view='ping'))
+        with override_settings(BOTTICELLI_METRICS_DIR=directory):
+            values = registry.collect()
+            self.assertEqual(values[ping], 3)
+            # Its pool is gone with it
+            self.assertNotIn(connections, values)
+            self.assertFalse(os.path.exists(dead))
+            self.assertEqual(registry.collect()[ping], 3)
+
+            exiting = metrics.Registry()
+            exiting.inc('botticelli_requests_total', metrics.labels(view='ping'), 4)
+            exiting.retire(directory)
+            self.assertEqual(registry.collect()[ping], 7)
+
+class TestEndpoint(TestCase):
+    def test_requests_counted(self):
+        self.client.get('/ping')
+        response = self.client.get('/metrics')
+        self.assertIn(b'botticelli_requests_total{action="",status="200",view="ping"}',
+                      response.content)
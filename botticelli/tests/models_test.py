@@ -1,7 +1,10 @@
 import unittest
 
-from ..models import Game, Question, Stump, Phase
+from ..models import Game, Question, Stump, State
 
 class TestGame(unittest.TestCase):
-    def test_phase(self):
-        pass
+    def test_states(self):
+        states = [State.Stump, State.PendingStump, State.Question,
+                  State.PendingQuestion, State.Done, State.Cancelled]
+        self.assertEqual(len(set(states)), len(states))
+        self.assertEqual(Game().state, State.Stump)
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from .. import names
+from ..models import Game
+from ..slack import SlackException
+from .slack_test import SlackTestCase, slash
+
+NAMES = ['Mike Tyson', 'Ada Lovelace', 'Alan Turing', 'alan  turing', 'Alanis Morissette',
+         'Frida Kahlo', '', 'Émile Zola']
+
+class NamesTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'names.idx')
+        names.build(NAMES, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+class TestNameIndex(NamesTestCase):
+    def setUp(self):
+        super(TestNameIndex, self).setUp()
+        self.index = names.NameIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        super(TestNameIndex, self).tearDown()
+
+    def test_lookup(self):
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.lookup(' mike   TYSON '), 'Mike Tyson')
+        self.assertEqual(self.index.lookup('émile zola'), 'Émile Zola')
+        self.assertIsNone(self.index.lookup('Mike'))
+        self.assertIsNone(self.index.lookup('Zzz'))
+
+    def test_prefix(self):
+        self.assertEqual(self.index.prefix('ala'), ['Alan Turing', 'Alanis Morissette'])
+        self.assertEqual(self.index.prefix('a', limit=2), ['Ada Lovelace', 'Alan Turing'])
+        self.assertEqual(self.index.prefix('zz'), [])
+        self.assertEqual(self.index.prefix('alan', whole_word=True), ['Alan Turing'])
+
+    def test_not_an_index(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'Mike Tyson\n' * 4)
+        with self.assertRaises(ValueError):
+            names.NameIndex(self.path)
+
+class TestStart(NamesTestCase, SlackTestCase):
+    def setUp(self):
+        NamesTestCase.setUp(self)
+        SlackTestCase.setUp(self)
+
+    def test_trailing_spaces(self):
+        self.slack.handle_start(slash(''), 'Mike Tyson ')
+        self.assertEqual(Game.get_active('C1').letter, 'T')
+
+    def test_checked_against_dictionary(self):
+        with override_settings(BOTTICELLI_NAMES_PATH=self.path):
+            with self.assertRaisesRegex(SlackException, 'Did you mean: Mike Tyson\\?'):
+                self.slack.handle_slash(slash('start Mike Tison'))
+            self.slack.handle_slash(slash('start alan turing'))
+        game = Game.get_active('C1')
+        self.assertEqual((game.person, game.letter), ('Alan Turing', 'T'))
+
+    def test_first_word_suggestions(self):
+        with override_settings(BOTTICELLI_NAMES_PATH=self.path):
+            with self.assertRaisesRegex(SlackException, 'Did you mean: Alan Turing\\?'):
+                self.slack.handle_slash(slash('start Alan Turning'))
+
+    def test_forced(self):
+        with override_settings(BOTTICELLI_NAMES_PATH=self.path):
+            self.slack.handle_slash(slash('start !Sandro Botticelli'))
+        self.assertEqual(Game.get_active('C1').person, 'Sandro Botticelli')
+
+    def test_suggest(self):
+        with override_settings(BOTTICELLI_NAMES_PATH=self.path):
+            self.slack.handle_slash(slash('suggest alan'))
+        reply = self.transport.replies[-1][1]
+        self.assertEqual(reply['response_type'], 'ephemeral')
+        self.assertEqual(reply['text'], 'Alan Turing\nAlanis Morissette')
@@ -0,0 +1,162 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from ..models import Outbox, OutboxState, Stump
+from ..outbox import Dispatcher
+from ..ratelimit import RateLimiter
+from ..slack import Slack
+from .slack_test import SlackTestCase, FakeTransport, slash
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class RateLimitedTransport(FakeTransport):
+    def api_call(self, method, token, **kwargs):
+        if not self.calls:
+            self.calls.append(None)
+            return {'ok': False, 'error': 'ratelimited', 'retry_after': 0}
+        return super(RateLimitedTransport, self).api_call(method, token, **kwargs)
+
+class FailingTransport(FakeTransport):
+    def __init__(self, error):
+        super(FailingTransport, self).__init__()
+        self.error = error
+
+    def api_call(self, method, token, **kwargs):
+        self.calls.append((method, kwargs))
+        return {'ok': False, 'error': self.error}
+
+class TestOutbox(SlackTestCase):
+    def setUp(self):
+        super(TestOutbox, self).setUp()
+        self.slack = Slack('token', self.transport, use_outbox=True)
+        self.sender = Slack('token', self.transport, use_outbox=False)
+        self.clock = Clock()
+        self.dispatcher = Dispatcher(self.sender, RateLimiter(self.clock))
+
+    def drain(self):
+        for _ in range(20):
+            self.clock.now += 10
+            self.dispatcher.run_once()
+
+    def test_handlers_only_enqueue(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.assertEqual(self.transport.calls, [])
+        self.assertEqual(Outbox.objects.count(), 1)
+
+        self.drain()
+        self.assertEqual(self.transport.calls[0][0], 'chat.postMessage')
+        self.assertEqual(Stump.objects.get().thread_ts, '1.0001')
+
+    def test_channel_order_and_rate(self):
+        for i in range(3):
+            self.slack.send_message('msg %d' % i, 'C1')
+        self.slack.send_message('other', 'C2')
+
+        self.dispatcher.run_once()
+        self.assertEqual([c[1]['text'] for c in self.transport.calls], ['msg 0', 'other'])
+
+        self.drain()
+        self.assertEqual([c[1]['text'] for c in self.transport.calls],
+                         ['msg 0', 'other', 'msg 1', 'msg 2'])
+
+    def test_backed_off_channel_not_starving(self):
+        self.dispatcher.batch_size = 2
+        for i in range(3):
+            self.slack.send_message('msg %d' % i, 'C1')
+        Outbox.objects.update(not_before=timezone.now() + timedelta(hours=1))
+        self.slack.send_message('other', 'C2')
+        self.dispatcher.run_once()
+        self.assertEqual([c[1]['text'] for c in self.transport.calls], ['other'])
+
+    def test_status_coalesced(self):
+        self.slack.send_message('status 1', 'C1', coalesce_key='status')
+        self.slack.send_message('status 2', 'C1', coalesce_key='status')
+        self.drain()
+        self.assertEqual([c[1]['text'] for c in self.transport.calls], ['status 2'])
+
+    def test_retry_after(self):
+        self.dispatcher.slack = Slack('token', RateLimitedTransport(), use_outbox=False)
+        self.slack.send_message('hello', 'C1')
+        self.dispatcher.run_once()
+        self.assertEqual(Outbox.objects.get().state, OutboxState.Pending)
+        self.drain()
+        self.assertEqual(Outbox.objects.get().state, OutboxState.Sent)
+        self.assertEqual(Outbox.objects.get().attempts, 0)
+
+    def test_permanent_error_not_retried(self):
+        transport = FailingTransport('channel_not_found')
+        self.dispatcher.slack = Slack('token', transport, use_outbox=False)
+        self.slack.send_message('hello', 'C1')
+        self.drain()
+        self.assertEqual(len(transport.calls), 1)
+        row = Outbox.objects.get()
+        self.assertEqual((row.state, row.error), (OutboxState.Failed, 'channel_not_found'))
+
+    def test_server_error_retried(self):
+        transport = FailingTransport('http_503')
+        self.dispatcher.slack = Slack('token', transport, use_outbox=False)
+        self.dispatcher.backoff = 0
+        self.slack.send_message('hello', 'C1')
+        self.drain()
+        self.assertEqual(len(transport.calls), 5)
+        self.assertEqual(Outbox.objects.get().state, OutboxState.Failed)
+
+    def test_purge(self):
+        self.slack.send_message('old', 'C1')
+        self.slack.send_message('older parent', 'C2')
+        self.drain()
+        parent = Outbox.objects.get(channel='C2')
+        self.slack.send_thread_message('reply', 'C2', {'ok': True, 'outbox': parent})
+        self.slack.send_message('new', 'C3')
+        self.drain()
+        Outbox.objects.filter(channel__in=('C1', 'C2')) \
+            .update(date_updated=timezone.now() - timedelta(days=8))
+        # Make the reply wait, so its parent has to stay
+        Outbox.objects.filter(parent=parent).update(state=OutboxState.Pending)
+
+        self.assertEqual(self.dispatcher.purge(timezone.now()), 1)
+        self.assertEqual(sorted(Outbox.objects.values_list('channel', flat=True)),
+                         ['C2', 'C2', 'C3'])
+
+    def test_cancel_before_send(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.slack.handle_slash(slash('cancel stump'))
+        self.drain()
+        self.assertEqual(self.transport.calls, [])
+
+    def test_cancel_after_send(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.drain()
+        self.slack.handle_slash(slash('cancel stump'))
+        self.drain()
+        self.assertEqual(self.transport.calls[-1], ('chat.delete', {'channel': 'C1', 'ts': '1.0001'}))
+
+class TestDispatchers(TransactionTestCase):
+    def test_locked_head_skipped(self):
+        transport = FakeTransport()
+        Slack('token', transport, use_outbox=True).send_message('hello', 'C1')
+        dispatcher = Dispatcher(Slack('token', transport, use_outbox=False))
+
+        # Another dispatcher is in the middle of sending it
+        other = connection.copy()
+        other.set_autocommit(False)
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('SELECT id FROM botticelli_outbox FOR UPDATE')
+            self.assertEqual(dispatcher.run_once(), 0)
+        finally:
+            other.rollback()
+            other.close()
+        self.assertEqual(transport.calls, [])
+        self.assertEqual(dispatcher.run_once(), 1)
@@ -0,0 +1,28 @@
+import unittest
+
+from ..ring import HashRing
+
+class TestHashRing(unittest.TestCase):
+    def test_spread(self):
+        ring = HashRing(range(4))
+        counts = {}
+        for i in range(4000):
+            node = ring.node_for('C%d' % i)
+            counts[node] = counts.get(node, 0) + 1
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        self.assertTrue(all(600 < count < 1400 for count in counts.values()))
+
+    def test_adding_a_node_moves_only_its_keys(self):
+        ring = HashRing(range(4))
+        keys = ['C%d' % i for i in range(4000)]
+        before = {key: ring.node_for(key) for key in keys}
+        ring.add(4)
+        moved = [key for key in keys if ring.node_for(key) != before[key]]
+        self.assertTrue(all(ring.node_for(key) == 4 for key in moved))
+        self.assertTrue(400 < len(moved) < 1300)
+
+    def test_remove(self):
+        ring = HashRing(range(3))
+        ring.remove(1)
+        self.assertEqual(ring.nodes(), {0, 2})
+        self.assertNotEqual(ring.node_for('C1'), 1)
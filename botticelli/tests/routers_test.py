@@ -0,0 +1,71 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .. import routers
+from ..cache import get_active_games
+from ..models import Game
+from ..slack import Slack
+from .clients_test import Clock
+from .slack_test import FakeTransport, slash
+
+@override_settings(BOTTICELLI_REPLICAS=['replica'])
+class TestReplicaRouting(TransactionTestCase):
+    # The primary and the replica are two databases, the replica holding a
+    # different letter for the same game, so each reply shows where it read
+    multi_db = True
+
+    def setUp(self):
+        game = Game.objects.create(creator='alice', channel='C1', person='Primary', letter='P')
+        Game.objects.using('replica').create(id=game.id, creator='alice', channel='C1',
+                                             person='Replica', letter='R')
+        get_active_games().clear()
+        routers.get_recent_writes().clear()
+        self.transport = FakeTransport()
+        self.slack = Slack('token', self.transport)
+
+    def tearDown(self):
+        routers.reset()
+
+    def status(self):
+        with routers.unit_of_work():
+            self.slack.handle_slash(slash('status'))
+        return self.transport.replies[-1][1]['text']
+
+    def test_status_reads_replica(self):
+        self.assertIn('letter *R*', self.status())
+        # A replica's copy may be behind, so it was not cached
+        self.assertEqual(Game.get_active('C1').letter, 'P')
+
+    def test_pinned_after_write(self):
+        with routers.unit_of_work():
+            Game.objects.filter(channel='C2').update(letter='Q')
+            with routers.replica_reads('C1'):
+                self.assertIsNone(routers.read_alias())
+            self.assertTrue(routers.is_pinned())
+        self.assertFalse(routers.is_pinned())
+        self.assertIn('letter *R*', self.status())
+
+    def test_recently_written_channel(self):
+        Game.objects.filter(channel='C1').update(letter='Q')
+        routers.note_write('C1')
+        self.assertIn('letter *Q*', self.status())
+        with routers.unit_of_work(), routers.replica_reads('C2'):
+            self.assertEqual(routers.read_alias(), 'replica')
+
+    def test_primary_without_replicas(self):
+        with override_settings(BOTTICELLI_REPLICAS=[]):
+            self.assertIn('letter *P*', self.status())
+
+class TestRecentWrites(TestCase):
+    def test_expiry_and_bound(self):
+        clock = Clock()
+        writes = routers.RecentWrites(seconds=5, size=2, clock=clock)
+        writes.note('C1')
+        self.assertTrue(writes.contains('C1'))
+        self.assertFalse(writes.contains('C2'))
+        clock.now += 5
+        self.assertFalse(writes.contains('C1'))
+
+        for channel in ('C1', 'C2', 'C3'):
+            writes.note(channel)
+        self.assertFalse(writes.contains('C1'))
+        self.assertTrue(writes.contains('C3'))
@@ -0,0 +1,83 @@
+from django.test import TestCase
+
+from .. import similar
+from ..models import Game, Question, State, Stump
+from .slack_test import SlackTestCase, action, slash
+
+class TestTextIndex(TestCase):
+    def test_match(self):
+        index = similar.TextIndex()
+        index.add(0, 'Are you alive?')
+        index.add(1, 'Did you paint the Birth of Venus?')
+        self.assertEqual(index.match('are you  ALIVE', 0.7)[:2], (0, 'Are you alive?'))
+        self.assertIsNone(index.match('are you a live action hero?', 0.7))
+
+    def test_truncate(self):
+        index = similar.TextIndex()
+        index.add(0, 'are you alive')
+        index.add(1, 'are you dead')
+        index.truncate(1)
+        self.assertEqual(len(index), 1)
+        self.assertIsNone(index.match('are you dead', 0.7))
+        index.add(1, 'are you a boxer')
+        self.assertEqual(index.match('are you a boxer', 0.7)[0], 1)
+
+class TestRepeats(SlackTestCase):
+    def setUp(self):
+        super(TestRepeats, self).setUp()
+        similar.get_indexes().clear()
+        self.slack.handle_slash(slash('start Mike Tyson'))
+
+    def answer_stump(self, value):
+        stump = Stump.objects.latest('id')
+        self.slack.handle_action(action('stump', stump.id, value))
+
+    def test_repeated_question(self):
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.answer_stump('yes')
+        self.slack.handle_slash(slash('ask are you alive?', user='bob'))
+        self.slack.handle_action(action('question', Question.objects.get().id, 'no'))
+        self.slack.handle_slash(slash('stump are you a boxer?', user='bob'))
+        self.answer_stump('yes')
+
+        self.slack.handle_slash(slash('ask Are you alive', user='carol'))
+        self.assertEqual(Question.objects.count(), 1)
+        reply = self.transport.replies[-1][1]
+        self.assertEqual(reply['response_type'], 'ephemeral')
+        self.assertIn('*are you alive?* - No', reply['text'])
+
+        self.slack.handle_slash(slash('ask !Are you alive', user='carol'))
+        self.assertEqual(Question.objects.latest('id').text, 'Are you alive')
+        self.assertEqual(Game.get_active('C1').state, State.PendingQuestion)
+
+    def test_repeated_stump(self):
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.answer_stump('no')
+        self.slack.handle_slash(slash('stump Did you box', user='carol'))
+        self.assertEqual(Stump.objects.count(), 1)
+        self.assertIn('*did you box?* - Not stumped', self.transport.replies[-1][1]['text'])
+
+        # Indexed stumpers are only read again when the game has a newer one
+        game = Game.get_active('C1')
+        with self.assertNumQueries(0):
+            self.assertIsNone(similar.get_indexes().stump(game, 'are you a painter?'))
+
+    def test_cancelled_stump_not_repeated(self):
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.slack.handle_slash(slash('cancel stump'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.assertEqual(Stump.objects.get().text, 'did you box?')
+
+    def test_stumps_read_without_lock(self):
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.answer_stump('no')
+        indexes = similar.SimilarityIndexes()
+        new_stumps = similar.new_stumps
+        locked = []
+        similar.new_stumps = lambda *args: locked.append(indexes.lock.locked()) or new_stumps(*args)
+        try:
+            match = indexes.stump(Game.get_active('C1'), 'did you box')
+        finally:
+            similar.new_stumps = new_stumps
+        self.assertEqual(match, ('did you box?', False))
+        self.assertEqual(locked, [False])
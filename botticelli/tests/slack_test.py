@@ -0,0 +1,121 @@
+import json
+
+from django.db import connection
+from django.test import TestCase
+
+from ..cache import get_active_games
+from ..models import Game, Question, Stump, State
+from ..slack import Slack, SlackException
+
+class FakeTransport(object):
+    def __init__(self):
+        self.calls = []
+        self.replies = []
+
+    def api_call(self, method, token, **kwargs):
+        self.calls.append((method, kwargs))
+        return {'ok': True, 'ts': '%d.0001' % len(self.calls)}
+
+    def post_json(self, url, data):
+        self.replies.append((url, data))
+
+def slash(text, user='alice', channel='C1'):
+    return {'text': text, 'user_name': user, 'channel_id': channel,
+            'response_url': 'http://hooks.test/response'}
+
+def action(type, id, value, user='alice', channel='C1'):
+    return {'callback_id': json.dumps({'type': type, 'id': id}),
+            'actions': [{'value': value}],
+            'original_message': {'text': 'original'},
+            'channel': {'id': channel},
+            'user': {'name': user},
+            'response_url': 'http://hooks.test/response'}
+
+class SlackTestCase(TestCase):
+    def setUp(self):
+        get_active_games().clear()
+        self.transport = FakeTransport()
+        self.slack = Slack('token', self.transport)
+
+class TestGameFlow(SlackTestCase):
+    def test_full_round(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        game = Game.get_active('C1')
+        self.assertEqual(game.letter, 'T')
+
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        stump = Stump.objects.get()
+        self.assertEqual(Game.get_active('C1').state, State.PendingStump)
+
+        self.slack.handle_action(action('stump', stump.id, 'yes'))
+        self.assertEqual(Game.get_active('C1').state, State.Question)
+
+        self.slack.handle_slash(slash('ask are you alive?', user='bob'))
+        question = Question.objects.get()
+        self.slack.handle_action(action('question', question.id, 'no'))
+        self.assertEqual(Game.get_active('C1').state, State.Stump)
+        self.assertFalse(Question.objects.get().answer)
+        self.assertEqual(Game.get_active('C1').transcript,
+                         'Previous questions:\n\nare you alive?: No')
+
+    def test_double_click(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        stump = Stump.objects.get()
+        self.slack.handle_action(action('stump', stump.id, 'no'))
+        with self.assertRaises(SlackException):
+            self.slack.handle_action(action('stump', stump.id, 'yes'))
+        self.assertFalse(Stump.objects.get().answer)
+        self.assertEqual(Game.get_active('C1').state, State.Stump)
+
+    def test_question_double_click(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.slack.handle_action(action('stump', Stump.objects.get().id, 'yes'))
+        self.slack.handle_slash(slash('ask are you alive?', user='bob'))
+        question = Question.objects.get()
+        self.slack.handle_action(action('question', question.id, 'no'))
+        with self.assertRaisesRegex(SlackException, 'already been answered'):
+            self.slack.handle_action(action('question', question.id, 'yes'))
+        self.assertFalse(Question.objects.get().answer)
+        self.assertEqual(Game.get_active('C1').state, State.Stump)
+
+    def test_cancel_deletes_after_commit(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.slack.handle_slash(slash('cancel stump'))
+        self.assertNotIn('chat.delete', [method for method, _ in self.transport.calls])
+        # The test's transaction never commits, run what was left for then
+        for _, func in connection.run_on_commit:
+            func()
+        self.assertEqual(self.transport.calls[-1], ('chat.delete', {'channel': 'C1', 'ts': '1.0001'}))
+
+    def test_transition_lost(self):
+        game = Game.objects.create(creator='alice', channel='C1', person='x', letter='X')
+        stale = Game.objects.get(id=game.id)
+        self.assertTrue(game.transition(State.Stump, State.PendingStump))
+        self.assertFalse(stale.transition(State.Stump, State.PendingStump))
+
+class TestActiveGameCache(SlackTestCase):
+    def test_status_is_one_query(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        get_active_games().clear()
+        with self.assertNumQueries(1):
+            self.slack.get_status('C1')
+
+    def test_hit_skips_database(self):
+        Game.objects.create(creator='alice', channel='C1', person='x', letter='X')
+        Game.get_active('C1')
+        with self.assertNumQueries(0):
+            self.assertEqual(Game.get_active('C1').creator, 'alice')
+
+    def test_save_invalidates(self):
+        game = Game.objects.create(creator='alice', channel='C1', person='x', letter='X')
+        self.assertIsNone(Game.get_active('C1').get_active_stump())
+        stump = game.stump_set.create(creator='bob', text='stumper')
+        game.transition(State.Stump, State.PendingStump, pending_stump=stump)
+        self.assertEqual(Game.get_active('C1').get_active_stump().text, 'stumper')
+        game.state = State.Done
+        game.save()
+        self.assertIsNone(Game.get_active('C1'))
@@ -0,0 +1,132 @@
+import json
+import queue
+import threading
+
+import websocket
+from django.test import TestCase, override_settings
+
+from .. import clients, idempotency, socketmode
+from ..cache import get_active_games
+from ..models import Game, Installation, Stump
+from .slack_test import FakeTransport, action, slash
+
+class FakeSocket(object):
+    """
+    Stands in for a Socket Mode websocket: the test queues what Slack
+    sends, '' for a close, and what we send back is kept in `sent`
+    """
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.sent = []
+        self.closed = False
+
+    def recv(self):
+        try:
+            return self.incoming.get(timeout=0.01)
+        except queue.Empty:
+            raise websocket.WebSocketTimeoutException('timed out')
+
+    def send(self, text):
+        self.sent.append(json.loads(text))
+
+    def close(self):
+        self.closed = True
+
+class FakeSlackApps(FakeTransport):
+    """Opens connections to FakeSockets, or fails while `failing`"""
+    def __init__(self):
+        super(FakeSlackApps, self).__init__()
+        self.sockets = []
+        self.failing = 0
+        self.opened = threading.Event()
+
+    def api_call(self, method, token, **kwargs):
+        if method != 'apps.connections.open':
+            return super(FakeSlackApps, self).api_call(method, token, **kwargs)
+        if self.failing:
+            self.failing -= 1
+            return {'ok': False, 'error': 'invalid_auth'}
+        self.sockets.append(FakeSocket())
+        self.opened.set()
+        return {'ok': True, 'url': 'wss://fake/%d' % len(self.sockets)}
+
+    def connect(self, url, timeout):
+        return self.sockets[int(url.rsplit('/', 1)[1]) - 1]
+
+def envelope(id, type, payload, retry_attempt=0):
+    return {'envelope_id': id, 'type': type, 'payload': payload,
+            'retry_attempt': retry_attempt}
+
+@override_settings(SLACK_OATH_TOKEN='')
+class TestSocketConnection(TestCase):
+    def setUp(self):
+        get_active_games().clear()
+        idempotency.get_requests().clear()
+        clients.get_clients().clear()
+        Installation.objects.create(team_id='T1', bot_token='xoxb-1')
+        self.transport = FakeTransport()
+        clients.get_clients().get('T1').transport = self.transport
+        self.apps = FakeSlackApps()
+        self.stop = threading.Event()
+        self.connection = socketmode.SocketConnection('xapp-1', self.apps, self.stop,
+                                                      connect=self.apps.connect,
+                                                      deferred=False)
+        self.connection.socket = self.connection.open()
+
+    def send_slash(self, id, text, user='alice', trigger_id='', retry_attempt=0):
+        payload = dict(slash(text, user), team_id='T1', trigger_id=trigger_id)
+        self.connection.handle(envelope(id, 'slash_commands', payload, retry_attempt))
+
+    def test_acked_and_handled(self):
+        self.send_slash('e1', 'start Mike Tyson', trigger_id='1.2.abc')
+        self.send_slash('e1', 'start Mike Tyson', trigger_id='1.2.abc', retry_attempt=1)
+        self.assertEqual(self.apps.sockets[0].sent, [{'envelope_id': 'e1'}] * 2)
+        self.assertEqual(Game.objects.count(), 1)
+
+        self.send_slash('e2', 'stump did you box?', user='bob')
+        payload = dict(action('stump', Stump.objects.get().id, 'yes'), team={'id': 'T1'})
+        self.connection.handle(envelope('e3', 'interactive', payload))
+        self.assertTrue(Stump.objects.get().answer)
+
+    def test_not_installed_gets_reply(self):
+        payload = dict(slash('start Mike Tyson'), team_id='T2')
+        self.connection.handle(envelope('e1', 'slash_commands', payload))
+        self.assertEqual(self.apps.sockets[0].sent, [{'envelope_id': 'e1'}])
+        self.assertIn('not installed', self.apps.replies[-1][1]['text'])
+
+    def test_app_tokens(self):
+        Installation.objects.create(team_id='T2', bot_token='xoxb-2', app_token='xapp-2')
+        Installation.objects.create(team_id='T3', bot_token='xoxb-3', app_token='xapp-1')
+        with override_settings(SLACK_APP_TOKEN='xapp-1'):
+            self.assertEqual(socketmode.app_tokens(), ['xapp-1', 'xapp-2'])
+
+class TestReconnect(TestCase):
+    def test_backoff_and_disconnect(self):
+        apps = FakeSlackApps()
+        apps.failing = 2
+        stop = threading.Event()
+        connection = socketmode.SocketConnection('xapp-1', apps, stop, connect=apps.connect,
+                                                 max_backoff=0.02)
+        delays = []
+        next_delay = connection.backoff.next_delay
+        connection.backoff.next_delay = lambda: delays.append(next_delay()) or delays[-1]
+        thread = threading.Thread(target=connection.run)
+        thread.start()
+        try:
+            self.assertTrue(apps.opened.wait(5))
+            first = apps.sockets[0]
+            first.incoming.put(json.dumps({'type': 'hello'}))
+            first.incoming.put(json.dumps({'type': 'disconnect', 'reason': 'refresh_requested'}))
+            while len(apps.sockets) < 2:
+                stop.wait(0.01)
+            # A refresh reconnects without waiting, a closed socket waits again
+            self.assertEqual(len(delays), 2)
+            apps.sockets[1].incoming.put('')
+            while len(apps.sockets) < 3:
+                stop.wait(0.01)
+            self.assertEqual(len(delays), 3)
+            self.assertEqual(connection.backoff.attempts, 1)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertTrue(first.closed and apps.sockets[1].closed)
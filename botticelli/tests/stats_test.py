@@ -0,0 +1,59 @@
+from .. import archive, stats
+from ..models import Game, PlayerStats, Question, State, Stump
+from ..slack import SlackException
+from .slack_test import SlackTestCase, action, slash
+
+def counters():
+    return {(row.channel, row.username): {c: getattr(row, c) for c in stats.COUNTERS}
+            for row in PlayerStats.objects.all()}
+
+class TestStats(SlackTestCase):
+    def play(self):
+        self.slack.handle_slash(slash('start Mike Tyson'))
+        self.slack.handle_slash(slash('stump did you box?', user='bob'))
+        self.slack.handle_action(action('stump', Stump.objects.latest('id').id, 'no'))
+        self.slack.handle_slash(slash('stump did you bite an ear?', user='carol'))
+        self.slack.handle_action(action('stump', Stump.objects.latest('id').id, 'yes'))
+        self.slack.handle_slash(slash('ask are you alive?', user='carol'))
+        self.slack.handle_action(action('question', Question.objects.latest('id').id, 'yes'))
+        self.slack.handle_slash(slash('ask are you a boxer?', user='carol'))
+        self.slack.handle_action(action('question', Question.objects.latest('id').id, 'no'))
+
+    def test_counters(self):
+        self.play()
+        carol, channel = stats.get_stats('C1', 'carol')
+        self.assertEqual((carol.stumps_won, carol.stumps_asked), (1, 1))
+        self.assertEqual((carol.questions_hit, carol.questions_asked), (1, 2))
+        alice, _ = stats.get_stats('C1', 'alice')
+        self.assertEqual((alice.games_started, alice.stumps_lost, alice.stumps_faced,
+                          alice.questions_faced), (1, 1, 2, 2))
+        self.assertEqual((channel.stumps_won, channel.stumps_asked), (1, 2))
+
+    def test_lost_answer_not_counted(self):
+        self.play()
+        before = counters()
+        self.slack.handle_slash(slash('stump did you sing?', user='bob'))
+        stump = Stump.objects.latest('id')
+        Stump.objects.filter(id=stump.id).update(answer=False)
+        with self.assertRaisesRegex(SlackException, 'already been answered'):
+            self.slack.handle_action(action('stump', stump.id, 'yes'))
+        self.assertEqual(counters(), before)
+
+    def test_rebuild_matches(self):
+        self.play()
+        game = Game.objects.get()
+        game.transition(game.state, State.Cancelled)
+        self.slack.handle_slash(slash('start Ada Lovelace', user='bob'))
+        archive.archive(days=-1)
+        incremental = counters()
+
+        PlayerStats.objects.all().delete()
+        stats.rebuild()
+        self.assertEqual(counters(), incremental)
+
+    def test_commands(self):
+        self.play()
+        self.slack.handle_slash(slash('stats @carol'))
+        self.assertIn('1 of 2 questions (50%)', self.transport.replies[-1][1]['text'])
+        self.slack.handle_slash(slash('leaderboard'))
+        self.assertIn('1. *carol* - 1 of 1 stumper', self.transport.replies[-1][1]['text'])
@@ -0,0 +1,32 @@
+import unittest
+
+from .. import transcript
+
+class Q(object):
+    def __init__(self, text, answer):
+        self.text, self.answer = text, answer
+
+class TestTranscript(unittest.TestCase):
+    def test_render_groups_runs_of_yes(self):
+        text = transcript.render([Q('a', True), Q('b', False), Q('c', True), Q('d', None)])
+        self.assertEqual(transcript.sections(text),
+                         ['Previous questions:', 'a: Yes\nb: No', 'c: Yes\nd: Pending'])
+
+    def test_incremental_matches_render(self):
+        text = transcript.add_question('', 'a')
+        text = transcript.answer_question(text, True)
+        text = transcript.add_question(text, 'b')
+        text = transcript.answer_question(text, False)
+        text = transcript.add_question(text, 'c')
+        self.assertEqual(text, transcript.render([Q('a', True), Q('b', False), Q('c', None)]))
+
+    def test_remove_pending(self):
+        self.assertEqual(transcript.remove_question(transcript.add_question('', 'a')), '')
+        text = transcript.render([Q('a', True), Q('b', None)])
+        self.assertEqual(transcript.remove_question(text), transcript.render([Q('a', True)]))
+        text = transcript.render([Q('a', False), Q('b', None)])
+        self.assertEqual(transcript.remove_question(text), transcript.render([Q('a', False)]))
+
+    def test_answer_without_pending(self):
+        with self.assertRaises(ValueError):
+            transcript.answer_question(transcript.render([Q('a', True)]), True)
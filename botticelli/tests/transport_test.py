@@ -0,0 +1,50 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from ..transport import Transport
+
+def response(status_code, body=None, headers=None, text=''):
+    """A stand-in for a requests.Response, `body` is its JSON or None for none"""
+    ret = mock.Mock(status_code=status_code, headers=headers or {}, text=text)
+    if body is None:
+        ret.json.side_effect = ValueError('No JSON object could be decoded')
+    else:
+        ret.json.return_value = body
+    return ret
+
+class TestTransport(TestCase):
+    def setUp(self):
+        self.transport = Transport(api_url='https://slack.test/api/', connect_timeout=2,
+                                   read_timeout=7)
+
+    def call(self, reply, **kwargs):
+        with mock.patch.object(self.transport.session, 'post', return_value=reply) as post:
+            ret = self.transport.api_call('chat.postMessage', 'xoxb-1', **kwargs)
+        return ret, post
+
+    def test_call(self):
+        ret, post = self.call(response(200, {'ok': True, 'ts': '1.0001'}),
+                              channel='C1', attachments=[{'text': 'hi'}])
+        self.assertEqual(ret, {'ok': True, 'ts': '1.0001'})
+        post.assert_called_once_with('https://slack.test/api/chat.postMessage',
+                                     data={'token': 'xoxb-1', 'channel': 'C1',
+                                           'attachments': '[{"text": "hi"}]'},
+                                     timeout=(2, 7))
+
+    def test_rate_limited(self):
+        ret, _ = self.call(response(429, headers={'Retry-After': '30'}))
+        self.assertEqual(ret, {'ok': False, 'error': 'ratelimited', 'retry_after': 30})
+        ret, _ = self.call(response(429))
+        self.assertEqual(ret['retry_after'], 1)
+
+    def test_not_json(self):
+        ret, _ = self.call(response(503, text='<html>Service Unavailable</html>'))
+        self.assertEqual(ret, {'ok': False, 'error': 'http_503'})
+
+    def test_response_url_timeout(self):
+        with mock.patch.object(self.transport.session, 'post',
+                               return_value=response(200)) as post:
+            self.transport.post_json('https://hooks.slack.test/1', {'text': 'hi'})
+        post.assert_called_once_with('https://hooks.slack.test/1', json={'text': 'hi'},
+                                     timeout=(2, 7))
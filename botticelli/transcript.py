@@ -0,0 +1,49 @@
+"""
+The "Previous questions" transcript shown by status.
+
+Questions are grouped into runs: a run continues while the answers are
+Yes and ends at the first No. Runs are separated by a blank line and the
+whole thing starts with a header line. The transcript is stored on the
+game and edited in place as questions are asked, answered and cancelled,
+so showing it never has to read the question history.
+"""
+
+HEADER = 'Previous questions:'
+
+PENDING, YES, NO = 'Pending', 'Yes', 'No'
+
+def status_of(answer):
+    if answer is None:
+        return PENDING
+    return YES if answer else NO
+
+def render(questions):
+    """Build the transcript from scratch out of ordered questions"""
+    transcript = ''
+    for question in questions:
+        transcript = add_question(transcript, question.text, question.answer)
+    return transcript
+
+def add_question(transcript, text, answer=None):
+    line = '%s: %s' % (text, status_of(answer))
+    if not transcript:
+        return HEADER + '\n\n' + line
+    if transcript.endswith(': ' + YES):
+        return transcript + '\n' + line
+    return transcript + '\n\n' + line
+
+def answer_question(transcript, answer):
+    """Fill in the answer of the pending question, always the last line"""
+    if not transcript.endswith(': ' + PENDING):
+        raise ValueError('No pending question in transcript')
+    return transcript[:-len(PENDING)] + status_of(answer)
+
+def remove_question(transcript):
+    """Drop the pending question, always the last line"""
+    if not transcript.endswith(': ' + PENDING):
+        raise ValueError('No pending question in transcript')
+    head = transcript[:transcript.rfind('\n')].rstrip('\n')
+    return '' if head == HEADER else head
+
+def sections(transcript):
+    return transcript.split('\n\n') if transcript else []
@@ -0,0 +1,93 @@
+import json
+import time
+import logging
+import threading
+
+from botticelli import metrics
+
+logger = logging.getLogger('botticelli')
+
+class Transport(object):
+    """
+    Shared HTTP client for everything we send to Slack.
+
+    One requests.Session holds a urllib3 pool per host (slack.com,
+    hooks.slack.com, ...) with up to `pool_size` kept-alive connections
+    each, so repeated calls reuse an open TLS connection instead of doing
+    a new handshake. Sessions are safe to share between worker threads.
+    """
+    def __init__(self, api_url='https://slack.com/api/', pool_size=10,
+                 connect_timeout=3.05, read_timeout=10):
+        # requests is slow to import, leave it until a transport is needed
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+
+        adapter = HTTPAdapter(pool_connections=4,
+                              pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def api_call(self, method, token, **kwargs):
+        """Call a Slack Web API method and return the decoded response"""
+        data = {'token': token}
+        for key, value in kwargs.items():
+            if not isinstance(value, str):
+                value = json.dumps(value)
+            data[key] = value
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.api_url + method,
+                                         data=data,
+                                         timeout=self.timeout)
+        except Exception as e:
+            metrics.observe_slack_call(method, time.perf_counter() - start, type(e).__name__)
+            raise
+
+        if response.status_code == 429:
+            ret = {'ok': False, 'error': 'ratelimited',
+                   'retry_after': int(response.headers.get('Retry-After', 1))}
+        else:
+            try:
+                ret = response.json()
+            except ValueError:
+                logger.error('%s returned %s: %s', method, response.status_code, response.text[:200])
+                ret = {'ok': False, 'error': 'http_%d' % response.status_code}
+
+        metrics.observe_slack_call(method, time.perf_counter() - start,
+                                   'ok' if ret.get('ok') else ret.get('error', 'unknown'))
+        return ret
+
+    def post_json(self, url, data):
+        start = time.perf_counter()
+        try:
+            response = self.session.post(url, json=data, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            metrics.observe_slack_call('response_url', time.perf_counter() - start, type(e).__name__)
+            raise
+        metrics.observe_slack_call('response_url', time.perf_counter() - start, 'ok')
+        return response
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def new_transport():
+    from django.conf import settings
+
+    return Transport(api_url=settings.SLACK_API_URL,
+                     pool_size=settings.SLACK_HTTP_POOL_SIZE,
+                     connect_timeout=settings.SLACK_HTTP_CONNECT_TIMEOUT,
+                     read_timeout=settings.SLACK_HTTP_READ_TIMEOUT)
+
+def get_transport():
+    global _transport
+
+    with _transport_lock:
+        if _transport is None:
+            _transport = new_transport()
+        return _transport
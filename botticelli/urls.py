@@ -1,14 +1,25 @@
 """botticelli URL Configuration"""
 
+from django.conf import settings
 from django.conf.urls import url
-from django.contrib import admin
 from botticelli import views
 
-admin.autodiscover()
+# Served by botticelli.fastpath ahead of the middleware stack when running
+# under botticelli.wsgi, and through the urlpatterns below otherwise
+slack_routes = {
+    '/slack/slash': views.slack_slash,
+    '/slack/action': views.slack_action,
+}
 
 urlpatterns = [
-    url(r'^admin/', admin.site.urls),
     url(r'^slack/slash$', views.slack_slash),
     url(r'^slack/action$', views.slack_action),
-    url(r'^ping$', views.ping)
+    url(r'^ping$', views.ping),
+    url(r'^metrics$', views.metrics_view)
 ]
+
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+
+    admin.autodiscover()
+    urlpatterns.append(url(r'^admin/', admin.site.urls))
@@ -1,33 +1,150 @@
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.conf import settings
 
 import json
 import logging
 from botticelli import slack
+from botticelli import clients
+from botticelli import executor
+from botticelli import metrics
+from botticelli import logs
+from botticelli import idempotency
+from botticelli import signing
+from botticelli import routers
 
 logger = logging.getLogger('botticelli')
+call_logger = logging.getLogger('botticelli.calls')
 
-_slack = slack.Slack(settings.SLACK_OATH_TOKEN)
+BUSY_REPLY = {
+    'response_type': 'ephemeral',
+    'replace_original': False,
+    'text': 'Botticelli is busy, please try again in a moment'
+}
+
+NOT_INSTALLED_REPLY = {
+    'response_type': 'ephemeral',
+    'replace_original': False,
+    'text': 'Botticelli is not installed in this workspace'
+}
+
+def action_of(payload):
+    return json.loads(payload['callback_id']).get('type', '')
+
+def run_slash(client, data, key=None):
+    with metrics.track_handler('slash', client.slash_action(data)), routers.unit_of_work():
+        try:
+            client.handle_slash(data)
+        except slack.SlackException as e:
+            client.reply_ephemeral_text('Error: ' + str(e), data['response_url'])
+        except Exception:
+            turned_away(key)
+            raise
+
+def run_action(client, payload, key=None):
+    with metrics.track_handler('action', action_of(payload)), routers.unit_of_work():
+        try:
+            client.handle_action(payload)
+        except slack.SlackException as e:
+            client.reply_ephemeral_text('Error: ' + str(e), payload['response_url'])
+        except Exception:
+            turned_away(key)
+            raise
+
+def is_repeat(key):
+    """Claim the delivery's key, True if it was already handled"""
+    if key is None or idempotency.get_requests().claim(key):
+        return False
+    # Not the key itself, slash keys hold the trigger_id
+    call_logger.info('Dropping repeated %s delivery', key.split(':')[0])
+    return True
+
+def turned_away(key):
+    # Let the same delivery through again, it was never handled or failed
+    if key is not None:
+        idempotency.get_requests().release(key)
+
+def defer(channel, func, client, data, key, deferred=None):
+    """
+    Run func(client, data, key) on the background executor, or inline when
+    deferred mode is off. Returns False if the executor has no room for it.
+    """
+    if deferred is None:
+        deferred = settings.BOTTICELLI_DEFERRED
+    if not deferred:
+        func(client, data, key)
+        return True
+
+    try:
+        executor.get_executor().submit(channel, func, client, data, key)
+    except executor.ExecutorFull as e:
+        logger.warning('Dropping request for %s: %s', channel, e)
+        return False
+    return True
+
+def dispatch_slash(data, key, deferred=None):
+    """
+    Hand a slash command to its workspace's client, returns (action, reply):
+    the action for metrics, or None if the team isn't installed, and the
+    reply for Slack if the command was turned away
+    """
+    client = clients.get_clients().get(data.get('team_id', ''))
+    if client is None:
+        turned_away(key)
+        return None, NOT_INSTALLED_REPLY
+    if not defer(data['channel_id'], run_slash, client, data, key, deferred):
+        turned_away(key)
+        return client.slash_action(data), BUSY_REPLY
+    return client.slash_action(data), None
+
+def dispatch_action(payload, key, deferred=None):
+    """A button click's (action, reply), like dispatch_slash"""
+    client = clients.get_clients().get(payload.get('team', {}).get('id', ''))
+    if client is None:
+        turned_away(key)
+        return None, NOT_INSTALLED_REPLY
+    if not defer(payload['channel']['id'], run_action, client, payload, key, deferred):
+        turned_away(key)
+        return action_of(payload), BUSY_REPLY
+    return action_of(payload), None
+
+def respond(request, action, reply):
+    if action is not None:
+        request.botticelli_action = action
+    return JsonResponse(reply) if reply else HttpResponse()
 
 @csrf_exempt
 @require_POST
 def slack_slash(request):
-    logger.info(request.POST.urlencode())
-    try:
-        _slack.handle_slash(request.POST)
-    except slack.SlackException as e:
-        _slack.reply_ephemeral_text('Error: ' + str(e), request.POST['response_url'])
-    return HttpResponse()
+    if not signing.verify(request):
+        return HttpResponseForbidden()
+    data = request.POST.copy()
+    call_logger.info('slash %s', logs.Summary(data))
+    if 'channel_id' not in data or 'response_url' not in data:
+        return HttpResponseBadRequest()
+    key = idempotency.slash_key(data, 'HTTP_X_SLACK_RETRY_NUM' in request.META)
+    if is_repeat(key):
+        return respond(request, 'repeat', None)
+    return respond(request, *dispatch_slash(data, key))
 
 @csrf_exempt
 @require_POST
 def slack_action(request):
+    if not signing.verify(request):
+        return HttpResponseForbidden()
     payload = json.loads(request.POST['payload'])
-    logger.info(payload)
-    _slack.handle_action(payload)
-    return HttpResponse()
+    call_logger.info('action %s', logs.Summary(payload))
+    if 'channel' not in payload or 'response_url' not in payload:
+        return HttpResponseBadRequest()
+    key = idempotency.action_key(payload)
+    if is_repeat(key):
+        return respond(request, 'repeat', None)
+    return respond(request, *dispatch_action(payload, key))
 
 def ping(request):
     return HttpResponse()
+
+def metrics_view(request):
+    return HttpResponse(metrics.render(metrics.registry.collect()),
+                        content_type='text/plain; version=0.0.4')
@@ -3,6 +3,13 @@ WSGI config for botticelli project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+Requests to the Slack endpoints skip the middleware stack, see
+botticelli.fastpath.
+
+Loading the URLconf and the HTTP client here, rather than on the first
+request, means a server that preloads the app (see gunicorn.conf.py) pays
+for the imports once, before forking its workers.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/1.10/howto/deployment/wsgi/
 """
@@ -13,4 +20,19 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "botticelli.settings")
 
-application = get_wsgi_application()
+from botticelli.fastpath import FastPath
+
+application = FastPath(get_wsgi_application())
+
+def warm_up():
+    from django.urls import get_resolver
+
+    # Imports the views, the Slack handlers and the models
+    get_resolver().url_patterns
+    # The transport imports it on first use
+    import requests
+    # Mapped before forking, the workers share the mapping
+    from botticelli import names
+    names.get_names()
+
+warm_up()
@@ -0,0 +1,37 @@
+"""
+gunicorn settings for the web process, see Procfile.
+
+The app is loaded once in the master and the workers are forked from it,
+so a new or restarted worker is ready as soon as it forks. Each worker is
+one process with a few threads; deferred handling runs its own threads
+inside it.
+"""
+
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+# Slack gives up on a request after 3 seconds
+timeout = 30
+graceful_timeout = int(os.environ.get('BOTTICELLI_DRAIN_TIMEOUT', 10)) + 5
+keepalive = 75
+accesslog = None
+
+def post_fork(server, worker):
+    # Threads don't survive fork(), the log listener has to start again.
+    # Database connections are opened lazily, so none are shared.
+    from botticelli import logs
+    logs.after_fork()
+
+def worker_exit(server, worker):
+    from django.conf import settings
+    from botticelli import executor, metrics
+    # Finish deferred work before the worker goes away
+    if executor._executor is not None:
+        executor._executor.shutdown(settings.BOTTICELLI_DRAIN_TIMEOUT)
+    # Keep its counts in the dyno's totals, without its gauges
+    if settings.BOTTICELLI_METRICS_DIR:
+        metrics.registry.retire(settings.BOTTICELLI_METRICS_DIR)